@@ -0,0 +1,82 @@
+import json
+import logging
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.types import InputFile
+
+from outbound import LIMITED_PREFIXES
+
+# Metod sinflari: API_TIMEOUTS da shu nomlar bilan alohida timeout beriladi
+METHOD_CLASSES = ('membership', 'upload', 'send', 'default')
+
+
+def parse_timeouts(spec):
+    """API_TIMEOUTS qiymatini o'qish: membership=10,upload=300 -> {'membership': 10.0, 'upload': 300.0}"""
+    timeouts = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = item.partition('=')
+        name = name.strip()
+        if name not in METHOD_CLASSES:
+            raise ValueError(f"API_TIMEOUTS: noma'lum metod sinfi '{name}' ({', '.join(METHOD_CLASSES)})")
+        timeouts[name] = float(value)
+    return timeouts
+
+
+def method_class(method):
+    """So'rov sinfi: a'zolik tekshiruvi, fayl yuklash, xabar yuborish yoki boshqa"""
+    name = type(method).__name__
+    if name == 'GetChatMember':
+        return 'membership'
+    if any(isinstance(value, InputFile) for value in method.__dict__.values()):
+        return 'upload'
+    if name.startswith(LIMITED_PREFIXES):
+        return 'send'
+    return 'default'
+
+
+def json_codec(name):
+    """(loads, dumps) juftligi: 'json' yoki 'orjson' (o'rnatilmagan bo'lsa - standart json)"""
+    if name == 'orjson':
+        try:
+            import orjson
+        except ImportError:
+            logging.warning("API_JSON=orjson, lekin orjson o'rnatilmagan - standart json ishlatiladi")
+        else:
+            # aiogram forma maydonlariga str kutadi, orjson esa bytes qaytaradi
+            return orjson.loads, lambda obj: orjson.dumps(obj).decode()
+    return json.loads, json.dumps
+
+
+# ============= BOT API SESSIYASI =============
+class TunedAiohttpSession(AiohttpSession):
+    """Ulanishlar puli, keep-alive, DNS kesh va metod sinfi bo'yicha timeoutlar sozlanadigan sessiya.
+
+    - limit - api.telegram.org ga bir vaqtdagi ulanishlar soni (0 - cheklanmagan);
+      undan oshgan so'rovlar bo'sh ulanishni kutadi, ya'ni reklama va a'zolik
+      tekshiruvlaridagi parallellik shu bilan chegaralanadi;
+    - keepalive_timeout - bo'sh ulanish necha soniya ochiq turadi (0 - har bir
+      so'rovdan keyin yopiladi, har safar yangi TCP/TLS handshake);
+    - dns_cache_ttl - DNS javobi necha soniya keshlanadi (0 - keshsiz);
+    - timeouts - METHOD_CLASSES bo'yicha timeout, berilmagan sinflarga - timeout.
+      Chaqiruvchi o'zi timeout bergan so'rovlar (getUpdates) o'zgarmaydi.
+    """
+
+    def __init__(self, limit=100, limit_per_host=0, keepalive_timeout=30, dns_cache_ttl=3600,
+                 timeout=60, timeouts=None, json_module='json', **kwargs):
+        json_loads, json_dumps = json_codec(json_module)
+        super().__init__(limit=limit, timeout=timeout, json_loads=json_loads, json_dumps=json_dumps, **kwargs)
+        self._connector_init.update(
+            limit_per_host=limit_per_host,
+            use_dns_cache=bool(dns_cache_ttl),
+            ttl_dns_cache=dns_cache_ttl or None,
+        )
+        if keepalive_timeout:
+            self._connector_init['keepalive_timeout'] = keepalive_timeout
+        else:
+            self._connector_init['force_close'] = True
+        self.timeouts = timeouts or {}
+
+    async def make_request(self, bot, method, timeout=None):
+        if timeout is None:
+            timeout = self.timeouts.get(method_class(method))
+        return await super().make_request(bot, method, timeout)
@@ -0,0 +1,666 @@
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from database import HOT_QUERIES, Database, _user_filter_conditions, _users_page_sql
+from webhook import build_webhook_app
+
+
+# ============= YORDAMCHI FUNKSIYALAR =============
+def percentile(values, p):
+    """Saralangan ro'yxatdan p-foizli qiymatni olish"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def report(name, latencies, elapsed, extra=''):
+    """Natijani bir qatorda chiqarish (millisekundlarda)"""
+    print(f"{name:<28} n={len(latencies):<7} "
+          f"p50={percentile(latencies, 50) * 1000:8.2f}ms "
+          f"p99={percentile(latencies, 99) * 1000:8.2f}ms "
+          f"rps={len(latencies) / elapsed:10.0f} {extra}")
+
+
+async def seed_database(path, users=1000, movies=1000):
+    """Benchmark uchun bazani foydalanuvchilar va kinolar bilan to'ldirish"""
+    await Database(path).close()
+    conn = sqlite3.connect(path)
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn.executemany(
+        'INSERT OR IGNORE INTO users (user_id, phone, full_name, username, joined_date) VALUES (?, ?, ?, ?, ?)',
+        ((i, f'+998{i:09d}', f'User {i}', f'user{i}', now) for i in range(1, users + 1))
+    )
+    conn.executemany(
+        'INSERT OR IGNORE INTO movies (code, title, file_id, added_date) VALUES (?, ?, ?, ?)',
+        ((str(i), f'Kino {i}', f'file_{i}', now) for i in range(1, movies + 1))
+    )
+    conn.commit()
+    conn.close()
+
+
+async def loop_lag_monitor(stop, lags, interval=0.001):
+    """Event loop kechikishini o'lchash (kutilgan va haqiqiy uyg'onish farqi)"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - started - interval)
+
+
+# ============= HANDLER KECHIKISHI (sync vs async DB) =============
+def slow_commits(connection, delay):
+    """Sekin diskni taqlid qilish: har bir COMMIT oldidan `delay` soniya kutish (fsync o'rniga).
+
+    Kutish COMMIT ni bajarayotgan oqimda bo'ladi: sync usulda - event loop'da,
+    Database da - yozuvchi oqimda. tmpfs/SSD dagi vaqtinchalik papkada fsync
+    deyarli bepul, shuning uchun bu kechikishsiz solishtirish asl muammoni
+    (sekin commit paytida barcha updatelarning to'xtab qolishi) ko'rsatmaydi.
+    """
+    if delay:
+        connection.set_trace_callback(lambda sql: sql.strip().upper() == 'COMMIT' and time.sleep(delay))
+    return connection
+
+
+class SlowCommitDatabase(Database):
+    """Barcha ulanishlarida COMMIT sekinlashtirilgan Database"""
+
+    def __init__(self, path, commit_delay=0.0, **kwargs):
+        self.commit_delay = commit_delay
+        super().__init__(path, **kwargs)
+
+    def _connect(self):
+        return slow_commits(super()._connect(), self.commit_delay)
+
+
+class SyncGate:
+    """Eski usul: sqlite3 so'rovlari to'g'ridan-to'g'ri event loop ichida"""
+
+    def __init__(self, path, commit_delay=0.0):
+        self.connection = slow_commits(sqlite3.connect(path), commit_delay)
+        self.cursor = self.connection.cursor()
+
+    async def handle(self, user_id, code, new_user):
+        cur = self.cursor
+        cur.execute('SELECT is_blocked FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        if new_user:
+            cur.execute('INSERT OR IGNORE INTO users (user_id, joined_date) VALUES (?, ?)', (user_id, 'now'))
+            self.connection.commit()
+        cur.execute('SELECT user_id FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        cur.execute('SELECT user_id, phone FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        cur.execute('SELECT code, title, file_id FROM movies WHERE code = ?', (code,)).fetchone()
+
+    async def close(self):
+        self.connection.close()
+
+
+class AsyncGate:
+    """Yangi usul: keshlangan user gate + DB oqimida await qilinadigan so'rovlar"""
+
+    def __init__(self, path, commit_delay=0.0):
+        self.db = SlowCommitDatabase(path, commit_delay)
+
+    async def handle(self, user_id, code, new_user):
+        db = self.db
+        gate = await db.get_user_gate(user_id)
+        if not gate['exists']:
+            await db.add_user(user_id)
+        await db.get_movie(code)
+
+    async def close(self):
+        await self.db.close()
+
+
+async def run_handler_load(gate, requests, concurrency, write_ratio, api_delay):
+    """Parallel handlerlarni ishga tushirib, har birining kechikishini yig'ish"""
+    latencies = []
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(loop_lag_monitor(stop, lags))
+    semaphore = asyncio.Semaphore(concurrency)
+    every = int(1 / write_ratio) if write_ratio else 0
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            new_user = bool(every) and i % every == 0
+            user_id = 10_000_000 + i if new_user else i % 1000 + 1
+            await gate.handle(user_id, str(i % 2000), new_user)
+            # Telegram API javobini taqlid qilish
+            await asyncio.sleep(api_delay)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    return latencies, elapsed, lags
+
+
+async def bench_handlers(args):
+    print(f"commit_delay={args.commit_delay * 1000:.1f}ms write_ratio={args.write_ratio}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, factory in (('sync sqlite3 (oldin)', SyncGate), ('async Database (keyin)', AsyncGate)):
+            path = os.path.join(tmp, f'{factory.__name__}.db')
+            await seed_database(path)
+            gate = factory(path, args.commit_delay)
+            latencies, elapsed, lags = await run_handler_load(
+                gate, args.requests, args.concurrency, args.write_ratio, args.api_delay
+            )
+            extra = f"loop_lag_max={max(lags, default=0) * 1000:.2f}ms"
+            if isinstance(gate, AsyncGate):
+                extra += f" user_cache_hit_rate={gate.db.user_cache.stats()['hit_rate']:.2f}"
+            await gate.close()
+            report(name, latencies, elapsed, extra)
+
+
+# ============= YOZISH O'TKAZUVCHANLIGI (add_user) =============
+async def bench_writes(args):
+    configs = (
+        ('legacy, commit har yozuvda', dict(profile='legacy', batch_window=0, batch_size=1)),
+        ('wal, commit har yozuvda', dict(profile='wal', batch_window=0, batch_size=1)),
+        ('wal + 5ms batching', dict(profile='wal', batch_window=0.005)),
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, options in configs:
+            db = Database(os.path.join(tmp, f'{len(name)}.db'), **options)
+            semaphore = asyncio.Semaphore(args.concurrency)
+            latencies = []
+
+            async def one(user_id):
+                async with semaphore:
+                    started = time.perf_counter()
+                    await db.add_user(user_id, full_name=f'User {user_id}', username=f'user{user_id}')
+                    latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(1, args.requests + 1)))
+            elapsed = time.perf_counter() - started
+            await db.close()
+            report(name, latencies, elapsed)
+
+
+# ============= KINO QIDIRISH (indeks vs SQL) =============
+async def bench_movies(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'movies.db')
+        await seed_database(path, users=0, movies=args.movies)
+        db = Database(path)
+        loop = asyncio.get_running_loop()
+        # Yarmi mavjud, yarmi noto'g'ri terilgan kodlar
+        codes = [str(i % args.movies + 1) if i % 2 else f'x{i}' for i in range(args.requests)]
+
+        def sql_get_movie(code):
+            return db.cursor.execute('SELECT code, title, file_id FROM movies WHERE code = ?', (code,)).fetchone()
+
+        latencies = []
+        started = time.perf_counter()
+        for code in codes:
+            t = time.perf_counter()
+            await loop.run_in_executor(db.executor, sql_get_movie, code)
+            latencies.append(time.perf_counter() - t)
+        report('SQL get_movie (oldin)', latencies, time.perf_counter() - started)
+
+        latencies = []
+        started = time.perf_counter()
+        for code in codes:
+            t = time.perf_counter()
+            await db.get_movie(code)
+            latencies.append(time.perf_counter() - t)
+        report('indeks get_movie (keyin)', latencies, time.perf_counter() - started,
+               f"movies={len(db.movie_index)}")
+        await db.close()
+
+
+# ============= QABUL QILUVCHILAR OQIMI (fetchall vs keyset) =============
+async def bench_recipients(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'users.db')
+        await seed_database(path, users=args.users, movies=0)
+        db = Database(path)
+
+        async def fetchall():
+            count = 0
+            for _ in await db.get_all_users():
+                count += 1
+            return count
+
+        async def stream():
+            count = 0
+            async for _ in db.iter_users(page_size=1000):
+                count += 1
+            return count
+
+        for name, consume in (('get_all_users (oldin)', fetchall), ('iter_users (keyin)', stream)):
+            tracemalloc.start()
+            started = time.perf_counter()
+            count = await consume()
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:<28} users={count:<9} time={elapsed:6.2f}s peak_memory={peak / 1024 / 1024:8.1f}MB")
+        await db.close()
+
+
+# ============= WEBHOOK QABUL QILISH TEZLIGI =============
+def make_update(update_id, user_id, text):
+    """Sintetik Telegram update (oddiy matnli xabar)"""
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'},
+            'text': text
+        }
+    }
+
+
+async def bench_webhook(args):
+    from aiohttp import ClientSession, web
+    from aiogram import Bot, Dispatcher
+
+    secret = 'benchmark-secret'
+    bot = Bot(token='123456:BENCHMARK')
+    dp = Dispatcher()
+    processed = 0
+    all_done = asyncio.Event()
+
+    @dp.message()
+    async def handler(message):
+        nonlocal processed
+        processed += 1
+        if processed == args.requests:
+            all_done.set()
+
+    app = build_webhook_app(dp, bot, '/webhook', secret)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', args.port)
+    await site.start()
+    url = f'http://127.0.0.1:{args.port}/webhook'
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    async with ClientSession() as session:
+        async with session.post(url, json=make_update(0, 1, 'x'), headers={'X-Telegram-Bot-Api-Secret-Token': 'bad'}) as r:
+            print(f"noto'g'ri secret token -> HTTP {r.status}")
+
+        async def post(i):
+            async with semaphore:
+                started = time.perf_counter()
+                async with session.post(url, json=make_update(i, i % 1000 + 1, str(i)),
+                                        headers={'X-Telegram-Bot-Api-Secret-Token': secret}) as response:
+                    await response.read()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(i) for i in range(1, args.requests + 1)))
+        accepted = time.perf_counter() - started
+        await asyncio.wait_for(all_done.wait(), 60)
+        total = time.perf_counter() - started
+
+    report('webhook javob (HTTP 200)', latencies, accepted)
+    print(f"{'qayta ishlangan updatelar':<28} n={processed:<7} updates/s={processed / total:10.0f}")
+    await runner.cleanup()
+
+
+# ============= FSM STORAGE (MemoryStorage vs SQLiteStorage) =============
+async def bench_fsm(args):
+    from aiogram.fsm.storage.base import StorageKey
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from fsm_storage import SQLiteStorage
+
+    async def measure(name, storage):
+        keys = [StorageKey(bot_id=1, chat_id=i, user_id=i) for i in range(1, 1001)]
+        get_latencies, set_latencies = [], []
+        started = time.perf_counter()
+        for i in range(args.requests):
+            key = keys[i % len(keys)]
+            t = time.perf_counter()
+            await storage.get_state(key)
+            await storage.get_data(key)
+            get_latencies.append(time.perf_counter() - t)
+            t = time.perf_counter()
+            await storage.set_state(key, f'AddMovie:step{i % 3}')
+            await storage.update_data(key, {'code': str(i)})
+            set_latencies.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - started
+        report(f'{name} get', get_latencies, elapsed)
+        report(f'{name} set', set_latencies, elapsed)
+
+    await measure('MemoryStorage', MemoryStorage())
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'fsm.db'))
+        await measure('SQLiteStorage (kesh)', SQLiteStorage(db))
+        await measure('SQLiteStorage (keshsiz)', SQLiteStorage(db, cache_size=0))
+        await db.close()
+
+
+# ============= STATISTIKA (COUNT(*) vs hisoblagichlar) =============
+async def bench_stats(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'stats.db')
+        await seed_database(path, users=args.users, movies=args.movies)
+        db = Database(path)
+        loop = asyncio.get_running_loop()
+        requests = max(1, args.requests // 100)
+
+        def count_statistics():
+            cur = db.cursor
+            return [cur.execute(query).fetchone()[0] for query in (
+                'SELECT COUNT(*) FROM users',
+                'SELECT COUNT(*) FROM users WHERE is_blocked = 0',
+                'SELECT COUNT(*) FROM users WHERE is_blocked = 1',
+                'SELECT COUNT(*) FROM movies',
+                'SELECT COUNT(*) FROM force_channels'
+            )]
+
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(requests):
+            t = time.perf_counter()
+            await loop.run_in_executor(db.executor, count_statistics)
+            latencies.append(time.perf_counter() - t)
+        report('COUNT(*) statistika (oldin)', latencies, time.perf_counter() - started)
+
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(requests):
+            t = time.perf_counter()
+            await db.get_statistics()
+            latencies.append(time.perf_counter() - t)
+        report('hisoblagichlar (keyin)', latencies, time.perf_counter() - started,
+               f"users={args.users} movies={args.movies}")
+        await db.close()
+
+
+# ============= FOYDALANUVCHILAR RO'YXATI (OFFSET vs keyset) =============
+async def bench_users(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'users.db')
+        await seed_database(path, users=args.users, movies=0)
+        conn = sqlite3.connect(path)
+        conn.execute('UPDATE users SET is_blocked = 1 WHERE user_id % 10 = 0')
+        conn.execute('UPDATE users SET phone = NULL WHERE user_id % 20 = 0')
+        conn.commit()
+        conn.close()
+        db = Database(path)
+        loop = asyncio.get_running_loop()
+        pages = max(1, args.requests // 50)
+
+        for label, filters in (('filtrsiz', {}), ('blocked', {'blocked': True}), ('nophone', {'has_phone': False})):
+            conditions, params = _user_filter_conditions(filters)
+            query = _users_page_sql(conditions, 'joined_date DESC, user_id DESC') + ' OFFSET ?'
+            # Ro'yxat o'rtasidan boshlab sahifalaymiz (OFFSET chuqur sahifalarda sekinlashadi)
+            start = await db.count_users(filters) // 2
+
+            def offset_page(offset):
+                return db.cursor.execute(query, (*params, 15, offset)).fetchall()
+
+            latencies = []
+            started = time.perf_counter()
+            for page in range(pages):
+                t = time.perf_counter()
+                await loop.run_in_executor(db.executor, offset_page, start + page * 15)
+                latencies.append(time.perf_counter() - t)
+            report(f'OFFSET {label}', latencies, time.perf_counter() - started)
+
+            rows = await loop.run_in_executor(db.executor, offset_page, start - 15)
+            latencies = []
+            started = time.perf_counter()
+            for page in range(pages):
+                t = time.perf_counter()
+                rows = await db.get_users_page(filters, after=(rows[-1][4], rows[-1][0]))
+                latencies.append(time.perf_counter() - t)
+            report(f'keyset {label}', latencies, time.perf_counter() - started, f"pages={pages} from={start}")
+        await db.close()
+
+
+# ============= KINO QIDIRUV (LIKE vs FTS5) =============
+async def bench_search(args):
+    import random
+    rng = random.Random(1)
+    # Sintetik lug'at: ~5000 ta bo'g'inli so'z (real nomlar kabi har xil)
+    syllables = [c + v for c in 'bdgkmnqrstyz' for v in 'aeiou']
+    vocabulary = list({''.join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(5000)})
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'search.db')
+        await seed_database(path, users=0, movies=0)
+        conn = sqlite3.connect(path)
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conn.executemany(
+            'INSERT INTO movies (code, title, file_id, added_date) VALUES (?, ?, ?, ?)',
+            ((str(i), ' '.join(rng.sample(vocabulary, 3)), f'file_{i}', now)
+             for i in range(1, args.movies + 1))
+        )
+        conn.commit()
+        titles = [title for (title,) in conn.execute('SELECT title FROM movies')]
+        conn.close()
+        db = Database(path)
+        loop = asyncio.get_running_loop()
+        requests = max(1, args.requests // 10)
+
+        def like_search(text):
+            return db.cursor.execute(
+                'SELECT code, title, file_id FROM movies WHERE title LIKE ? LIMIT 5', (f'%{text}%',)
+            ).fetchall()
+
+        async def measure(name, queries, search):
+            latencies = []
+            started = time.perf_counter()
+            for query in queries:
+                t = time.perf_counter()
+                await search(query)
+                latencies.append(time.perf_counter() - t)
+            report(name, latencies, time.perf_counter() - started)
+
+        words = [' '.join(rng.choice(titles).split()[:2]) for _ in range(requests)]
+        # Har bir so'zda bitta harf tushib qolgan
+        typos = [' '.join(word[:1] + word[2:] if len(word) > 3 else word for word in query.split())
+                 for query in words]
+        codes = [str(rng.randint(1, args.movies)) for _ in range(requests)]
+        code_typos = [code[::-1] if len(code) > 1 else code + '0' for code in codes]
+
+        await measure('LIKE %so\'z% (oldin)', words,
+                      lambda text: loop.run_in_executor(db.executor, like_search, text.split()[0]))
+        await measure('FTS5 so\'zlar', words, db.search_movies)
+        await measure('trigram (xato terilgan)', typos, db.search_movies)
+        await measure('kod (xato terilgan)', code_typos, db.search_movies)
+        print(f"movies={args.movies}")
+        await db.close()
+
+
+async def bench_import(args):
+    from catalog import parse_movies, write_movies
+    rows = ['code,title,file_id'] + [f'{i},Kino {i},file_{i}' for i in range(1, args.movies + 1)]
+    data = '\n'.join(rows).encode()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'import.db')
+        await seed_database(path, users=0, movies=0)
+        db = Database(path)
+
+        started = time.perf_counter()
+        movies, errors = parse_movies(data, 'csv')
+        parsed = time.perf_counter() - started
+
+        # Oldingi yo'l: har bir kino alohida add_movie (alohida yozuv) - qismida o'lchanadi
+        sample = movies[:min(len(movies), 5000)]
+        started = time.perf_counter()
+        for code, title, file_id, _ in sample:
+            await db.add_movie(f'old_{code}', title, file_id)
+        one_by_one = len(sample) / (time.perf_counter() - started)
+        print(f"{'add_movie birma-bir (oldin)':<28} {one_by_one:>10.0f} qator/s ({len(sample)} qator)")
+
+        started = time.perf_counter()
+        result = await db.import_movies(movies)
+        elapsed = time.perf_counter() - started
+        print(f"{'import_movies (executemany)':<28} {len(movies) / elapsed:>10.0f} qator/s "
+              f"({result['added']} qator, {elapsed:.2f} s, o'qish {parsed:.2f} s)")
+
+        started = time.perf_counter()
+        result = await db.import_movies(movies)
+        print(f"{'takroriy import (hammasi bor)':<28} {time.perf_counter() - started:>10.2f} s "
+              f"({len(result['duplicates'])} dublikat)")
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        with open(os.path.join(tmp, 'export.csv'), 'w', encoding='utf-8', newline='') as f:
+            count = await write_movies(db.iter_movies(), f, 'csv')
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{'eksport (CSV, oqim)':<28} {count / elapsed:>10.0f} qator/s "
+              f"(xotira cho'qqisi {peak / 1024 / 1024:.1f} MB)")
+        await db.close()
+
+
+# ============= METRIKALAR XARAJATI =============
+async def bench_metrics(args):
+    from aiogram import Bot, Dispatcher
+    from aiogram.types import Update
+    from metrics import Metrics, setup_metrics
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'metrics.db')
+        await seed_database(path, users=1000, movies=1000)
+        for name, enabled in (("o'chirilgan", False), ('yoqilgan', True)):
+            db = Database(path)
+            bot = Bot(token='123456:BENCHMARK')
+            dp = Dispatcher()
+
+            # handle_movie_code ning tez yo'li: user gate (kesh) + kino indeksi
+            @dp.message()
+            async def handler(message):
+                await db.get_user_gate(message.from_user.id)
+                await db.get_movie(message.text)
+
+            metrics = Metrics() if enabled else None
+            if metrics:
+                setup_metrics(metrics, dp, bot, db)
+            updates = [Update.model_validate(make_update(i, i % 1000 + 1, str(i % 2000)), context={'bot': bot})
+                       for i in range(args.requests)]
+            for update in updates[:100]:
+                await dp.feed_update(bot, update)
+
+            latencies = []
+            started = time.perf_counter()
+            for update in updates:
+                t = time.perf_counter()
+                await dp.feed_update(bot, update)
+                latencies.append(time.perf_counter() - t)
+            report(f'metrikalar {name}', latencies, time.perf_counter() - started)
+            await bot.session.close()
+            await db.close()
+
+    metrics = Metrics()
+    started = time.perf_counter()
+    for i in range(args.requests):
+        metrics.observe('handler', 'handler', 0.003)
+    print(f"{'Metrics.observe':<28} {(time.perf_counter() - started) / args.requests * 1e6:.2f} mks")
+
+
+# ============= BOT API SESSIYASI =============
+async def bench_api(args):
+    """sendMessage so'rovlari/soniya: ulanishlar puli, keep-alive va JSON kodlash bo'yicha.
+
+    So'rovlar alohida jarayondagi soxta Bot API'ga (loadtest.FakeBotAPI) boradi,
+    --api-delay - Telegram javob vaqtini taqlid qiladi.
+    """
+    from aiogram import Bot
+    from aiogram.client.telegram import TelegramAPIServer
+    from apisession import TunedAiohttpSession
+    from loadtest import FakeBotAPIProcess
+
+    api = FakeBotAPIProcess(port=args.port, delay=args.api_delay)
+    api.start()
+    variants = [(f'pul {size or "cheklanmagan"}', {'limit': size}) for size in (1, 10, 50, 100, 0)]
+    variants += [('pul 100, keep-alive yo\'q', {'limit': 100, 'keepalive_timeout': 0}),
+                 ('pul 100, orjson', {'limit': 100, 'json_module': 'orjson'})]
+    print(f"concurrency={args.concurrency} api_delay={args.api_delay * 1000:.1f}ms")
+    try:
+        for name, options in variants:
+            session = TunedAiohttpSession(api=TelegramAPIServer.from_base(api.base), **options)
+            bot = Bot(token='123456:BENCHMARK', session=session)
+            requests = iter(range(args.requests))
+            latencies = []
+
+            async def worker():
+                for i in requests:
+                    t = time.perf_counter()
+                    await bot.send_message(i % 1000 + 1, 'x')
+                    latencies.append(time.perf_counter() - t)
+
+            await asyncio.gather(*(bot.send_message(i + 1, 'x') for i in range(min(args.concurrency, 100))))
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            report(name, latencies, time.perf_counter() - started)
+            await session.close()
+    finally:
+        api.stop()
+
+
+# ============= SO'ROV REJALARI =============
+async def bench_plans(args):
+    """HOT_QUERIES rejalarini tekshirish: birortasi indekssiz bo'lsa 1 kodi bilan chiqadi (CI uchun)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'plans.db')
+        await seed_database(path)
+        db = Database(path)
+        print(f"sxema versiyasi {await db.get_schema_version()}, {len(HOT_QUERIES)} ta so'rov")
+        problems = await db.check_query_plans()
+        await db.close()
+
+    for name, plan in problems.items():
+        print(f"INDEKSSIZ {name}: {'; '.join(plan)}")
+    if problems:
+        sys.exit(1)
+    print("Barcha so'rovlar indeksdan foydalanadi")
+
+
+# ============= ISHGA TUSHIRISH =============
+BENCHMARKS = {
+    'handlers': bench_handlers,
+    'writes': bench_writes,
+    'movies': bench_movies,
+    'recipients': bench_recipients,
+    'webhook': bench_webhook,
+    'fsm': bench_fsm,
+    'stats': bench_stats,
+    'users': bench_users,
+    'search': bench_search,
+    'import': bench_import,
+    'metrics': bench_metrics,
+    'api': bench_api,
+    'plans': bench_plans,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kino bot benchmarklari")
+    parser.add_argument('name', choices=sorted(BENCHMARKS))
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    parser.add_argument('--api-delay', type=float, default=0.005)
+    parser.add_argument('--commit-delay', type=float, default=0.01,
+                        help="handlers: har bir COMMIT ga qo'shiladigan kechikish (sekin fsync), soniya")
+    parser.add_argument('--movies', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--port', type=int, default=8089)
+    args = parser.parse_args()
+    asyncio.run(BENCHMARKS[args.name](args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound, TelegramRetryAfter
+
+from outbound import BULK, current_lane
+from ratelimit import RateLimiter
+
+
+# ============= XATOLARNI TASNIFLASH =============
+# Foydalanuvchiga endi hech qachon yetib bo'lmasligini bildiruvchi xatolar (Forbidden)
+PERMANENT_ERRORS = {
+    'bot was blocked by the user': 'blocked',
+    'user is deactivated': 'deactivated',
+}
+
+# Telegram bu xatolarni vaqtincha ham qaytarishi mumkin: foydalanuvchi darhol
+# emas, ketma-ket bir necha reklamada takrorlangandagina ro'yxatdan chiqariladi
+SUSPECT_ERRORS = {
+    'chat not found': 'chat_not_found',
+    'user not found': 'user_not_found',
+    'bot can\'t initiate conversation': 'not_started',
+}
+
+
+def classify_error(error):
+    """Yuborish xatosini tasniflash: (holat, sabab kodi), vaqtinchalik bo'lsa None.
+
+    'unreachable' - foydalanuvchi darhol chiqariladi, 'undelivered' - uning
+    yetkazilmagan reklamalar hisoblagichi oshadi.
+    """
+    if isinstance(error, (TelegramForbiddenError, TelegramBadRequest, TelegramNotFound)):
+        text = str(error).lower()
+        for marker, reason in PERMANENT_ERRORS.items():
+            if marker in text:
+                return 'unreachable', reason
+        for marker, reason in SUSPECT_ERRORS.items():
+            if marker in text:
+                return 'undelivered', reason
+        if isinstance(error, TelegramForbiddenError):
+            return 'unreachable', 'forbidden'
+    return None
+
+
+# ============= REKLAMA VAZIFASI =============
+class BroadcastJob:
+    """Bitta reklama yuborish vazifasi (fon task sifatida ishlaydi).
+
+    Natijalar bazaga to'plamlar bilan yoziladi: har bir to'plam bilan birga
+    `cursor` ham saqlanadi - undan kichik yoki teng barcha qabul qiluvchilar
+    yakunlangan. Qayta ishga tushganda vazifa cursor'dan davom etadi va
+    natijasi yozilgan foydalanuvchilarni o'tkazib yuboradi. Faqat oxirgi
+    yozilmagan to'plam (flush_size tadan ko'p emas) qayta yuborilishi mumkin.
+    """
+
+    def __init__(self, engine, job_id, from_chat_id, message_id, recipients, total,
+                 success=0, failed=0, cursor=0, admin_chat_id=None, status_message_id=None):
+        self.engine = engine
+        self.job_id = job_id
+        self.from_chat_id = from_chat_id
+        self.message_id = message_id
+        self.recipients = recipients
+        self.admin_chat_id = admin_chat_id
+        self.status_message_id = status_message_id
+
+        self.total = total
+        self.success = success
+        self.failed = failed
+        # Shu ishga tushirishda yetib bo'lmaydigan deb belgilanganlar
+        self.unreachable = 0
+        self.cursor = cursor
+        # Davom ettirilgan vazifada tezlik faqat shu ishga tushirishdan hisoblanadi
+        self.resumed_from = success + failed
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        # running -> finished yoki failed (bazadagi status bilan bir xil)
+        self.status = 'running'
+        self.task = None
+
+        # Yozilishi kutilayotgan natijalar va cursor hisoblash uchun navbat
+        self._results = []
+        self._pending = deque()
+        self._completed = set()
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+    def progress(self):
+        """Joriy holat (admin status xabari shundan o'qiydi)"""
+        processed = self.success + self.failed
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        rate = (processed - self.resumed_from) / elapsed if elapsed > 0 else 0.0
+        return {
+            'job_id': self.job_id,
+            'total': self.total,
+            'success': self.success,
+            'failed': self.failed,
+            'unreachable': self.unreachable,
+            'processed': processed,
+            'rate': rate,
+            'eta': (self.total - processed) / rate if rate else None,
+            'done': self.done,
+            'status': self.status
+        }
+
+    async def run(self):
+        """Qabul qiluvchilarni navbatga qo'yib, cheklangan sonli yuboruvchilar bilan yuborish"""
+        # Shu task va undan yaratilgan yuboruvchilar so'rovlari eng past ustuvorlikda
+        current_lane.set(BULK)
+        queue = asyncio.Queue(maxsize=self.engine.concurrency * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.engine.concurrency)]
+        flusher = asyncio.create_task(self._flush_periodically())
+        try:
+            async for user_id in self.recipients:
+                self._pending.append(user_id)
+                await queue.put(user_id)
+            await queue.join()
+            await self.flush()
+            await self.engine.db.finish_broadcast_job(self.job_id)
+            self.status = 'finished'
+        except asyncio.CancelledError:
+            # stop(): vazifa bazada 'running' qoladi va keyingi ishga tushishda davom ettiriladi
+            raise
+        except Exception as e:
+            logging.error(f"Reklama #{self.job_id} xato bilan to'xtadi: {e}")
+            self.status = 'failed'
+            await self._fail()
+        finally:
+            flusher.cancel()
+            for worker in workers:
+                worker.cancel()
+            if self.status != 'running':
+                self.finished_at = time.monotonic()
+
+    async def _fail(self):
+        """Yozilmagan natijalarni saqlashga urinib, vazifani bazada 'failed' deb belgilash"""
+        try:
+            await self.flush()
+        except Exception as e:
+            logging.error(f"Reklama #{self.job_id} natijalarini yozib bo'lmadi: {e}")
+        try:
+            await self.engine.db.finish_broadcast_job(self.job_id, status='failed')
+        except Exception as e:
+            logging.error(f"Reklama #{self.job_id} holatini yozib bo'lmadi: {e}")
+
+    async def _worker(self, queue):
+        while True:
+            user_id = await queue.get()
+            try:
+                await self._deliver(user_id)
+            except Exception as e:
+                # Natijani yozishdagi xato (baza) yuboruvchini to'xtatmasin - aks holda
+                # navbat bo'shamaydi va run() queue.put da abadiy kutadi. Natijalar
+                # xotirada qoladi va keyingi flush'da qayta yoziladi
+                logging.error(f"Reklama #{self.job_id}: natijani yozishda xato: {e}")
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, user_id):
+        """Bitta foydalanuvchiga yuborish; RetryAfter bo'lsa barcha yuboruvchilar kutadi"""
+        while True:
+            await self.engine.limiter.acquire(user_id)
+            try:
+                await self.engine.bot.copy_message(
+                    chat_id=user_id, from_chat_id=self.from_chat_id, message_id=self.message_id
+                )
+            except TelegramRetryAfter as e:
+                logging.warning(f"Reklama: {e.retry_after} soniya kutish (RetryAfter)")
+                self.engine.limiter.pause(e.retry_after)
+                continue
+            except Exception as e:
+                self.failed += 1
+                classified = classify_error(e)
+                if classified:
+                    status, reason = classified
+                    if status == 'unreachable':
+                        # Foydalanuvchi keyingi reklamalardan chiqariladi
+                        self.unreachable += 1
+                    await self._record(user_id, status, reason)
+                else:
+                    await self._record(user_id, 'failed', str(e))
+                    logging.error(f"Reklama yuborishda xato: {e}")
+                return
+            self.success += 1
+            await self._record(user_id, 'sent', None)
+            return
+
+    async def _record(self, user_id, status, error):
+        self._results.append((self.job_id, user_id, status, error))
+        self._completed.add(user_id)
+        if len(self._results) >= self.engine.flush_size:
+            await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.engine.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Reklama #{self.job_id}: natijalarni yozishda xato: {e}")
+
+    async def flush(self):
+        """To'plangan natijalar va cursor'ni bitta tranzaksiyada bazaga yozish"""
+        async with self._flush_lock:
+            while self._pending and self._pending[0] in self._completed:
+                self.cursor = self._pending.popleft()
+                self._completed.discard(self.cursor)
+            # Yozish muvaffaqiyatsiz bo'lsa natijalar navbatda qoladi
+            results = self._results[:]
+            # Xatolari chegaraga yetib, shu to'plamda chiqarilganlar ham hisobga olinadi
+            self.unreachable += await self.engine.db.record_broadcast_progress(
+                self.job_id, results, self.cursor, self.success, self.failed, self.engine.unreachable_after
+            )
+            del self._results[:len(results)]
+
+
+# ============= REKLAMA DVIGATELI =============
+class BroadcastEngine:
+    """Reklama vazifalarini fon rejimida boshqarish.
+
+    Barcha vazifalar bitta RateLimiter'dan foydalanadi, shuning uchun bir vaqtda
+    ikkita reklama ham Telegram limitidan oshmaydi. unreachable_after - SUSPECT_ERRORS
+    xatosi ketma-ket necha marta takrorlansa foydalanuvchi ro'yxatdan chiqariladi.
+    """
+
+    def __init__(self, bot, db, rate=25, concurrency=20, per_chat_interval=1.0, flush_size=200, flush_interval=2.0,
+                 page_size=1000, unreachable_after=3):
+        self.bot = bot
+        self.db = db
+        self.limiter = RateLimiter(rate, per_chat_interval)
+        self.concurrency = concurrency
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.page_size = page_size
+        self.unreachable_after = unreachable_after
+        self.jobs = {}
+
+    def _launch(self, job):
+        job.task = asyncio.create_task(job.run())
+        self.jobs[job.job_id] = job
+        return job
+
+    async def start(self, from_chat_id, message_id, admin_chat_id=None, status_message_id=None):
+        """Yangi vazifani bazaga yozib, fon task sifatida ishga tushirish"""
+        total = await self.db.get_reachable_users()
+        job_id = await self.db.create_broadcast_job(from_chat_id, message_id, total, admin_chat_id, status_message_id)
+        recipients = self.db.iter_users(page_size=self.page_size)
+        return self._launch(BroadcastJob(
+            self, job_id, from_chat_id, message_id, recipients, total,
+            admin_chat_id=admin_chat_id, status_message_id=status_message_id
+        ))
+
+    async def resume(self):
+        """Bot qayta ishga tushganda tugallanmagan vazifalarni cursor'dan davom ettirish"""
+        jobs = []
+        for job_id, from_chat_id, message_id, total, success, failed, cursor, admin_chat_id, status_message_id \
+                in await self.db.get_unfinished_broadcast_jobs():
+            recipients = self.db.iter_broadcast_recipients(job_id, cursor, page_size=self.page_size)
+            logging.info(f"Reklama #{job_id} davom ettirilmoqda: {success + failed}/{total} dan")
+            jobs.append(self._launch(BroadcastJob(
+                self, job_id, from_chat_id, message_id, recipients, total,
+                success=success, failed=failed, cursor=cursor,
+                admin_chat_id=admin_chat_id, status_message_id=status_message_id
+            )))
+        return jobs
+
+    async def stop(self):
+        """Ishlayotgan vazifalarni to'xtatib, natijalarini bazaga yozish (keyin davom ettiriladi)"""
+        jobs = self.active_jobs()
+        for job in jobs:
+            job.task.cancel()
+        await asyncio.gather(*(job.task for job in jobs), return_exceptions=True)
+        for job in jobs:
+            await job.flush()
+
+    def active_jobs(self):
+        """Hali tugamagan vazifalar"""
+        return [job for job in self.jobs.values() if not job.done]
@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+# ============= LRU + TTL KESH =============
+class TTLCache:
+    """Hajmi cheklangan (LRU) va muddati tugaydigan (TTL) kesh.
+
+    Faqat event loop oqimidan ishlatiladi, shuning uchun qulf kerak emas.
+    `generation` har bir invalidatsiyada oshadi: so'rov boshlanishida olingan
+    qiymat bilan solishtirib, eskirgan natijani keshga yozmaslik mumkin.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Qiymatni olish (muddati o'tgan bo'lsa default)"""
+        item = self.data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            return default
+
+        value, expires = item
+        if expires < time.monotonic():
+            del self.data[key]
+            self.misses += 1
+            return default
+
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Qiymatni yozish (ttl berilmasa standart muddat)"""
+        self.data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def invalidate(self, key):
+        """Bitta kalitni keshdan o'chirish"""
+        self.data.pop(key, None)
+        self.generation += 1
+
+    def clear(self):
+        """Butun keshni tozalash"""
+        self.data.clear()
+        self.generation += 1
+
+    def stats(self):
+        """Kesh statistikasi"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self.data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
@@ -0,0 +1,168 @@
+"""Kinolar katalogini ommaviy import/eksport qilish (CSV yoki JSON).
+
+Bot orqali: admin /import buyrug'idan keyin faylni yuboradi, /export bilan
+katalogni fayl sifatida oladi. Buyruq qatoridan:
+
+    python catalog.py import movies.csv [--replace]
+    python catalog.py export movies.json
+
+Fayl ustunlari: code, title, file_id va ixtiyoriy added_date. JSON - shu
+kalitlarga ega obyektlar ro'yxati. Barcha qatorlar avval tekshiriladi, keyin
+bitta tranzaksiyada yoziladi. Bazada bor kodlar o'tkazib yuboriladi
+(--replace bilan - nomi va file_id yangilanadi) va hisobotda ko'rsatiladi.
+
+Buyruq qatoridan import qilingan kinolarni ishlab turgan bot
+MOVIE_INDEX_RELOAD_SECONDS oralig'ida (yoki qayta ishga tushirilganda) ko'radi.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+FIELDS = ('code', 'title', 'file_id', 'added_date')
+REQUIRED_FIELDS = ('code', 'title', 'file_id')
+MAX_CODE_LENGTH = 50
+# Bazadagi added_date formati (saralash va sahifalash kursori shunga tayanadi)
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+# ============= O'QISH VA TEKSHIRISH =============
+def detect_format(filename):
+    """Fayl nomidan formatni aniqlash ('csv' yoki 'json'), noma'lum bo'lsa None"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    return {'.csv': 'csv', '.json': 'json'}.get(extension)
+
+
+def _read_records(data, fmt):
+    """Fayl mazmunidan (qator raqami, yozuv) juftliklari"""
+    text = data.decode('utf-8-sig') if isinstance(data, bytes) else data
+    if fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(text, newline=''))
+        missing = [field for field in REQUIRED_FIELDS if field not in (reader.fieldnames or ())]
+        if missing:
+            raise ValueError(f"CSV sarlavhasida ustunlar yo'q: {', '.join(missing)}")
+        # 1-qator - sarlavha
+        return ((reader.line_num, record) for record in reader)
+
+    records = json.loads(text)
+    if not isinstance(records, list):
+        raise ValueError("JSON fayl kinolar ro'yxatidan iborat bo'lishi kerak")
+    return enumerate(records, 1)
+
+
+def _parse_date(value):
+    """added_date ni DATE_FORMAT ga keltirish; bo'sh bo'lsa None, noto'g'ri bo'lsa ValueError"""
+    if not value:
+        return None
+    return datetime.strptime(value, DATE_FORMAT).strftime(DATE_FORMAT)
+
+
+def parse_movies(data, fmt):
+    """Fayldagi kinolarni o'qish va tekshirish.
+
+    Qaytaradi: (movies, errors). movies - (code, title, file_id, added_date)
+    ro'yxati, errors - "qator N: sabab" ko'rinishidagi xabarlar. Fayl ichida
+    takrorlangan kod xato hisoblanadi, birinchisi olinadi. added_date
+    'YYYY-MM-DD HH:MM:SS' formatida bo'lishi kerak (bo'sh bo'lsa - import vaqti).
+    Fayl umuman o'qilmasa ValueError ko'tariladi.
+    """
+    try:
+        records = _read_records(data, fmt)
+        movies, errors, seen = [], [], {}
+        for number, record in records:
+            if not isinstance(record, dict):
+                errors.append(f"{number}: yozuv obyekt emas")
+                continue
+
+            values = {field: str(record.get(field) or '').strip() for field in FIELDS}
+            code = values['code']
+            if not code or not values['title'] or not values['file_id']:
+                empty = [field for field in REQUIRED_FIELDS if not values[field]]
+                errors.append(f"{number}: bo'sh maydon ({', '.join(empty)})")
+            elif len(code) > MAX_CODE_LENGTH or code.split() != [code]:
+                errors.append(f"{number}: noto'g'ri kod '{code[:MAX_CODE_LENGTH]}'")
+            elif code in seen:
+                errors.append(f"{number}: '{code}' kodi {seen[code]}-yozuvda ham bor")
+            else:
+                try:
+                    added_date = _parse_date(values['added_date'])
+                except ValueError:
+                    errors.append(f"{number}: noto'g'ri sana '{values['added_date'][:30]}' (YYYY-MM-DD HH:MM:SS)")
+                    continue
+                seen[code] = number
+                movies.append((code, values['title'], values['file_id'], added_date))
+        return movies, errors
+    except (UnicodeDecodeError, json.JSONDecodeError, csv.Error) as e:
+        raise ValueError(f"Faylni o'qib bo'lmadi: {e}")
+
+
+# ============= EKSPORT =============
+async def write_movies(movies, file, fmt):
+    """Kinolarni (async iterator) faylga oqim sifatida yozish; yozilganlar sonini qaytaradi.
+
+    file - matnli fayl obyekti. Butun katalog xotirada yig'ilmaydi.
+    """
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(file)
+        writer.writerow(FIELDS)
+        async for movie in movies:
+            writer.writerow(movie)
+            count += 1
+        return count
+
+    file.write('[')
+    async for movie in movies:
+        file.write(',\n' if count else '\n')
+        file.write(json.dumps(dict(zip(FIELDS, movie)), ensure_ascii=False))
+        count += 1
+    file.write('\n]\n' if count else ']\n')
+    return count
+
+
+# ============= BUYRUQ QATORI =============
+async def run(args):
+    from database import Database
+
+    db = Database(profile=os.getenv('DB_PROFILE', 'wal'))
+    try:
+        if args.command == 'import':
+            with open(args.file, 'rb') as f:
+                movies, errors = parse_movies(f.read(), args.format or detect_format(args.file))
+            for error in errors:
+                print(f"Xato - qator {error}")
+            result = await db.import_movies(movies, replace=args.replace)
+            print(f"Qo'shildi: {result['added']}, yangilandi: {result['updated']}, "
+                  f"bazada bor: {len(result['duplicates'])}, xato: {len(errors)}")
+        else:
+            with open(args.file, 'w', encoding='utf-8', newline='') as f:
+                count = await write_movies(db.iter_movies(), f, args.format or detect_format(args.file))
+            print(f"{count} ta kino {args.file} fayliga yozildi")
+    finally:
+        await db.close()
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Kinolar katalogini import/eksport qilish')
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('file')
+    parser.add_argument('--format', choices=['csv', 'json'], help="fayl kengaytmasidan aniqlanmasa")
+    parser.add_argument('--replace', action='store_true', help="bazada bor kinolarni yangilash")
+    args = parser.parse_args()
+    if not (args.format or detect_format(args.file)):
+        parser.error("format aniqlanmadi: .csv/.json kengaytma yoki --format kerak")
+
+    try:
+        asyncio.run(run(args))
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+
+
+if __name__ == "__main__":
+    main()
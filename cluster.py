@@ -0,0 +1,195 @@
+"""Botni bir nechta jarayonda ishga tushirish (webhook rejimi).
+
+Ishga tushirish: python cluster.py
+
+Asosiy jarayon webhook'ni qabul qiladi va har bir update'ni
+`user_id % CLUSTER_WORKERS` raqamli worker'ga yuboradi. Shunday qilib bitta
+foydalanuvchining update'lari doim bitta worker'da, kelgan tartibida qayta
+ishlanadi. Worker'lar main.py dagi handlerlardan foydalanadi va bitta SQLite
+bazani (WAL) baham ko'radi; FSM holatlari ham shu bazada saqlanadi.
+
+Jarayonlar orasidagi kesh farqlari:
+  - foydalanuvchi holati keshi har bir worker'da alohida, shuning uchun
+    admin bloklashi va majburiy kanallar ro'yxatidagi o'zgarishlar boshqa
+    worker'larga USER_CACHE_TTL ichida yetib boradi (cluster rejimida u 30
+    soniyadan oshmaydi);
+  - kinolar indeksi MOVIE_INDEX_RELOAD_SECONDS oralig'ida yangilanadi;
+  - tugallanmagan reklamalarni faqat 0-worker davom ettiradi;
+  - Telegram limiti butun bot uchun, shuning uchun umumiy OUTBOUND_RATE limiti
+    (lane ustuvorligi bilan) router jarayonida turadi va worker'lar tokenni
+    127.0.0.1:CLUSTER_GATE_PORT dan oladi. Reklama yuborayotgan worker bo'sh
+    tokenlarning hammasini ishlatadi, javoblar esa qaysi worker'da bo'lmasin
+    undan oldin o'tadi. Router javob bermasa worker OUTBOUND_RATE / CLUSTER_WORKERS
+    bilan davom etadi. Har bir chatga limit worker ichida - foydalanuvchi doim
+    bitta worker'ga tushadi. OUTBOUND_ENABLED=0 bo'lsa umumiy limit yo'q va
+    BROADCAST_RATE worker'lar soniga bo'linadi;
+  - metrikalar har bir worker'da alohida: i-worker METRICS_PORT + i portida
+    (/perf esa buyruqni qabul qilgan worker'nikini ko'rsatadi).
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import secrets
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+from outbound import add_gate_routes, make_gate
+
+
+# ============= UPDATE YO'NALTIRISH =============
+def extract_user_id(update):
+    """Update'dan foydalanuvchi (yoki chat) ID sini topish"""
+    for key, value in update.items():
+        if not isinstance(value, dict):
+            continue
+        if isinstance(value.get('from'), dict):
+            return value['from']['id']
+        if isinstance(value.get('chat'), dict):
+            return value['chat']['id']
+    return 0
+
+
+def build_router_app(queues, path='/webhook', secret_token=None):
+    """Update'larni worker navbatlariga taqsimlovchi aiohttp ilovasi"""
+    async def handle(request):
+        if secret_token and not secrets.compare_digest(
+                request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), secret_token):
+            return web.Response(status=401)
+
+        update = await request.json()
+        user_id = extract_user_id(update)
+        queues[user_id % len(queues)].put((user_id, update))
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    return app
+
+
+# ============= WORKER =============
+def worker_process(index, update_queue):
+    """Worker jarayoni: main.py handlerlarini yuklab, navbatdagi update'larni qayta ishlash"""
+    import main as bot_app
+    asyncio.run(run_worker(bot_app, index, update_queue))
+
+
+async def run_worker(bot_app, index, update_queue):
+    await bot_app.on_startup(resume_broadcasts=index == 0,
+                             metrics_port=bot_app.METRICS_PORT + index if bot_app.METRICS_PORT else 0)
+    logging.info(f"Worker #{index} ishga tushdi")
+
+    loop = asyncio.get_running_loop()
+    # user_id -> shu foydalanuvchining oxirgi update task'i (tartibni saqlash uchun)
+    chains = {}
+
+    async def process(previous, update):
+        if previous is not None:
+            await asyncio.wait({previous})
+        try:
+            await bot_app.dp.feed_raw_update(bot_app.bot, update)
+        except Exception as e:
+            logging.error(f"Worker #{index}: update qayta ishlashda xato: {e}")
+
+    def forget(user_id, task):
+        if chains.get(user_id) is task:
+            del chains[user_id]
+
+    try:
+        while True:
+            item = await loop.run_in_executor(None, update_queue.get)
+            if item is None:
+                break
+            user_id, update = item
+            task = asyncio.create_task(process(chains.get(user_id), update))
+            chains[user_id] = task
+            task.add_done_callback(lambda t, uid=user_id: forget(uid, t))
+    finally:
+        await asyncio.gather(*chains.values(), return_exceptions=True)
+        await bot_app.on_shutdown()
+        await bot_app.bot.session.close()
+
+
+# ============= ISHGA TUSHIRISH =============
+async def start_gate_server(rate, port):
+    """Worker'lar uchun umumiy chiquvchi so'rovlar limiti (faqat 127.0.0.1 da)"""
+    app = web.Application()
+    add_gate_routes(app, make_gate(rate))
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner
+
+
+async def run_router(queues, host, port, path, url, secret_token, token, gate_rate=None, gate_port=None):
+    gate_runner = await start_gate_server(gate_rate, gate_port) if gate_rate else None
+    app = build_router_app(queues, path, secret_token)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Cluster: {len(queues)} ta worker, webhook http://{host}:{port}{path}")
+
+    if url:
+        from aiogram import Bot
+        bot = Bot(token=token)
+        await bot.set_webhook(f"{url.rstrip('/')}{path}", secret_token=secret_token or None)
+        await bot.session.close()
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        if gate_runner:
+            await gate_runner.cleanup()
+        await runner.cleanup()
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    # Worker'lar uchun majburiy sozlamalar (bolalar jarayoni env'ni meros oladi)
+    os.environ['FSM_STORAGE'] = 'sqlite'
+    if int(os.getenv('MOVIE_INDEX_RELOAD_SECONDS', '0')) <= 0:
+        os.environ['MOVIE_INDEX_RELOAD_SECONDS'] = '30'
+    os.environ['USER_CACHE_TTL'] = str(min(int(os.getenv('USER_CACHE_TTL', '300')), 30))
+
+    workers = int(os.getenv('CLUSTER_WORKERS', '4'))
+    os.environ['CLUSTER_WORKERS'] = str(workers)
+    # Umumiy limit router'da - worker'lar undan token oladi (limitlar bo'linmaydi)
+    gate_rate = float(os.getenv('OUTBOUND_RATE', '30')) if os.getenv('OUTBOUND_ENABLED', '1') == '1' else None
+    gate_port = int(os.getenv('CLUSTER_GATE_PORT', '8091'))
+    if gate_rate:
+        os.environ['OUTBOUND_GATE_URL'] = f'http://127.0.0.1:{gate_port}/outbound'
+    else:
+        os.environ['BROADCAST_RATE'] = str(float(os.getenv('BROADCAST_RATE', '25')) / workers)
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue() for _ in range(workers)]
+    processes = [context.Process(target=worker_process, args=(i, q), name=f'bot-worker-{i}')
+                 for i, q in enumerate(queues)]
+    for process in processes:
+        process.start()
+
+    try:
+        asyncio.run(run_router(
+            queues,
+            host=os.getenv('WEBHOOK_HOST', '0.0.0.0'),
+            port=int(os.getenv('WEBHOOK_PORT', '8080')),
+            path=os.getenv('WEBHOOK_PATH', '/webhook'),
+            url=os.getenv('WEBHOOK_URL', ''),
+            secret_token=os.getenv('WEBHOOK_SECRET', ''),
+            token=os.getenv('BOT_TOKEN'),
+            gate_rate=gate_rate,
+            gate_port=gate_port
+        ))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for q in queues:
+            q.put(None)
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
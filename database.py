@@ -1,6 +1,541 @@
+import asyncio
+import functools
+import logging
+import queue
+import re
 import sqlite3
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from cache import TTLCache
+
+# ============= SAQLASH PROFILLARI =============
+# Durability (ishonchlilik) kafolatlari:
+#   legacy - sqlite3 standarti (rollback journal, synchronous=FULL). Har bir commit
+#            diskka fsync qilinadi; elektr o'chsa ham tasdiqlangan yozuv yo'qolmaydi.
+#   wal    - WAL rejimi, synchronous=NORMAL. Bot jarayoni qulasa ham tasdiqlangan
+#            yozuvlar saqlanadi; faqat OS qulashi yoki elektr uzilishida oxirgi
+#            bir necha tranzaksiya yo'qolishi mumkin (baza buzilmaydi).
+#   safe   - WAL rejimi, synchronous=FULL. Har commit'da WAL fsync qilinadi.
+# Har uchala profilda ham yozish metodi faqat tranzaksiya COMMIT bo'lgandan keyin
+# qaytadi, ya'ni `await db.add_user(...)` tugasa, yozuv boshqa o'quvchilarga ko'rinadi.
+STORAGE_PROFILES = {
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'busy_timeout': 5000,
+    },
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,           # ~64 MB sahifa keshi
+        'mmap_size': 268435456,         # 256 MB
+        'busy_timeout': 5000,
+    },
+    'safe': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'busy_timeout': 5000,
+    },
+}
+
+# ============= HISOBLAGICHLAR =============
+# movies jadvalidagi har bir INSERT/UPDATE/DELETE da oshadigan versiya (COUNTERS ga
+# kirmaydi - reconcile_counters uni qayta hisoblamaydi)
+MOVIES_VERSION_QUERY = "SELECT value FROM counters WHERE name = 'movies_version'"
+
+# counters jadvalidagi hisoblagichlar va ularning haqiqiy qiymatini hisoblovchi so'rovlar.
+# Qiymatlar triggerlar orqali o'sha tranzaksiyaning o'zida yangilanadi, shuning uchun
+# statistika jadval hajmidan qat'i nazar bitta qatorni o'qish bilan olinadi.
+COUNTERS = {
+    'total_users': 'SELECT COUNT(*) FROM users',
+    'blocked_users': 'SELECT COUNT(*) FROM users WHERE is_blocked = 1',
+    'total_movies': 'SELECT COUNT(*) FROM movies',
+    'total_channels': 'SELECT COUNT(*) FROM force_channels',
+}
+
+COUNTER_TRIGGERS = {
+    'trg_users_insert_counters': '''
+        AFTER INSERT ON users BEGIN
+            UPDATE counters SET value = value + 1 WHERE name = 'total_users';
+            UPDATE counters SET value = value + 1 WHERE name = 'blocked_users' AND NEW.is_blocked = 1;
+        END''',
+    'trg_users_delete_counters': '''
+        AFTER DELETE ON users BEGIN
+            UPDATE counters SET value = value - 1 WHERE name = 'total_users';
+            UPDATE counters SET value = value - 1 WHERE name = 'blocked_users' AND OLD.is_blocked = 1;
+        END''',
+    'trg_users_block_counters': '''
+        AFTER UPDATE OF is_blocked ON users WHEN (OLD.is_blocked = 1) IS NOT (NEW.is_blocked = 1) BEGIN
+            UPDATE counters SET value = value + (NEW.is_blocked = 1) - (OLD.is_blocked = 1)
+            WHERE name = 'blocked_users';
+        END''',
+    'trg_movies_insert_counters': '''
+        AFTER INSERT ON movies BEGIN
+            UPDATE counters SET value = value + 1 WHERE name = 'total_movies';
+        END''',
+    'trg_movies_delete_counters': '''
+        AFTER DELETE ON movies BEGIN
+            UPDATE counters SET value = value - 1 WHERE name = 'total_movies';
+        END''',
+    'trg_channels_insert_counters': '''
+        AFTER INSERT ON force_channels BEGIN
+            UPDATE counters SET value = value + 1 WHERE name = 'total_channels';
+        END''',
+    'trg_channels_delete_counters': '''
+        AFTER DELETE ON force_channels BEGIN
+            UPDATE counters SET value = value - 1 WHERE name = 'total_channels';
+        END''',
+}
+
+
+# ============= SXEMA MIGRATSIYALARI =============
+# Sxema versiyasi bazaning o'zida (PRAGMA user_version) saqlanadi. Ishga tushishda
+# faqat hali qo'llanmagan migratsiyalar bajariladi, har biri o'z tranzaksiyasida.
+# Migratsiyalar idempotent yoziladi: versiyasi 0 bo'lgan, lekin jadvallari allaqachon
+# mavjud eski bazalarda ham xatosiz ishlaydi. Yangi o'zgarish - ro'yxat oxiriga
+# yangi funksiya qo'shiladi, mavjudlari o'zgartirilmaydi.
+def _add_column(cursor, table, column, definition):
+    """Ustun yo'q bo'lsa qo'shish"""
+    columns = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _migration_base_tables(cursor):
+    """1: asosiy jadvallar"""
+    # Foydalanuvchilar jadvali
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            phone TEXT,
+            full_name TEXT,
+            username TEXT,
+            joined_date TEXT,
+            is_blocked INTEGER DEFAULT 0,
+            is_admin INTEGER DEFAULT 0
+        )
+    ''')
+
+    # Kinolar jadvali
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS movies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT UNIQUE,
+            title TEXT,
+            file_id TEXT,
+            added_date TEXT
+        )
+    ''')
+
+    # Majburiy kanallar jadvali
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS force_channels (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id TEXT UNIQUE,
+            channel_username TEXT,
+            added_date TEXT
+        )
+    ''')
+
+    # Admin sessiyalar jadvali
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS admin_sessions (
+            user_id INTEGER PRIMARY KEY,
+            is_authenticated INTEGER DEFAULT 0
+        )
+    ''')
+
+
+def _migration_fsm_and_broadcasts(cursor):
+    """2: FSM holatlari, reklama vazifalari va yetkazib berish ustunlari"""
+    _add_column(cursor, 'users', 'is_reachable', 'INTEGER DEFAULT 1')
+    _add_column(cursor, 'users', 'last_delivery_error', 'TEXT')
+
+    # FSM holatlari jadvali (SQLiteStorage uchun)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at REAL
+        )
+    ''')
+
+    # Reklama vazifalari jadvali
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_chat_id INTEGER,
+            message_id INTEGER,
+            status TEXT DEFAULT 'running',
+            total INTEGER DEFAULT 0,
+            success INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            cursor INTEGER DEFAULT 0,
+            admin_chat_id INTEGER,
+            status_message_id INTEGER,
+            created_date TEXT,
+            finished_date TEXT
+        )
+    ''')
+
+    # Reklama yetkazilishi jurnali (har bir qabul qiluvchi uchun)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+            job_id INTEGER,
+            user_id INTEGER,
+            status TEXT,
+            error TEXT,
+            PRIMARY KEY (job_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _migration_counters(cursor):
+    """3: statistika hisoblagichlari (jadval, triggerlar va boshlang'ich qiymatlar)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for name, body in COUNTER_TRIGGERS.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+    existing = {row[0] for row in cursor.execute('SELECT name FROM counters')}
+    for name, query in COUNTERS.items():
+        if name not in existing:
+            cursor.execute(f'INSERT INTO counters (name, value) VALUES (?, ({query}))', (name,))
+
+
+def _migration_indexes(cursor):
+    """4: tez-tez ishlatiladigan so'rovlar uchun indekslar (HOT_QUERIES ga qarang)"""
+    # Faol foydalanuvchilarni user_id tartibida sahifalash va sanash
+    cursor.execute('DROP INDEX IF EXISTS idx_users_is_blocked')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_active ON users (is_blocked, is_reachable, user_id)')
+    # So'nggi foydalanuvchilar va kinolar ro'yxati
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_joined_date ON users (joined_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_movies_added_date ON movies (added_date)')
+    # Muddati o'tgan FSM holatlarini tozalash
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states (updated_at)')
+    # Tugallanmagan reklamalarni topish
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs (status)')
+
+
+def _migration_user_browser_indexes(cursor):
+    """5: admin foydalanuvchilar ro'yxatining filtrlari uchun indekslar"""
+    # Bloklangan/faol foydalanuvchilar qo'shilgan sana tartibida
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_blocked_joined ON users (is_blocked, joined_date)')
+    # Telefon raqamini yubormaganlar (kam qism - qisman indeks)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_no_phone ON users (joined_date) WHERE phone IS NULL')
+    # Username prefiksi bo'yicha qidirish (katta-kichik harf farqisiz)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users (username COLLATE NOCASE)')
+
+
+def _migration_movie_search(cursor):
+    """6: kinolar nomi bo'yicha qidiruv (FTS5), movies jadvali bilan triggerlar orqali sinxron"""
+    for table, tokenizer in (('movies_fts', 'unicode61 remove_diacritics 2'), ('movies_trigram', 'trigram')):
+        try:
+            cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+                    title, content='movies', content_rowid='id', tokenize='{tokenizer}'
+                )
+            ''')
+        except sqlite3.OperationalError:
+            # trigram tokenizer SQLite 3.34+ da bor; eski versiyada xato terilgan nomlar qidirilmaydi
+            if tokenizer != 'trigram':
+                raise
+            continue
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_insert AFTER INSERT ON movies BEGIN
+                INSERT INTO {table} (rowid, title) VALUES (NEW.id, NEW.title);
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_delete AFTER DELETE ON movies BEGIN
+                INSERT INTO {table} ({table}, rowid, title) VALUES ('delete', OLD.id, OLD.title);
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_update AFTER UPDATE OF title ON movies BEGIN
+                INSERT INTO {table} ({table}, rowid, title) VALUES ('delete', OLD.id, OLD.title);
+                INSERT INTO {table} (rowid, title) VALUES (NEW.id, NEW.title);
+            END
+        ''')
+        # Mavjud kinolarni indeksga qo'shish
+        cursor.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+
+
+def _migration_delivery_failures(cursor):
+    """8: ketma-ket yetkazilmagan reklamalar hisoblagichi ('chat not found' kabi xatolar)"""
+    _add_column(cursor, 'users', 'delivery_failures', 'INTEGER DEFAULT 0')
+
+
+def _migration_movies_version(cursor):
+    """7: movies jadvalining o'zgarishlar hisoblagichi (boshqa jarayonlar kinolar indeksini yangilashi uchun)"""
+    cursor.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('movies_version', 0)")
+    for name, event in (('insert', 'INSERT'), ('delete', 'DELETE'), ('update', 'UPDATE OF code, title, file_id')):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_movies_{name}_version AFTER {event} ON movies BEGIN
+                UPDATE counters SET value = value + 1 WHERE name = 'movies_version';
+            END
+        ''')
+
+
+# Tartib muhim: i-element bazani i+1 versiyaga o'tkazadi
+MIGRATIONS = [
+    _migration_base_tables,
+    _migration_fsm_and_broadcasts,
+    _migration_counters,
+    _migration_indexes,
+    _migration_user_browser_indexes,
+    _migration_movie_search,
+    _migration_movies_version,
+    _migration_delivery_failures,
+]
+
+# ============= FOYDALANUVCHI FILTRLARI =============
+USERS_PAGE_COLUMNS = 'SELECT user_id, full_name, username, phone, joined_date, is_blocked FROM users'
+
+
+def _user_filter_conditions(filters):
+    """Filtrlar lug'atidan WHERE shartlari va parametrlari.
+
+    Kalitlar: blocked (bool), has_phone (bool), joined_from / joined_to
+    ('YYYY-MM-DD HH:MM:SS', ikkalasi ham kiradi), username_prefix (str).
+    """
+    conditions, params = [], []
+    if filters.get('blocked') is not None:
+        conditions.append('is_blocked = ?')
+        params.append(1 if filters['blocked'] else 0)
+    if filters.get('has_phone') is not None:
+        conditions.append('phone IS NOT NULL' if filters['has_phone'] else 'phone IS NULL')
+    if filters.get('joined_from'):
+        conditions.append('joined_date >= ?')
+        params.append(filters['joined_from'])
+    if filters.get('joined_to'):
+        conditions.append('joined_date <= ?')
+        params.append(filters['joined_to'])
+    if filters.get('username_prefix'):
+        # LIKE 'abc%' o'rniga indeksdan foydalanadigan oraliq: 'abc' <= username < 'abd'.
+        # Mos kelganlar kam bo'lgani uchun ular sana bo'yicha xotirada saralanadi
+        prefix = filters['username_prefix'].lower()
+        conditions.append('username >= ? COLLATE NOCASE AND username < ? COLLATE NOCASE')
+        params += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+    return conditions, params
+
+
+def _users_page_sql(conditions, order):
+    """Foydalanuvchilar sahifasi uchun SQL (oxirgi parametr - LIMIT)"""
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f'{USERS_PAGE_COLUMNS}{where} ORDER BY {order} LIMIT ?'
+
+
+# get_users_page so'rov shakllari: nom -> (kursor shartlari, tartib, HOT_QUERIES uchun namuna parametrlar).
+# Keyset sahifa get_movies_page dagidek ikki qismdan: kursor bilan bir xil sanalilar, keyin qolganlari
+USERS_PAGE_SHAPES = {
+    'first': ([], 'joined_date DESC, user_id DESC', ()),
+    'after_same_date': (['joined_date = ?', 'user_id < ?'], 'user_id DESC', ('2024-06-01 00:00:00', 0)),
+    'after_older': (['joined_date < ?'], 'joined_date DESC, user_id DESC', ('2024-06-01 00:00:00',)),
+    'before_same_date': (['joined_date = ?', 'user_id > ?'], 'user_id', ('2024-06-01 00:00:00', 0)),
+    'before_newer': (['joined_date > ?'], 'joined_date, user_id', ('2024-06-01 00:00:00',)),
+}
+
+# Admin ro'yxatidagi filtrlar (HOT_QUERIES da har biri USERS_PAGE_SHAPES bilan tekshiriladi)
+USER_FILTER_SAMPLES = {
+    'all': {},
+    'blocked': {'blocked': True},
+    'no_phone': {'has_phone': False},
+    'joined_range': {'joined_from': '2024-01-01 00:00:00', 'joined_to': '2024-12-31 23:59:59'},
+    'username_prefix': {'username_prefix': 'ali'},
+}
+
+
+def _users_page_queries():
+    """HOT_QUERIES uchun get_users_page ning barcha filtr x shakl so'rovlari"""
+    queries = {}
+    for filter_name, filters in USER_FILTER_SAMPLES.items():
+        conditions, params = _user_filter_conditions(filters)
+        for shape, (extra_conditions, order, extra_params) in USERS_PAGE_SHAPES.items():
+            queries[f'users_page_{filter_name}_{shape}'] = (
+                _users_page_sql(conditions + extra_conditions, order), (*params, *extra_params, 15)
+            )
+    return queries
+
+
+# ============= KINO QIDIRUV =============
+CODE_ALPHABET = string.digits + string.ascii_letters
+
+
+def _code_edits(code):
+    """Koddan bitta tahrir (o'chirish, joy almashtirish, almashtirish, qo'shish) bilan farq qiladigan kodlar"""
+    splits = [(code[:i], code[i:]) for i in range(len(code) + 1)]
+    for left, right in splits:
+        if right:
+            yield left + right[1:]
+        if len(right) > 1:
+            yield left + right[1] + right[0] + right[2:]
+    for left, right in splits:
+        for char in CODE_ALPHABET:
+            if right:
+                yield left + char + right[1:]
+            yield left + char + right
+
+
+def _fts_words(text):
+    """Qidiruv matnidan so'zlar (FTS5 sintaksisiga tushmasligi uchun faqat harf va raqamlar)"""
+    return re.findall(r'\w+', text.lower())
+
+
+def _trigrams(words):
+    """So'zlardagi barcha 3 harfli bo'laklar"""
+    return {word[i:i + 3] for word in words for i in range(len(word) - 2)}
+
+
+def looks_like_title(text):
+    """Matn kino nomiga o'xshaydimi: kamida 3 belgi va hech bo'lmasa bitta harf.
+
+    Raqamlar va qisqa matnlar xato terilgan kod deb hisoblanadi - ular uchun
+    nom bo'yicha (FTS/trigram) qidiruv bazaga keraksiz so'rov bo'ladi.
+    """
+    return len(text) >= 3 and any(char.isalpha() for char in text)
+
+
+# Tez-tez bajariladigan so'rovlar. check_query_plans() har biri indeksdan
+# foydalanishini (to'liq jadval SCAN qilmasligini) EXPLAIN QUERY PLAN bilan tekshiradi.
+HOT_QUERIES = {
+    'active_users_page': ('''
+        SELECT user_id FROM users
+        WHERE is_blocked = 0 AND is_reachable = 1 AND user_id > ?
+        ORDER BY user_id LIMIT ?
+    ''', (0, 1000)),
+    'reachable_users_count': ('''
+        SELECT COUNT(*) FROM users WHERE is_blocked = 0 AND is_reachable = 1
+    ''', ()),
+    'last_users': ('''
+        SELECT user_id, full_name, username, phone, joined_date, is_blocked
+        FROM users
+        ORDER BY joined_date DESC
+        LIMIT ?
+    ''', (15,)),
+    'all_movies': ('''
+        SELECT code, title, added_date FROM movies ORDER BY added_date DESC
+    ''', ()),
+    'movies_first_page': ('''
+        SELECT id, code, title, added_date FROM movies
+        ORDER BY added_date DESC, id DESC LIMIT ?
+    ''', (20,)),
+    # Keyset sahifa ikki qismdan: avval kursor bilan bir xil sanali qolgan kinolar, keyin
+    # undan eski (yoki yangi) sanalilar. (added_date, id) < (?, ?) ko'rinishi bir xil
+    # sanali minglab kinolarda (import) sahifalar sonicha sekinlashadi
+    'movies_after_same_date': ('''
+        SELECT id, code, title, added_date FROM movies
+        WHERE added_date = ? AND id < ?
+        ORDER BY id DESC LIMIT ?
+    ''', ('', 0, 20)),
+    'movies_after_older': ('''
+        SELECT id, code, title, added_date FROM movies
+        WHERE added_date < ?
+        ORDER BY added_date DESC, id DESC LIMIT ?
+    ''', ('', 20)),
+    'movies_before_same_date': ('''
+        SELECT id, code, title, added_date FROM movies
+        WHERE added_date = ? AND id > ?
+        ORDER BY id LIMIT ?
+    ''', ('', 0, 20)),
+    'movies_before_newer': ('''
+        SELECT id, code, title, added_date FROM movies
+        WHERE added_date > ?
+        ORDER BY added_date, id LIMIT ?
+    ''', ('', 20)),
+    **_users_page_queries(),
+    'purge_fsm_states': ('''
+        DELETE FROM fsm_states WHERE updated_at < ?
+    ''', (0,)),
+    'unfinished_broadcast_jobs': ('''
+        SELECT id, from_chat_id, message_id, total, success, failed, cursor, admin_chat_id, status_message_id
+        FROM broadcast_jobs WHERE status = 'running' ORDER BY id
+    ''', ()),
+}
+
+
+# Indeksdan olingan kichik natijani xotirada saralashi kutilgan so'rovlar: username oralig'i
+# joined_date tartibini bera olmaydi, lekin saralanadigan qatorlar faqat prefiksga mos kelganlar.
+# Ular uchun ham to'liq SCAN taqiqlangan
+SORTED_IN_MEMORY = {f'users_page_username_prefix_{shape}' for shape in USERS_PAGE_SHAPES}
+
+
+def run_in_db_thread(func):
+    """Sinxron o'qish metodini o'quvchi oqimlar pulida bajaradigan awaitable metodga aylantirish.
+
+    Har bir oqim o'zining sqlite3 ulanishiga ega, shuning uchun so'rovlar event
+    loop'ni to'xtatib qo'ymaydi va bir-biriga xalaqit bermaydi.
+    """
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, self, *args, **kwargs))
+    return wrapper
+
+
+def run_in_writer(func):
+    """Yozish metodini yagona yozuvchi oqim navbatiga qo'yish.
+
+    Bir necha millisekund ichida kelgan yozuvlar bitta tranzaksiyaga birlashtiriladi.
+    Metod ichida commit qilinmaydi - COMMIT yozuvchi oqimning o'zida bajariladi.
+    """
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.write_queue.put((func, args, kwargs, loop, future))
+        return await future
+    return wrapper
+
+
+def invalidates_user(func):
+    """Yozuv tugagach (COMMIT'dan keyin) foydalanuvchi holati keshini tozalash"""
+    @functools.wraps(func)
+    async def wrapper(self, user_id, *args, **kwargs):
+        try:
+            return await func(self, user_id, *args, **kwargs)
+        finally:
+            self.user_cache.invalidate(user_id)
+    return wrapper
+
+
+def _notify_futures(results):
+    """(loop, future, result, error) natijalarini o'z event loop'iga yuborish.
+
+    To'xtatish paytida loop yopilgan bo'lishi mumkin - bunda natijani kutadigan
+    hech kim qolmagan, yozuvchi oqim esa ishlashda davom etadi.
+    """
+    for loop, future, result, error in results:
+        try:
+            loop.call_soon_threadsafe(_resolve_future, future, result, error)
+        except RuntimeError:
+            pass
+        except Exception:
+            logging.exception("Yozuvchi oqim: natijani event loop'ga yuborib bo'lmadi")
+
+
+def _resolve_future(future, result, error):
+    """Yozuvchi oqim natijasini event loop ichida future'ga yozish"""
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
 # database.py fayliga qo'shing (add_user funksiyasidan keyin):
 def get_admin_users(self):
     """Admin sifatida ro'yxatdan o'tgan foydalanuvchilarni olish"""
@@ -8,57 +543,191 @@ def get_admin_users(self):
         SELECT user_id FROM admin_sessions WHERE is_authenticated = 1
     ''').fetchall()
 class Database:
-    def __init__(self, db_file='cinema_bot.db'):
-        self.connection = sqlite3.connect(db_file, check_same_thread=False)
-        self.cursor = self.connection.cursor()
-        self.create_tables()
+    def __init__(self, db_file='cinema_bot.db', profile='wal', batch_window=0.005, batch_size=500, readers=2,
+                 user_cache_size=100000, user_cache_ttl=300):
+        self.db_file = db_file
+        # Profil nomi yoki PRAGMA qiymatlari lug'ati
+        if isinstance(profile, str):
+            profile = STORAGE_PROFILES[profile]
+        self.profile = dict(STORAGE_PROFILES['wal'], **profile)
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        # Foydalanuvchi holati keshi: user_id -> get_user_gate natijasi
+        self.user_cache = TTLCache(maxsize=user_cache_size, ttl=user_cache_ttl)
+        # Filtrlangan foydalanuvchilar soni (admin ro'yxati uchun): filtr -> soni
+        self.user_count_cache = TTLCache(maxsize=1000, ttl=60)
+        # Majburiy kanallar ro'yxati: add_channel/delete_channel tozalaydi, boshqa
+        # jarayonlardagi o'zgarishlar user_cache_ttl ichida ko'rinadi
+        self.channel_cache = TTLCache(maxsize=1, ttl=user_cache_ttl)
+        self._channel_lock = asyncio.Lock()
 
-    def create_tables(self):
-        # Foydalanuvchilar jadvali
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                phone TEXT,
-                full_name TEXT,
-                username TEXT,
-                joined_date TEXT,
-                is_blocked INTEGER DEFAULT 0,
-                is_admin INTEGER DEFAULT 0
-            )
-        ''')
+        # Har bir oqim o'z ulanishini ishlatadi (o'quvchilar puli + bitta yozuvchi)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-read')
+        self.migrate()
+        # Xato terilgan nomlarni qidirish trigram jadvali bo'lsagina ishlaydi
+        self.trigram_search = self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'movies_trigram'"
+        ).fetchone() is not None
 
-        # Kinolar jadvali
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS movies (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT UNIQUE,
-                title TEXT,
-                file_id TEXT,
-                added_date TEXT
-            )
-        ''')
+        # Kinolar indeksi: code -> (code, title, file_id). add_movie/delete_movie bilan
+        # bir xil holatda saqlanadi; mavjud bo'lmagan kod so'rovsiz rad etiladi
+        self.movie_index = self._read_movie_index()
+        self.movie_index_signature = self.cursor.execute(MOVIES_VERSION_QUERY).fetchone()
+        self.movie_index_generation = 0
 
-        # Majburiy kanallar jadvali
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS force_channels (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_id TEXT UNIQUE,
-                channel_username TEXT,
-                added_date TEXT
-            )
-        ''')
+        self.write_queue = queue.Queue()
+        self.writer = threading.Thread(target=self._writer_loop, name='db-write', daemon=True)
+        self.writer.start()
 
-        # Admin sessiyalar jadvali
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS admin_sessions (
-                user_id INTEGER PRIMARY KEY,
-                is_authenticated INTEGER DEFAULT 0
-            )
-        ''')
+    # ============= CONNECTION FUNCTIONS =============
+    def _connect(self):
+        """Joriy oqim uchun yangi ulanish ochish va PRAGMA'larni qo'llash"""
+        connection = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None)
+        for name in ('busy_timeout', 'journal_mode', 'synchronous', 'cache_size', 'mmap_size'):
+            connection.execute(f"PRAGMA {name} = {self.profile[name]}")
+        with self._connections_lock:
+            self._connections.append(connection)
+        return connection
+
+    @property
+    def connection(self):
+        """Joriy oqimning ulanishi"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+            self._local.cursor = connection.cursor()
+        return connection
+
+    @property
+    def cursor(self):
+        """Joriy oqimning kursori"""
+        if getattr(self._local, 'cursor', None) is None:
+            self.connection
+        return self._local.cursor
+
+    def _writer_loop(self):
+        """Yozuvchi oqim: navbatdagi yozuvlarni to'plab, bitta tranzaksiyada commit qilish"""
+        running = True
+        while running:
+            item = self.write_queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    timeout = deadline - time.monotonic()
+                    item = self.write_queue.get(timeout=timeout) if timeout > 0 else self.write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            try:
+                self._commit_batch(batch)
+            except Exception as e:
+                # Kutilmagan xato oqimni to'xtatmasligi kerak: aks holda navbatdagi
+                # va keyingi barcha run_in_writer chaqiruvlari abadiy kutib qoladi
+                logging.exception("Yozuvchi oqim: to'plamni yozishda kutilmagan xato")
+                _notify_futures([(loop, future, None, e) for _, _, _, loop, future in batch])
+
+    def _commit_batch(self, batch):
+        """Yozuvlar to'plamini bitta tranzaksiyada bajarish.
+
+        Har bir yozuv o'z SAVEPOINT'ida ishlaydi: bittasining xatosi faqat o'zini
+        bekor qiladi. Future'lar faqat COMMIT muvaffaqiyatli bo'lgandan keyin yakunlanadi.
+        """
+        connection = self.connection
+        results = []
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            for func, args, kwargs, loop, future in batch:
+                connection.execute('SAVEPOINT write')
+                try:
+                    result = func(self, *args, **kwargs)
+                except Exception as e:
+                    connection.execute('ROLLBACK TO write')
+                    results.append((loop, future, None, e))
+                else:
+                    results.append((loop, future, result, None))
+                connection.execute('RELEASE write')
+            connection.execute('COMMIT')
+        except Exception as e:
+            try:
+                if connection.in_transaction:
+                    connection.execute('ROLLBACK')
+            except sqlite3.Error:
+                # Ulanish yaroqsiz holatda - keyingi to'plam uchun yangisini ochamiz
+                logging.exception("Yozuvchi oqim: ROLLBACK bajarilmadi, ulanish qayta ochiladi")
+                self._reset_connection()
+            results = [(loop, future, None, e) for _, _, _, loop, future in batch]
 
-        self.connection.commit()
+        _notify_futures(results)
+
+    def _reset_connection(self):
+        """Joriy oqim ulanishini yopish; keyingi murojaatda yangisi ochiladi"""
+        connection = self._local.connection
+        self._local.connection = self._local.cursor = None
+        with self._connections_lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+
+    # ============= SCHEMA FUNCTIONS =============
+    def migrate(self):
+        """Sxemani MIGRATIONS bo'yicha oxirgi versiyagacha yangilash.
+
+        Har bir migratsiya versiya raqami bilan birga bitta tranzaksiyada yoziladi;
+        bir nechta jarayon bir vaqtda ishga tushsa, migratsiyani faqat bittasi bajaradi.
+        """
+        cursor = self.cursor
+        for version, migration in enumerate(MIGRATIONS, 1):
+            if cursor.execute('PRAGMA user_version').fetchone()[0] >= version:
+                continue
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                # Qulf olinguncha boshqa jarayon migratsiyani bajargan bo'lishi mumkin
+                if cursor.execute('PRAGMA user_version').fetchone()[0] < version:
+                    migration(cursor)
+                    cursor.execute(f'PRAGMA user_version = {version}')
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+
+    @run_in_db_thread
+    def get_schema_version(self):
+        """Bazadagi sxema versiyasi"""
+        return self.cursor.execute('PRAGMA user_version').fetchone()[0]
+
+    @run_in_db_thread
+    def check_query_plans(self):
+        """HOT_QUERIES dagi so'rovlarni EXPLAIN QUERY PLAN bilan tekshirish.
+
+        Qaytaradi: indeks ishlatmaydigan so'rovlar - name -> reja qatorlari
+        (to'liq SCAN yoki vaqtinchalik B-TREE bilan saralash, SORTED_IN_MEMORY dagilardan
+        tashqari). Bo'sh lug'at - hammasi joyida. `python benchmark.py plans` shu bilan
+        tekshiradi va muammo bo'lsa nol bo'lmagan kod bilan chiqadi.
+        """
+        problems = {}
+        for name, (query, params) in HOT_QUERIES.items():
+            plan = [row[3] for row in self.cursor.execute(f'EXPLAIN QUERY PLAN {query}', params)]
+            if any((detail.startswith('SCAN') and 'USING' not in detail)
+                   or ('TEMP B-TREE' in detail and name not in SORTED_IN_MEMORY)
+                   for detail in plan):
+                problems[name] = plan
+        return problems
 
     # ============= USER FUNCTIONS =============
+    @invalidates_user
+    @run_in_writer
     def add_user(self, user_id, phone=None, full_name=None, username=None):
         """Yangi foydalanuvchi qo'shish"""
         try:
@@ -66,40 +735,98 @@ class Database:
                 INSERT INTO users (user_id, phone, full_name, username, joined_date)
                 VALUES (?, ?, ?, ?, ?)
             ''', (user_id, phone, full_name, username, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-            self.connection.commit()
             return True
         except sqlite3.IntegrityError:
             return False
 
+    @run_in_db_thread
     def user_exists(self, user_id):
         """Foydalanuvchi borligini tekshirish"""
         result = self.cursor.execute('SELECT user_id FROM users WHERE user_id = ?', (user_id,)).fetchone()
         return result is not None
 
+    @invalidates_user
+    @run_in_writer
     def update_user_phone(self, user_id, phone):
         """Foydalanuvchi telefon raqamini yangilash"""
         self.cursor.execute('UPDATE users SET phone = ? WHERE user_id = ?', (phone, user_id))
-        self.connection.commit()
 
+    @run_in_db_thread
     def is_user_blocked(self, user_id):
         """Foydalanuvchi bloklanganligini tekshirish"""
         result = self.cursor.execute('SELECT is_blocked FROM users WHERE user_id = ?', (user_id,)).fetchone()
         return result[0] == 1 if result else False
 
+    @invalidates_user
+    @run_in_writer
     def block_user(self, user_id):
         """Foydalanuvchini bloklash"""
         self.cursor.execute('UPDATE users SET is_blocked = 1 WHERE user_id = ?', (user_id,))
-        self.connection.commit()
 
+    @invalidates_user
+    @run_in_writer
     def unblock_user(self, user_id):
         """Foydalanuvchini blokdan chiqarish"""
         self.cursor.execute('UPDATE users SET is_blocked = 0 WHERE user_id = ?', (user_id,))
-        self.connection.commit()
 
+    async def get_user_gate(self, user_id):
+        """Foydalanuvchi holati (mavjudligi, bloklangani, telefoni) - keshdan yoki bitta so'rov bilan"""
+        gate = self.user_cache.get(user_id)
+        if gate is None:
+            generation = self.user_cache.generation
+            gate = await self._load_user_gate(user_id)
+            # So'rov davomida yozuv bo'lgan bo'lsa, eskirgan natijani keshlamaymiz
+            if generation == self.user_cache.generation:
+                self.user_cache.set(user_id, gate)
+        return gate
+
+    @run_in_db_thread
+    def _load_user_gate(self, user_id):
+        """Foydalanuvchi holatini bitta SELECT bilan o'qish"""
+        result = self.cursor.execute('''
+            SELECT is_blocked, phone, is_reachable FROM users WHERE user_id = ?
+        ''', (user_id,)).fetchone()
+        return {
+            'exists': result is not None,
+            'blocked': result is not None and result[0] == 1,
+            'has_phone': result is not None and bool(result[1]),
+            'reachable': result is None or result[2] == 1
+        }
+
+    @invalidates_user
+    @run_in_writer
+    def mark_user_reachable(self, user_id):
+        """Foydalanuvchi botga qayta yozdi - yana reklama oladi"""
+        self.cursor.execute('''
+            UPDATE users SET is_reachable = 1, last_delivery_error = NULL, delivery_failures = 0 WHERE user_id = ?
+        ''', (user_id,))
+
+    @run_in_db_thread
     def get_all_users(self):
-        """Barcha faol foydalanuvchilarni olish"""
-        return self.cursor.execute('SELECT user_id FROM users WHERE is_blocked = 0').fetchall()
+        """Reklama yuborish mumkin bo'lgan faol foydalanuvchilar (user_id bo'yicha tartiblangan)"""
+        return self.cursor.execute('''
+            SELECT user_id FROM users WHERE is_blocked = 0 AND is_reachable = 1 ORDER BY user_id
+        ''').fetchall()
+
+    async def iter_users(self, after_user_id=0, page_size=1000):
+        """Faol foydalanuvchilar user_id'larini sahifalab (keyset) oqim sifatida berish.
+
+        Butun ro'yxat xotiraga yuklanmaydi: bir vaqtda faqat bitta sahifa saqlanadi.
+        """
+        while True:
+            page = await self._active_users_page(after_user_id, page_size)
+            for (user_id,) in page:
+                yield user_id
+            if len(page) < page_size:
+                return
+            after_user_id = page[-1][0]
 
+    @run_in_db_thread
+    def _active_users_page(self, after_user_id, limit):
+        """user_id > after_user_id bo'lgan keyingi faol foydalanuvchilar sahifasi"""
+        return self.cursor.execute(HOT_QUERIES['active_users_page'][0], (after_user_id, limit)).fetchall()
+
+    @run_in_db_thread
     def get_user_info(self, user_id):
         """Foydalanuvchi ma'lumotlarini olish"""
         return self.cursor.execute('''
@@ -107,96 +834,386 @@ class Database:
             FROM users WHERE user_id = ?
         ''', (user_id,)).fetchone()
 
+    @run_in_db_thread
     def get_total_users(self):
         """Jami foydalanuvchilar soni"""
-        return self.cursor.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        return self._read_counters()['total_users']
 
+    @run_in_db_thread
     def get_active_users(self):
         """Faol foydalanuvchilar soni"""
-        return self.cursor.execute('SELECT COUNT(*) FROM users WHERE is_blocked = 0').fetchone()[0]
+        counters = self._read_counters()
+        return counters['total_users'] - counters['blocked_users']
+
+    @run_in_db_thread
+    def get_reachable_users(self):
+        """Reklama yuborish mumkin bo'lgan foydalanuvchilar soni"""
+        return self.cursor.execute(HOT_QUERIES['reachable_users_count'][0]).fetchone()[0]
 
+    @run_in_db_thread
     def get_blocked_users(self):
         """Bloklangan foydalanuvchilar soni"""
-        return self.cursor.execute('SELECT COUNT(*) FROM users WHERE is_blocked = 1').fetchone()[0]
+        return self._read_counters()['blocked_users']
+
+    @run_in_db_thread
+    def get_last_users(self, limit=15):
+        """So'nggi qo'shilgan foydalanuvchilar ro'yxati"""
+        return self.cursor.execute(HOT_QUERIES['last_users'][0], (limit,)).fetchall()
+
+    @run_in_db_thread
+    def get_users_page(self, filters=None, after=None, before=None, limit=15):
+        """Admin uchun foydalanuvchilar sahifasi, yangilari birinchi.
+
+        Qaytaradi: (user_id, full_name, username, phone, joined_date, is_blocked) ro'yxati.
+        Keyset sahifalash (joined_date, user_id) bo'yicha - after/before get_movies_page
+        dagidek. filters - _user_filter_conditions kalitlari.
+        """
+        conditions, params = _user_filter_conditions(filters or {})
+
+        def page(shape, extra_params, count):
+            extra_conditions, order, _ = USERS_PAGE_SHAPES[shape]
+            query = _users_page_sql(conditions + extra_conditions, order)
+            return self.cursor.execute(query, (*params, *extra_params, count)).fetchall()
+
+        if after is not None:
+            joined_date, user_id = after
+            rows = page('after_same_date', (joined_date, user_id), limit)
+            if len(rows) < limit:
+                rows += page('after_older', (joined_date,), limit - len(rows))
+            return rows
+        if before is not None:
+            joined_date, user_id = before
+            rows = page('before_same_date', (joined_date, user_id), limit)
+            if len(rows) < limit:
+                rows += page('before_newer', (joined_date,), limit - len(rows))
+            return rows[::-1]
+        return page('first', (), limit)
+
+    async def count_users(self, filters=None):
+        """Filtrga mos foydalanuvchilar soni.
+
+        Filtrsiz - hisoblagichdan; filtr bilan - COUNT natijasi bir daqiqa keshlanadi.
+        """
+        if not filters:
+            return await self.get_total_users()
+        key = tuple(sorted(filters.items()))
+        total = self.user_count_cache.get(key)
+        if total is None:
+            total = await self._count_users(filters)
+            self.user_count_cache.set(key, total)
+        return total
+
+    @run_in_db_thread
+    def _count_users(self, filters):
+        conditions, params = _user_filter_conditions(filters)
+        return self.cursor.execute(
+            f"SELECT COUNT(*) FROM users WHERE {' AND '.join(conditions)}", params
+        ).fetchone()[0]
 
     # ============= MOVIE FUNCTIONS =============
-    def add_movie(self, code, title, file_id):
+    async def add_movie(self, code, title, file_id):
         """Yangi kino qo'shish"""
+        self.movie_index_generation += 1
+        added = await self._insert_movie(code, title, file_id)
+        if added:
+            self.movie_index[code] = (code, title, file_id)
+        return added
+
+    @run_in_writer
+    def _insert_movie(self, code, title, file_id):
+        """Kinoni bazaga yozish"""
         try:
             self.cursor.execute('''
                 INSERT INTO movies (code, title, file_id, added_date)
                 VALUES (?, ?, ?, ?)
             ''', (code, title, file_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-            self.connection.commit()
             return True
         except sqlite3.IntegrityError:
             return False
 
-    def get_movie(self, code):
-        """Kino ma'lumotlarini olish (kod bo'yicha)"""
-        return self.cursor.execute('''
-            SELECT code, title, file_id FROM movies WHERE code = ?
-        ''', (code,)).fetchone()
+    async def get_movie(self, code):
+        """Kino ma'lumotlarini olish (kod bo'yicha) - xotiradagi indeksdan, so'rovsiz"""
+        return self.movie_index.get(code)
 
-    def delete_movie(self, code):
+    async def delete_movie(self, code):
         """Kinoni o'chirish"""
+        self.movie_index_generation += 1
+        await self._delete_movie(code)
+        self.movie_index.pop(code, None)
+
+    @run_in_writer
+    def _delete_movie(self, code):
+        """Kinoni bazadan o'chirish"""
         self.cursor.execute('DELETE FROM movies WHERE code = ?', (code,))
-        self.connection.commit()
 
+    def _read_movie_index(self):
+        """movies jadvalidan kod -> (code, title, file_id) indeksini qurish"""
+        rows = self.cursor.execute('SELECT code, title, file_id FROM movies').fetchall()
+        return {row[0]: row for row in rows}
+
+    @run_in_db_thread
+    def _movie_index_signature(self):
+        """Jadval o'zgarganini aniqlash uchun versiya (triggerlar har bir o'zgarishda oshiradi)"""
+        return self.cursor.execute(MOVIES_VERSION_QUERY).fetchone()
+
+    async def reload_movie_index(self, force=False):
+        """Indeksni bazadan qayta yuklash (boshqa jarayon o'zgartirgan bo'lsa).
+
+        force=False bo'lsa, jadval o'zgarmagan holda qayta yuklanmaydi.
+        Qaytaradi: indeks yangilandimi.
+        """
+        signature = await self._movie_index_signature()
+        if not force and signature == self.movie_index_signature:
+            return False
+
+        generation = self.movie_index_generation
+        index = await asyncio.get_running_loop().run_in_executor(self.executor, self._read_movie_index)
+        # Yuklash davomida add_movie/delete_movie bo'lgan bo'lsa, keyingi safar qayta urinamiz
+        if generation != self.movie_index_generation:
+            return False
+
+        self.movie_index = index
+        self.movie_index_signature = signature
+        return True
+
+    @run_in_db_thread
     def get_total_movies(self):
         """Jami kinolar soni"""
-        return self.cursor.execute('SELECT COUNT(*) FROM movies').fetchone()[0]
+        return self._read_counters()['total_movies']
 
-    def movie_exists(self, code):
+    async def movie_exists(self, code):
         """Kino borligini tekshirish"""
-        result = self.cursor.execute('SELECT code FROM movies WHERE code = ?', (code,)).fetchone()
-        return result is not None
+        return code in self.movie_index
 
+    @run_in_db_thread
     def get_all_movies(self):
         """Barcha kinolar ro'yxati"""
-        return self.cursor.execute('SELECT code, title, added_date FROM movies ORDER BY added_date DESC').fetchall()
+        return self.cursor.execute(HOT_QUERIES['all_movies'][0]).fetchall()
+
+    @run_in_db_thread
+    def get_movies_page(self, after=None, before=None, limit=20):
+        """Kinolar katalogi sahifasi: (id, code, title, added_date), yangilari birinchi.
+
+        Keyset sahifalash (added_date, id) bo'yicha: after - shu yozuvdan keyingi sahifa,
+        before - undan oldingi sahifa, ikkalasi ham None - birinchi sahifa. Jadval hajmidan
+        qat'i nazar faqat `limit` ta qator o'qiladi.
+        """
+        if before is not None:
+            return self._movies_keyset(before, limit, 'movies_before_same_date', 'movies_before_newer')[::-1]
+        if after is not None:
+            return self._movies_keyset(after, limit, 'movies_after_same_date', 'movies_after_older')
+        return self.cursor.execute(HOT_QUERIES['movies_first_page'][0], (limit,)).fetchall()
+
+    def _movies_keyset(self, cursor, limit, same_date_query, other_dates_query):
+        """Kursor (added_date, id) dan keyingi `limit` ta kino (ikki indeksli so'rov bilan)"""
+        added_date, movie_id = cursor
+        rows = self.cursor.execute(HOT_QUERIES[same_date_query][0], (added_date, movie_id, limit)).fetchall()
+        if len(rows) < limit:
+            rows += self.cursor.execute(HOT_QUERIES[other_dates_query][0], (added_date, limit - len(rows))).fetchall()
+        return rows
+
+    async def import_movies(self, movies, replace=False):
+        """Ko'p kinoni bitta tranzaksiyada qo'shish (executemany).
+
+        movies - (code, title, file_id, added_date) ro'yxati; added_date None bo'lsa hozirgi vaqt.
+        Bazada bor kodlar replace=True bo'lsa yangilanadi, aks holda o'tkazib yuboriladi.
+        Qaytaradi: {'added': soni, 'updated': soni, 'duplicates': bazada bor bo'lgan kodlar}.
+        """
+        self.movie_index_generation += 1
+        existing = await self._import_movies(movies, replace)
+        for code, title, file_id, added_date in movies:
+            if replace or code not in existing:
+                self.movie_index[code] = (code, title, file_id)
+        duplicates = [movie[0] for movie in movies if movie[0] in existing]
+        return {
+            'added': len(movies) - len(duplicates),
+            'updated': len(duplicates) if replace else 0,
+            'duplicates': duplicates
+        }
+
+    @run_in_writer
+    def _import_movies(self, movies, replace):
+        """Kinolarni yozish; bazada oldindan bor bo'lgan kodlar to'plamini qaytaradi.
+
+        Qatorlar avval vaqtinchalik jadvalga executemany bilan, keyin movies ga bitta
+        INSERT ... SELECT bilan yoziladi: FTS5 to'plangan indeksni har bir bayonot oxirida
+        diskka yoziladi, shuning uchun qatorma-qator INSERT ~10 barobar sekin.
+        """
+        self.cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS movies_import (
+                code TEXT PRIMARY KEY, title TEXT, file_id TEXT, added_date TEXT
+            )
+        ''')
+        self.cursor.execute('DELETE FROM movies_import')
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.cursor.executemany(
+            'INSERT INTO movies_import (code, title, file_id, added_date) VALUES (?, ?, ?, ?)',
+            ((code, title, file_id, added_date or now) for code, title, file_id, added_date in movies)
+        )
+        existing = {row[0] for row in self.cursor.execute(
+            'SELECT code FROM movies WHERE code IN (SELECT code FROM movies_import)'
+        )}
+
+        conflict = 'DO UPDATE SET title = excluded.title, file_id = excluded.file_id' if replace else 'DO NOTHING'
+        # "WHERE true" - INSERT ... SELECT dagi ON CONFLICT ni JOIN bilan adashtirmaslik uchun
+        self.cursor.execute(f'''
+            INSERT INTO movies (code, title, file_id, added_date)
+            SELECT code, title, file_id, added_date FROM movies_import WHERE true
+            ON CONFLICT (code) {conflict}
+        ''')
+        self.cursor.execute('DELETE FROM movies_import')
+        return existing
+
+    async def iter_movies(self, page_size=1000):
+        """Barcha kinolar (code, title, file_id, added_date) id tartibida - sahifalab, oqim sifatida"""
+        after_id = 0
+        while True:
+            page = await self._movies_by_id_page(after_id, page_size)
+            for row in page:
+                yield row[1:]
+            if len(page) < page_size:
+                return
+            after_id = page[-1][0]
+
+    @run_in_db_thread
+    def _movies_by_id_page(self, after_id, limit):
+        """id > after_id bo'lgan keyingi kinolar sahifasi"""
+        return self.cursor.execute('''
+            SELECT id, code, title, file_id, added_date FROM movies WHERE id > ? ORDER BY id LIMIT ?
+        ''', (after_id, limit)).fetchall()
+
+    async def search_movies(self, text, limit=5, titles=True):
+        """Kod yoki nom bo'yicha kino qidirish (aniq kod topilmaganda takliflar uchun).
+
+        Tartib: aniq kod, bitta belgisi xato terilgan kodlar (xotiradagi indeksdan,
+        so'rovsiz), nomidagi so'zlar (FTS5), nomi o'xshash kinolar (trigram).
+        titles=False bo'lsa bazaga murojaat qilinmaydi - faqat xotiradagi indeks.
+        Qaytaradi: [(code, title, file_id)], eng mosi birinchi.
+        """
+        text = text.strip()
+        found = {}
+        if text in self.movie_index:
+            found[text] = self.movie_index[text]
+        # Kodlarda bo'sh joy bo'lmaydi - nom yozilgan bo'lsa variantlar tekshirilmaydi
+        if len(text) <= 32 and not any(char.isspace() for char in text):
+            for variant in _code_edits(text):
+                movie = self.movie_index.get(variant)
+                if movie:
+                    found.setdefault(variant, movie)
+                    if len(found) >= limit:
+                        break
+        if titles and len(found) < limit:
+            for movie in await self._search_titles(text, limit):
+                found.setdefault(movie[0], movie)
+        return list(found.values())[:limit]
+
+    @run_in_db_thread
+    def _search_titles(self, text, limit):
+        """Nom bo'yicha qidirish: avval so'zlar (oxirgisi prefiks), topilmasa - trigram o'xshashligi"""
+        words = _fts_words(text)
+        if not words:
+            return []
+        match = ' '.join(f'"{word}"' for word in words) + '*'
+        rows = self.cursor.execute('''
+            SELECT m.code, m.title, m.file_id FROM movies_fts f JOIN movies m ON m.id = f.rowid
+            WHERE movies_fts MATCH ? ORDER BY rank LIMIT ?
+        ''', (match, limit)).fetchall()
+        if rows or not self.trigram_search:
+            return rows
+
+        # Umumiy trigramlari bor nomlar (bm25 bo'yicha), keyin so'rov trigramlarining
+        # qanchasi nomda borligi bo'yicha saralanadi
+        trigrams = _trigrams(words)
+        if not trigrams:
+            return []
+        match = ' OR '.join(f'"{trigram}"' for trigram in sorted(trigrams))
+        candidates = self.cursor.execute('''
+            SELECT m.code, m.title, m.file_id FROM movies_trigram f JOIN movies m ON m.id = f.rowid
+            WHERE movies_trigram MATCH ? ORDER BY rank LIMIT ?
+        ''', (match, limit * 10)).fetchall()
+        scored = []
+        for movie in candidates:
+            score = len(trigrams & _trigrams(_fts_words(movie[1] or ''))) / len(trigrams)
+            if score >= 0.3:
+                scored.append((score, movie))
+        scored.sort(key=lambda item: -item[0])
+        return [movie for score, movie in scored[:limit]]
 
     # ============= CHANNEL FUNCTIONS =============
-    def add_channel(self, channel_id, channel_username):
+    async def add_channel(self, channel_id, channel_username):
         """Yangi kanal qo'shish"""
+        try:
+            return await self._insert_channel(channel_id, channel_username)
+        finally:
+            self.channel_cache.clear()
+
+    @run_in_writer
+    def _insert_channel(self, channel_id, channel_username):
+        """Kanalni bazaga yozish"""
         try:
             self.cursor.execute('''
                 INSERT INTO force_channels (channel_id, channel_username, added_date)
                 VALUES (?, ?, ?)
             ''', (channel_id, channel_username, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-            self.connection.commit()
             return True
         except sqlite3.IntegrityError:
             return False
 
-    def delete_channel(self, channel_id):
+    async def delete_channel(self, channel_id):
         """Kanalni o'chirish"""
+        try:
+            await self._delete_channel(channel_id)
+        finally:
+            self.channel_cache.clear()
+
+    @run_in_writer
+    def _delete_channel(self, channel_id):
+        """Kanalni bazadan o'chirish"""
         self.cursor.execute('DELETE FROM force_channels WHERE channel_id = ?', (channel_id,))
-        self.connection.commit()
 
-    def get_all_channels(self):
-        """Barcha kanallarni olish"""
+    async def get_all_channels(self):
+        """Barcha kanallarni olish (har bir xabarda so'raladi, shuning uchun keshdan)"""
+        channels = self.channel_cache.get('all')
+        if channels is not None:
+            return channels
+        # Kesh bo'sh paytda kelgan parallel xabarlar bazani bir marta so'raydi
+        async with self._channel_lock:
+            channels = self.channel_cache.get('all')
+            if channels is None:
+                generation = self.channel_cache.generation
+                channels = await self._read_channels()
+                # O'qish davomida kanal qo'shilgan/o'chirilgan bo'lsa, eski ro'yxatni keshlamaymiz
+                if generation == self.channel_cache.generation:
+                    self.channel_cache.set('all', channels)
+        return channels
+
+    @run_in_db_thread
+    def _read_channels(self):
+        """Kanallarni bazadan o'qish"""
         return self.cursor.execute('SELECT channel_id, channel_username FROM force_channels').fetchall()
 
+    @run_in_db_thread
     def channel_exists(self, channel_id):
         """Kanal borligini tekshirish"""
         result = self.cursor.execute('SELECT channel_id FROM force_channels WHERE channel_id = ?',
                                      (channel_id,)).fetchone()
         return result is not None
 
+    @run_in_db_thread
     def get_total_channels(self):
         """Jami kanallar soni"""
-        return self.cursor.execute('SELECT COUNT(*) FROM force_channels').fetchone()[0]
+        return self._read_counters()['total_channels']
 
     # ============= ADMIN SESSION FUNCTIONS =============
+    @run_in_writer
     def create_admin_session(self, user_id):
         """Admin sessiyasini yaratish"""
         self.cursor.execute('''
             INSERT OR REPLACE INTO admin_sessions (user_id, is_authenticated)
             VALUES (?, 1)
         ''', (user_id,))
-        self.connection.commit()
 
+    @run_in_db_thread
     def is_admin_authenticated(self, user_id):
         """Admin autentifikatsiya qilinganligini tekshirish"""
         result = self.cursor.execute('''
@@ -204,42 +1221,219 @@ class Database:
         ''', (user_id,)).fetchone()
         return result[0] == 1 if result else False
 
+    @run_in_writer
     def logout_admin(self, user_id):
         """Admin sessiyasini tugatish"""
         self.cursor.execute('DELETE FROM admin_sessions WHERE user_id = ?', (user_id,))
-        self.connection.commit()
 
+    @run_in_writer
     def logout_all_admins(self):
         """Barcha admin sessiyalarini tugatish"""
         self.cursor.execute('DELETE FROM admin_sessions')
-        self.connection.commit()
+
+    # ============= FSM FUNCTIONS =============
+    @run_in_db_thread
+    def get_fsm_record(self, key, max_age=None):
+        """FSM yozuvi: (state, data) yoki None (max_age soniyadan eski yozuvlar hisobga olinmaydi)"""
+        min_updated = time.time() - max_age if max_age else 0
+        return self.cursor.execute('''
+            SELECT state, data FROM fsm_states WHERE key = ? AND updated_at >= ?
+        ''', (key, min_updated)).fetchone()
+
+    @run_in_writer
+    def set_fsm_state(self, key, state):
+        """FSM holatini yozish"""
+        self.cursor.execute('''
+            INSERT INTO fsm_states (key, state, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+        ''', (key, state, time.time()))
+        self._drop_empty_fsm_record(key)
+
+    @run_in_writer
+    def set_fsm_data(self, key, data):
+        """FSM ma'lumotlarini (JSON) yozish"""
+        self.cursor.execute('''
+            INSERT INTO fsm_states (key, data, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+        ''', (key, data, time.time()))
+        self._drop_empty_fsm_record(key)
+
+    @run_in_writer
+    def purge_fsm_states(self, max_age):
+        """max_age soniyadan beri o'zgarmagan FSM holatlarini o'chirish"""
+        return self.cursor.execute(HOT_QUERIES['purge_fsm_states'][0], (time.time() - max_age,)).rowcount
+
+    def _drop_empty_fsm_record(self, key):
+        """Holati ham, ma'lumoti ham bo'sh yozuvni o'chirish (jadval o'smasligi uchun)"""
+        self.cursor.execute('''
+            DELETE FROM fsm_states WHERE key = ? AND state IS NULL AND (data IS NULL OR data = '{}')
+        ''', (key,))
+
+    # ============= BROADCAST FUNCTIONS =============
+    @run_in_writer
+    def create_broadcast_job(self, from_chat_id, message_id, total, admin_chat_id=None, status_message_id=None):
+        """Yangi reklama vazifasini yaratish (id qaytaradi)"""
+        self.cursor.execute('''
+            INSERT INTO broadcast_jobs (from_chat_id, message_id, total, admin_chat_id, status_message_id, created_date)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (from_chat_id, message_id, total, admin_chat_id, status_message_id,
+              datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        return self.cursor.lastrowid
+
+    async def record_broadcast_progress(self, job_id, deliveries, cursor, success, failed, unreachable_after=3):
+        """Yetkazilish natijalari to'plami va vazifa cursor'ini bitta tranzaksiyada yozish.
+
+        'unreachable' holatidagi foydalanuvchilar keyingi reklamalardan chiqariladi.
+        'undelivered' holatida delivery_failures oshadi va unreachable_after ga yetsa
+        foydalanuvchi ham chiqariladi; 'sent' bo'lsa hisoblagich nolga qaytadi.
+        Keshdagi holat ham (COMMIT'dan keyin) tozalanadi - aks holda botga
+        qaytganda mark_user_reachable chaqirilmay qoladi.
+        Qaytaradi: hisoblagichi chegaraga yetib, shu to'plamda chiqarilganlar soni.
+        """
+        try:
+            return await self._record_broadcast_progress(job_id, deliveries, cursor, success, failed,
+                                                         unreachable_after)
+        finally:
+            for _, user_id, status, _ in deliveries:
+                if status in ('unreachable', 'undelivered'):
+                    self.user_cache.invalidate(user_id)
+
+    @run_in_writer
+    def _record_broadcast_progress(self, job_id, deliveries, cursor, success, failed, unreachable_after):
+        self.cursor.executemany('''
+            INSERT OR REPLACE INTO broadcast_deliveries (job_id, user_id, status, error)
+            VALUES (?, ?, ?, ?)
+        ''', deliveries)
+        self.cursor.executemany('''
+            UPDATE users SET is_reachable = 0, last_delivery_error = ? WHERE user_id = ?
+        ''', [(error, user_id) for _, user_id, status, error in deliveries if status == 'unreachable'])
+        self.cursor.executemany('''
+            UPDATE users SET delivery_failures = 0 WHERE user_id = ? AND delivery_failures > 0
+        ''', [(user_id,) for _, user_id, status, _ in deliveries if status == 'sent'])
+        undelivered = [(error, user_id) for _, user_id, status, error in deliveries if status == 'undelivered']
+        self.cursor.executemany('''
+            UPDATE users SET delivery_failures = delivery_failures + 1, last_delivery_error = ? WHERE user_id = ?
+        ''', undelivered)
+        self.cursor.executemany('''
+            UPDATE users SET is_reachable = 0 WHERE user_id = ? AND is_reachable = 1 AND delivery_failures >= ?
+        ''', [(user_id, unreachable_after) for _, user_id in undelivered])
+        removed = max(self.cursor.rowcount, 0) if undelivered else 0
+        self.cursor.execute('''
+            UPDATE broadcast_jobs SET cursor = ?, success = ?, failed = ? WHERE id = ?
+        ''', (cursor, success, failed, job_id))
+        return removed
+
+    @run_in_writer
+    def finish_broadcast_job(self, job_id, status='finished'):
+        """Reklama vazifasini yakunlangan deb belgilash"""
+        self.cursor.execute('''
+            UPDATE broadcast_jobs SET status = ?, finished_date = ? WHERE id = ?
+        ''', (status, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), job_id))
+
+    @run_in_db_thread
+    def get_unfinished_broadcast_jobs(self):
+        """Tugallanmagan reklama vazifalari"""
+        return self.cursor.execute(HOT_QUERIES['unfinished_broadcast_jobs'][0]).fetchall()
+
+    async def iter_broadcast_recipients(self, job_id, after_user_id=0, page_size=1000):
+        """Vazifa uchun hali yuborilmagan faol foydalanuvchilar oqimi (cursor'dan keyin)"""
+        while True:
+            page = await self._broadcast_recipients_page(job_id, after_user_id, page_size)
+            for (user_id, delivered) in page:
+                if not delivered:
+                    yield user_id
+            if len(page) < page_size:
+                return
+            after_user_id = page[-1][0]
+
+    @run_in_db_thread
+    def _broadcast_recipients_page(self, job_id, after_user_id, limit):
+        """Keyingi faol foydalanuvchilar sahifasi va ularga allaqachon yuborilganmi belgisi"""
+        return self.cursor.execute('''
+            SELECT user_id, EXISTS (
+                SELECT 1 FROM broadcast_deliveries d WHERE d.job_id = ? AND d.user_id = u.user_id
+            )
+            FROM users u
+            WHERE is_blocked = 0 AND is_reachable = 1 AND user_id > ?
+            ORDER BY user_id LIMIT ?
+        ''', (job_id, after_user_id, limit)).fetchall()
+
+    @run_in_db_thread
+    def get_broadcast_jobs(self, limit=10):
+        """So'nggi reklama vazifalari (admin uchun xulosa)"""
+        return self.cursor.execute('''
+            SELECT id, status, total, success, failed, created_date, finished_date
+            FROM broadcast_jobs ORDER BY id DESC LIMIT ?
+        ''', (limit,)).fetchall()
 
     # ============= STATISTICS FUNCTIONS =============
+    @run_in_db_thread
     def get_statistics(self):
-        """To'liq statistika"""
+        """To'liq statistika (hisoblagichlardan, jadvallarni sanamasdan)"""
+        counters = self._read_counters()
         return {
-            'total_users': self.get_total_users(),
-            'active_users': self.get_active_users(),
-            'blocked_users': self.get_blocked_users(),
-            'total_movies': self.get_total_movies(),
-            'total_channels': self.get_total_channels()
+            'total_users': counters['total_users'],
+            'active_users': counters['total_users'] - counters['blocked_users'],
+            'blocked_users': counters['blocked_users'],
+            'total_movies': counters['total_movies'],
+            'total_channels': counters['total_channels']
         }
 
+    def _read_counters(self):
+        """counters jadvalini name -> value lug'ati sifatida o'qish"""
+        counters = dict.fromkeys(COUNTERS, 0)
+        counters.update(self.cursor.execute('SELECT name, value FROM counters').fetchall())
+        return counters
+
+    @run_in_writer
+    def reconcile_counters(self):
+        """Hisoblagichlarni COUNT(*) bilan qayta hisoblab tuzatish.
+
+        Qaytaradi: farq chiqqan hisoblagichlar - name -> (eski qiymat, haqiqiy qiymat).
+        """
+        stored = self._read_counters()
+        corrected = {}
+        for name, query in COUNTERS.items():
+            actual = self.cursor.execute(query).fetchone()[0]
+            if actual != stored[name]:
+                corrected[name] = (stored[name], actual)
+            self.cursor.execute('''
+                INSERT INTO counters (name, value) VALUES (?, ?)
+                ON CONFLICT (name) DO UPDATE SET value = excluded.value
+            ''', (name, actual))
+        return corrected
+
     # ============= UTILITY FUNCTIONS =============
-    def close(self):
-        """Ma'lumotlar bazasini yopish"""
-        self.connection.close()
+    async def close(self):
+        """Navbatdagi yozuvlarni tugatib, ma'lumotlar bazasini yopish"""
+        self.write_queue.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self.writer.join)
+        self.executor.shutdown(wait=True)
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
 
+    @run_in_db_thread
     def backup(self, backup_file='backup.db'):
         """Ma'lumotlar bazasini zahiralash"""
         backup_conn = sqlite3.connect(backup_file)
         self.connection.backup(backup_conn)
         backup_conn.close()
 
-    def clear_all_data(self):
+    async def clear_all_data(self):
         """Barcha ma'lumotlarni o'chirish (EHTIYOT BO'LING!)"""
+        self.movie_index_generation += 1
+        await self._clear_all_data()
+        self.user_cache.clear()
+        self.channel_cache.clear()
+        self.movie_index.clear()
+
+    @run_in_writer
+    def _clear_all_data(self):
         self.cursor.execute('DELETE FROM users')
         self.cursor.execute('DELETE FROM movies')
         self.cursor.execute('DELETE FROM force_channels')
         self.cursor.execute('DELETE FROM admin_sessions')
-        self.connection.commit()
\ No newline at end of file
+        self.cursor.execute('DELETE FROM broadcast_jobs')
+        self.cursor.execute('DELETE FROM broadcast_deliveries')
\ No newline at end of file
@@ -0,0 +1,81 @@
+import copy
+import json
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+
+from cache import TTLCache
+
+
+# ============= SQLITE FSM STORAGE =============
+class SQLiteStorage(BaseStorage):
+    """FSM holatlarini umumiy SQLite bazada saqlash (MemoryStorage o'rniga).
+
+    Bir nechta jarayon bitta bazadan foydalansa, foydalanuvchi holati
+    qaysi jarayonga tushishidan qat'i nazar saqlanib qoladi va bot qayta
+    ishga tushganda ham yo'qolmaydi.
+
+    state_ttl soniya davomida o'zgarmagan holatlar eskirgan hisoblanadi va
+    purge() bilan o'chiriladi. Faol kalitlar write-through keshda saqlanadi:
+    yozuv avval keshga, keyin bazaga tushadi, o'qish esa keshdan bo'ladi.
+    """
+
+    def __init__(self, db, key_builder=None, state_ttl=86400, cache_size=10000, cache_ttl=60):
+        self.db = db
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.state_ttl = state_ttl
+        # key -> {'state': ..., 'data': {...}}
+        self.cache = TTLCache(maxsize=cache_size, ttl=min(cache_ttl, state_ttl))
+
+    async def _load(self, key):
+        """Yozuvni keshdan yoki bazadan olish"""
+        record = self.cache.get(key)
+        if record is None:
+            generation = self.cache.generation
+            row = await self.db.get_fsm_record(key, self.state_ttl)
+            record = {
+                'state': row[0] if row else None,
+                'data': json.loads(row[1]) if row and row[1] else {}
+            }
+            # Yuklash davomida yozuv bo'lgan bo'lsa, keshdagi yangiroq qiymatni saqlab qolamiz
+            if generation == self.cache.generation and key not in self.cache.data:
+                self.cache.set(key, record)
+        return record
+
+    def _update_cache(self, key, part, value):
+        """Keshdagi to'liq yozuvni yangilash; to'liq bo'lmasa - tashlab yuborish"""
+        record = self.cache.get(key)
+        if record is None:
+            self.cache.invalidate(key)
+        else:
+            record[part] = value
+
+    async def set_state(self, key, state=None):
+        """Holatni yozish (None - holatni tozalash)"""
+        if isinstance(state, State):
+            state = state.state
+        key = self.key_builder.build(key)
+        self._update_cache(key, 'state', state)
+        await self.db.set_fsm_state(key, state)
+
+    async def get_state(self, key):
+        """Joriy holatni olish"""
+        return (await self._load(self.key_builder.build(key)))['state']
+
+    async def set_data(self, key, data):
+        """Holat ma'lumotlarini yozish"""
+        key = self.key_builder.build(key)
+        self._update_cache(key, 'data', copy.deepcopy(data))
+        await self.db.set_fsm_data(key, json.dumps(data, ensure_ascii=False))
+
+    async def get_data(self, key):
+        """Holat ma'lumotlarini olish (nusxasi qaytariladi)"""
+        return copy.deepcopy((await self._load(self.key_builder.build(key)))['data'])
+
+    async def purge(self):
+        """Muddati o'tgan holatlarni bazadan o'chirish (o'chirilganlar sonini qaytaradi)"""
+        return await self.db.purge_fsm_states(self.state_ttl)
+
+    async def close(self):
+        """Baza main.py tomonidan yopiladi"""
+        pass
@@ -58,7 +58,7 @@ def admin_panel():
             [KeyboardButton(text="📢 Reklama yuborish"), KeyboardButton(text="✉️ Habar yuborish")],
             [KeyboardButton(text="📊 Statistika"), KeyboardButton(text="👥 Foydalanuvchilar")],
             [KeyboardButton(text="📺 Kanallar boshqaruvi"), KeyboardButton(text="🎬 Kinolar ro'yxati")],
-            [KeyboardButton(text="🚪 Admin paneldan chiqish")]
+            [KeyboardButton(text="📋 Reklamalar"), KeyboardButton(text="🚪 Admin paneldan chiqish")]
         ],
         resize_keyboard=True
     )
@@ -186,16 +186,33 @@ def confirm_delete_channel(channel_id):
     return keyboard
 
 
+# ============= KINO TAKLIFLARI =============
+def movie_suggestions(movies):
+    """Qidiruv natijalari: har bir kino uchun alohida tugma"""
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=f"🎬 {title} ({code})", callback_data=f"movie_{code}")]
+            # callback_data 64 baytdan oshmasligi kerak
+            for code, title, file_id in movies if len(code.encode()) <= 58
+        ]
+    )
+    return keyboard
+
+
 # ============= SAHIFALASH TUGMALARI =============
-def pagination_keyboard(current_page, total_pages, callback_prefix):
-    """Sahifalash uchun tugmalar"""
+def pagination_keyboard(current_page, total_pages, callback_prefix, prev_cursor=None, next_cursor=None):
+    """Sahifalash uchun tugmalar.
+
+    prev_cursor/next_cursor berilsa, ular callback_data oxiriga qo'shiladi
+    (keyset sahifalash: keyingi sahifa shu joydan davom etadi).
+    """
     buttons = []
 
     # Orqaga tugmasi
     if current_page > 1:
         buttons.append(InlineKeyboardButton(
             text="◀️ Orqaga",
-            callback_data=f"{callback_prefix}_{current_page - 1}"
+            callback_data=f"{callback_prefix}_{current_page - 1}" + (f"_{prev_cursor}" if prev_cursor else "")
         ))
 
     # Hozirgi sahifa
@@ -208,7 +225,7 @@ def pagination_keyboard(current_page, total_pages, callback_prefix):
     if current_page < total_pages:
         buttons.append(InlineKeyboardButton(
             text="Oldinga ▶️",
-            callback_data=f"{callback_prefix}_{current_page + 1}"
+            callback_data=f"{callback_prefix}_{current_page + 1}" + (f"_{next_cursor}" if next_cursor else "")
         ))
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons])
@@ -0,0 +1,531 @@
+"""Botni soxta Telegram Bot API'ga qarshi yuklama bilan sinash.
+
+Ishga tushirish:
+    python loadtest.py mixed --updates 20000
+    python loadtest.py lookup --hit-rate 0.5 --save baseline.json
+    python loadtest.py lookup --hit-rate 0.5 --compare baseline.json
+    python loadtest.py broadcast --users 100000
+    THROTTLE_ENABLED=0 python loadtest.py spam
+    OUTBOUND_ENABLED=0 python loadtest.py busy --updates 600
+
+main.py dagi haqiqiy dp va handlerlar ishlatiladi. Baza vaqtinchalik papkada
+yaratiladi, bot so'rovlari esa lokal aiohttp serverga (FakeBotAPI) boradi -
+haqiqiy Telegram'ga hech narsa yuborilmaydi. Har bir bosqich uchun
+updates/s, update kechikishi (p50/p99), handlerlar kechikishi, SQL so'rovlar
+va API chaqiruvlari soni chiqariladi. --save bilan natija JSON faylga
+yoziladi, --compare bilan shu faylga nisbatan farq ko'rsatiladi.
+
+Boshqa sozlamalar (DB_PROFILE, USER_CACHE_TTL, ...) .env yoki muhitdan
+odatdagidek o'qiladi, shuning uchun ularni o'zgartirib solishtirish mumkin.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from aiohttp import ClientSession, web
+
+from benchmark import make_update, percentile, seed_database
+
+
+# ============= SOXTA TELEGRAM BOT API =============
+class FakeBotAPI:
+    """Bot API'ning lokal o'rinbosari: har bir so'rovga `delay` soniyadan keyin
+    muvaffaqiyatli javob qaytaradi va chaqiruvlarni metod bo'yicha sanaydi.
+
+    blocked_rate - botni bloklagan foydalanuvchilar ulushi (ularga yuborilgan
+    xabarlar 403 bilan qaytadi). flood_rate - soniyasiga qabul qilinadigan
+    xabarlar soni, undan oshganlari Telegram kabi 429 (retry_after=1) oladi
+    va '429' nomi bilan sanaladi. Alohida jarayonda ishga tushiriladi (spawn),
+    shunda uning CPU xarajati bot o'lchovlariga qo'shilmaydi; chaqiruvlar soni
+    GET /_calls bilan olinadi va POST /_calls bilan nollanadi.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8090, delay=0.005, blocked_rate=0.0, flood_rate=0):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.blocked_rate = blocked_rate
+        self.flood_rate = flood_rate
+        # Joriy soniya va unda qabul qilingan xabarlar
+        self.window = 0
+        self.window_count = 0
+        self.calls = Counter()
+        self.message_id = 0
+        self.runner = None
+
+    @property
+    def base(self):
+        return f'http://{self.host}:{self.port}'
+
+    def _message(self, chat_id):
+        self.message_id += 1
+        return {'message_id': self.message_id, 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'}}
+
+    def _result(self, method, params):
+        chat_id = int(params.get('chat_id') or 0)
+        if method in ('sendmessage', 'sendvideo', 'sendphoto', 'senddocument', 'editmessagetext'):
+            return self._message(chat_id)
+        if method == 'copymessage':
+            return {'message_id': self._message(chat_id)['message_id']}
+        if method == 'getchatmember':
+            user = {'id': int(params.get('user_id') or 0), 'is_bot': False, 'first_name': 'User'}
+            return {'status': 'member', 'user': user}
+        if method == 'getme':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Kino bot', 'username': 'kino_bot'}
+        return True
+
+    async def handle(self, request):
+        method = request.match_info['method'].lower()
+        self.calls[method] += 1
+        params = await request.post()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+        chat_id = int(params.get('chat_id') or 0)
+        if self.flood_rate and method.startswith(('send', 'copy')):
+            second = int(time.monotonic())
+            if second != self.window:
+                self.window, self.window_count = second, 0
+            if self.window_count >= self.flood_rate:
+                self.calls['429'] += 1
+                return web.json_response({'ok': False, 'error_code': 429,
+                                          'description': 'Too Many Requests: retry after 1',
+                                          'parameters': {'retry_after': 1}}, status=429)
+            self.window_count += 1
+        if self.blocked_rate and method.startswith(('send', 'copy')) and chat_id % 1000 < self.blocked_rate * 1000:
+            return web.json_response({'ok': False, 'error_code': 403,
+                                      'description': 'Forbidden: bot was blocked by the user'}, status=403)
+        return web.json_response({'ok': True, 'result': self._result(method, params)})
+
+    async def calls_handler(self, request):
+        calls = dict(self.calls)
+        if request.method == 'POST':
+            self.calls.clear()
+        return web.json_response(calls)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        app.router.add_route('*', '/_calls', self.calls_handler)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+    async def serve(self, ready):
+        await self.start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    def run(self, ready):
+        """Bolalar jarayoni kirish nuqtasi"""
+        asyncio.run(self.serve(ready))
+
+
+class FakeBotAPIProcess:
+    """FakeBotAPI ni alohida jarayonda boshqarish"""
+
+    def __init__(self, **options):
+        self.api = FakeBotAPI(**options)
+        self.process = None
+
+    @property
+    def base(self):
+        return self.api.base
+
+    def start(self):
+        context = multiprocessing.get_context('spawn')
+        ready = context.Event()
+        self.process = context.Process(target=self.api.run, args=(ready,), name='fake-bot-api', daemon=True)
+        self.process.start()
+        if not ready.wait(30):
+            raise RuntimeError("Soxta Bot API ishga tushmadi")
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+
+    async def calls(self, reset=False):
+        """Metod -> chaqiruvlar soni (reset=True bo'lsa hisob nollanadi)"""
+        async with ClientSession() as session:
+            async with session.request('POST' if reset else 'GET', f'{self.base}/_calls') as response:
+                return await response.json()
+
+
+# ============= SQL SO'ROVLAR HISOBI =============
+class QueryCounter:
+    """Database ulanishlarida bajarilgan SELECT/INSERT/UPDATE/DELETE so'rovlarini sanash"""
+
+    STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+    def __init__(self, db):
+        self.count = 0
+        self.lock = threading.Lock()
+        with db._connections_lock:
+            for connection in db._connections:
+                connection.set_trace_callback(self.trace)
+        connect = db._connect
+
+        def traced_connect():
+            connection = connect()
+            connection.set_trace_callback(self.trace)
+            return connection
+        db._connect = traced_connect
+
+    def trace(self, statement):
+        if statement.lstrip()[:6].upper().startswith(self.STATEMENTS):
+            with self.lock:
+                self.count += 1
+
+
+# ============= TRAFIK =============
+def contact_update(update_id, user_id):
+    update = make_update(update_id, user_id, None)
+    del update['message']['text']
+    update['message']['contact'] = {'phone_number': f'+998{user_id % 10 ** 9:09d}',
+                                    'first_name': f'User {user_id}', 'user_id': user_id}
+    return update
+
+
+def lookup_updates(rng, args, count):
+    """Mavjud foydalanuvchilardan kino kodlari; hit_rate ulushi bazada bor kodlar"""
+    for _ in range(count):
+        user_id = rng.randint(1, args.users)
+        if rng.random() < args.hit_rate:
+            code = str(rng.randint(1, args.movies))
+        else:
+            code = str(rng.randint(args.movies + 1, args.movies * 10))
+        yield user_id, code
+
+
+def build_traffic(scenario, args):
+    """Ssenariy bosqichlari: [(nom, tayyorgarlik updatelari, o'lchanadigan updatelar)]"""
+    rng = random.Random(args.seed)
+    new_user = args.users + 1
+    update_id = 0
+
+    def next_id():
+        nonlocal update_id
+        update_id += 1
+        return update_id
+
+    if scenario == 'start':
+        # Yangi foydalanuvchilar oqimi: har biri birinchi marta /start yuboradi
+        return [('start', [], [make_update(next_id(), new_user + i, '/start') for i in range(args.updates)])]
+
+    if scenario == 'contact':
+        users = range(new_user, new_user + args.updates)
+        warmup = [make_update(next_id(), user_id, '/start') for user_id in users]
+        return [('contact', warmup, [contact_update(next_id(), user_id) for user_id in users])]
+
+    if scenario == 'lookup':
+        return [('lookup', [], [make_update(next_id(), user_id, code)
+                                for user_id, code in lookup_updates(rng, args, args.updates)])]
+
+    if scenario == 'spam':
+        # 80% update bir nechta spamerlardan, qolgani oddiy foydalanuvchilarning kino kodlari
+        spammers = [rng.randint(1, args.users) for _ in range(args.spammers)]
+        lookups = lookup_updates(rng, args, args.updates)
+        return [('spam', [], [make_update(next_id(), rng.choice(spammers), str(rng.randint(1, args.movies)))
+                              if rng.random() < 0.8 else make_update(next_id(), *next(lookups))
+                              for _ in range(args.updates)])]
+
+    # mixed: 75% kino kodi, 10% /start (mavjud), 10% /start (yangi) va keyinroq 5% telefon raqami
+    updates, onboarding = [], []
+    lookups = lookup_updates(rng, args, args.updates)
+    for i in range(args.updates):
+        roll = rng.random()
+        if roll < 0.10:
+            updates.append(make_update(next_id(), new_user, '/start'))
+            onboarding.append(new_user)
+            new_user += 1
+        elif roll < 0.15 and onboarding:
+            updates.append(contact_update(next_id(), onboarding.pop(0)))
+        elif roll < 0.25:
+            updates.append(make_update(next_id(), rng.randint(1, args.users), '/start'))
+        else:
+            user_id, code = next(lookups)
+            updates.append(make_update(next_id(), user_id, code))
+    return [('mixed', [], updates)]
+
+
+# ============= O'LCHASH =============
+async def feed(bot_app, updates, concurrency):
+    """Updatelarni dp ga parallel berish (polling kabi); kechikishlar va xatolar sonini qaytaradi"""
+    from aiogram.types import Update
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(raw):
+        nonlocal errors
+        update = Update.model_validate(raw, context={'bot': bot_app.bot})
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await bot_app.dp.feed_update(bot_app.bot, update)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(raw) for raw in updates))
+    return latencies, errors
+
+
+async def feed_paced(bot_app, updates, rate):
+    """Updatelarni soniyasiga `rate` ta tezlikda berish; kechikishlar va xatolar sonini qaytaradi"""
+    from aiogram.types import Update
+
+    latencies, errors = [], 0
+
+    async def one(raw):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            await bot_app.dp.feed_update(bot_app.bot, Update.model_validate(raw, context={'bot': bot_app.bot}))
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+
+    tasks = []
+    started = time.perf_counter()
+    for i, raw in enumerate(updates):
+        delay = started + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(raw)))
+    await asyncio.gather(*tasks)
+    return latencies, errors
+
+
+async def run_phase(bot_app, api, queries, warmup, updates, concurrency):
+    """Bitta bosqichni o'lchab, natijani lug'at sifatida qaytarish"""
+    if warmup:
+        await feed(bot_app, warmup, concurrency)
+
+    bot_app.metrics.reset()
+    await api.calls(reset=True)
+    queries.count = 0
+    dropped = bot_app.throttling.dropped if bot_app.throttling else 0
+    started = time.perf_counter()
+    latencies, errors = await feed(bot_app, updates, concurrency)
+    elapsed = time.perf_counter() - started
+    calls = await api.calls()
+    dropped = (bot_app.throttling.dropped if bot_app.throttling else 0) - dropped
+
+    return {
+        'updates': len(updates),
+        'errors': errors,
+        'throttled': dropped,
+        'updates_per_sec': len(updates) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'queries_per_update': queries.count / len(updates),
+        'db_calls_per_update': sum(h.count for h in bot_app.metrics.histograms['db'].values()) / len(updates),
+        'api_calls_per_update': sum(calls.values()) / len(updates),
+        'handlers': {name: {'count': histogram.count,
+                            'p50_ms': histogram.quantile(0.5) * 1000,
+                            'p99_ms': histogram.quantile(0.99) * 1000}
+                     for name, histogram, _ in bot_app.metrics.top('handler')},
+        'api_calls': calls,
+    }
+
+
+async def run_broadcast(bot_app, api, queries):
+    """Bazadagi barcha foydalanuvchilarga reklama: BroadcastEngine to'liq yo'li (limiter, yozuvlar)"""
+    bot_app.metrics.reset()
+    await api.calls(reset=True)
+    queries.count = 0
+    started = time.perf_counter()
+    job = await bot_app.broadcaster.start(from_chat_id=1, message_id=1)
+    await job.task
+    elapsed = time.perf_counter() - started
+    calls = await api.calls()
+    progress = job.progress()
+    processed = max(1, progress['processed'])
+    return {
+        'updates': progress['processed'],
+        'errors': progress['failed'],
+        'throttled': 0,
+        'updates_per_sec': progress['processed'] / elapsed,
+        'p50_ms': 0.0,
+        'p99_ms': 0.0,
+        'queries_per_update': queries.count / processed,
+        'db_calls_per_update': sum(h.count for h in bot_app.metrics.histograms['db'].values()) / processed,
+        'api_calls_per_update': sum(calls.values()) / processed,
+        'handlers': {},
+        'api_calls': calls,
+    }
+
+
+async def run_busy(bot_app, api, queries, updates, rate):
+    """Fon reklamasi davomida foydalanuvchilarning kino so'rovlari (soniyasiga `rate` ta)"""
+    bot_app.metrics.reset()
+    await api.calls(reset=True)
+    queries.count = 0
+    job = await bot_app.broadcaster.start(from_chat_id=1, message_id=1)
+    started = time.perf_counter()
+    latencies, errors = await feed_paced(bot_app, updates, rate)
+    elapsed = time.perf_counter() - started
+    await bot_app.broadcaster.stop()
+    calls = await api.calls()
+    progress = job.progress()
+    return {
+        'updates': len(updates),
+        'errors': errors,
+        'throttled': 0,
+        'updates_per_sec': len(updates) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'queries_per_update': queries.count / len(updates),
+        'db_calls_per_update': sum(h.count for h in bot_app.metrics.histograms['db'].values()) / len(updates),
+        'api_calls_per_update': sum(calls.values()) / len(updates),
+        'broadcast_per_sec': progress['processed'] / elapsed,
+        'flood_errors': calls.get('429', 0),
+        'handlers': {name: {'count': histogram.count,
+                            'p50_ms': histogram.quantile(0.5) * 1000,
+                            'p99_ms': histogram.quantile(0.99) * 1000}
+                     for name, histogram, _ in bot_app.metrics.top('handler')},
+        'api_calls': calls,
+    }
+
+
+def print_result(name, result, baseline=None):
+    def delta(key):
+        if not baseline or not baseline.get(key):
+            return ''
+        return f" ({(result[key] - baseline[key]) / baseline[key]:+.0%})"
+
+    print(f"\n== {name}: {result['updates']} ta, xato {result['errors']}, cheklangan {result['throttled']}")
+    print(f"  updates/s          {result['updates_per_sec']:10.0f}{delta('updates_per_sec')}")
+    if result['p50_ms']:
+        print(f"  kechikish p50      {result['p50_ms']:10.2f} ms{delta('p50_ms')}")
+        print(f"  kechikish p99      {result['p99_ms']:10.2f} ms{delta('p99_ms')}")
+    print(f"  SQL so'rov/update  {result['queries_per_update']:10.2f}{delta('queries_per_update')}")
+    print(f"  DB metod/update    {result['db_calls_per_update']:10.2f}{delta('db_calls_per_update')}")
+    print(f"  API so'rov/update  {result['api_calls_per_update']:10.2f}{delta('api_calls_per_update')}")
+    if 'broadcast_per_sec' in result:
+        print(f"  fon reklama/s      {result['broadcast_per_sec']:10.1f}{delta('broadcast_per_sec')}")
+        print(f"  429 javoblar       {result['flood_errors']:10d}")
+    for handler, stats in result['handlers'].items():
+        print(f"  {handler:<28} n={stats['count']:<7} p50={stats['p50_ms']:7.2f}ms p99={stats['p99_ms']:7.2f}ms")
+    print(f"  API: {', '.join(f'{method}={count}' for method, count in sorted(result['api_calls'].items()))}")
+
+
+# ============= ISHGA TUSHIRISH =============
+def load_bot(directory, args, api):
+    """main.py ni vaqtinchalik papkada, soxta API va yoqilgan metrikalar bilan yuklash"""
+    os.environ.update({
+        'BOT_TOKEN': '123456:LOADTEST',
+        'BOT_MODE': 'polling',
+        'METRICS_ENABLED': '1',
+        'METRICS_PORT': '0',
+        'MOVIE_INDEX_RELOAD_SECONDS': '0',
+        'BROADCAST_RATE': str(args.broadcast_rate),
+        'BROADCAST_CONCURRENCY': str(args.concurrency),
+    })
+    if not args.flood_rate:
+        # Soxta API limit qo'ymasa, chiquvchi so'rovlar limiti ham o'lchovni cheklamasin
+        os.environ.setdefault('OUTBOUND_RATE', '1000000')
+    os.chdir(directory)
+
+    from aiogram.client.telegram import TelegramAPIServer
+    import main as bot_app
+    bot_app.bot.session.api = TelegramAPIServer.from_base(api.base)
+    return bot_app
+
+
+async def run(args):
+    import sqlite3
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cinema_bot.db')
+        await seed_database(path, users=args.users, movies=args.movies)
+        conn = sqlite3.connect(path)
+        conn.executemany('INSERT INTO force_channels (channel_id, channel_username, added_date) VALUES (?, ?, ?)',
+                         ((f'-100{i}', f'@kanal{i}', 'now') for i in range(1, args.channels + 1)))
+        conn.commit()
+        conn.close()
+
+        api = FakeBotAPIProcess(port=args.port, delay=args.api_delay, blocked_rate=args.blocked_rate,
+                                flood_rate=args.flood_rate)
+        api.start()
+        bot_app = load_bot(tmp, args, api)
+        queries = QueryCounter(bot_app.db)
+        await bot_app.on_startup(resume_broadcasts=False, metrics_port=0)
+
+        baseline = {}
+        if args.compare:
+            with open(args.compare, encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        results = {}
+        try:
+            if args.scenario == 'broadcast':
+                results['broadcast'] = await run_broadcast(bot_app, api, queries)
+            elif args.scenario == 'busy':
+                updates = [make_update(i, user_id, code)
+                           for i, (user_id, code) in enumerate(lookup_updates(random.Random(args.seed), args, args.updates), 1)]
+                results['busy'] = await run_busy(bot_app, api, queries, updates, args.update_rate)
+            else:
+                for name, warmup, updates in build_traffic(args.scenario, args):
+                    results[name] = await run_phase(bot_app, api, queries, warmup, updates, args.concurrency)
+        finally:
+            await bot_app.on_shutdown()
+            await bot_app.bot.session.close()
+            api.stop()
+            os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+        print(f"users={args.users} movies={args.movies} channels={args.channels} "
+              f"concurrency={args.concurrency} api_delay={args.api_delay * 1000:.1f}ms")
+        for name, result in results.items():
+            print_result(name, result, baseline.get(name))
+
+        if args.save:
+            with open(args.save, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+            print(f"\nNatija {args.save} fayliga yozildi")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kino botni soxta Bot API bilan yuklama sinovi")
+    parser.add_argument('scenario', choices=['start', 'contact', 'lookup', 'mixed', 'spam', 'broadcast', 'busy'])
+    parser.add_argument('--updates', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--users', type=int, default=None, help="bazadagi foydalanuvchilar (broadcast: 100000)")
+    parser.add_argument('--movies', type=int, default=10000)
+    parser.add_argument('--channels', type=int, default=1, help="majburiy kanallar soni")
+    parser.add_argument('--spammers', type=int, default=5, help="spam ssenariysidagi spamerlar soni")
+    parser.add_argument('--hit-rate', type=float, default=0.8, help="bazada bor kino kodlari ulushi")
+    parser.add_argument('--api-delay', type=float, default=0.005, help="soxta API javob kechikishi (soniya)")
+    parser.add_argument('--blocked-rate', type=float, default=0.0, help="botni bloklagan foydalanuvchilar ulushi")
+    parser.add_argument('--broadcast-rate', type=float, default=None,
+                        help="reklama limiti (xabar/soniya); standart: busy - 25, qolganlari - cheklanmagan")
+    parser.add_argument('--flood-rate', type=int, default=None,
+                        help="soxta API qabul qiladigan xabar/soniya (standart: busy - 30, qolganlari - cheklanmagan)")
+    parser.add_argument('--update-rate', type=float, default=10, help="busy ssenariysida update/soniya")
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help="natijani JSON faylga yozish")
+    parser.add_argument('--compare', help="oldingi natija (JSON) bilan solishtirish")
+    args = parser.parse_args()
+    if args.users is None:
+        args.users = 100000 if args.scenario == 'broadcast' else 10000
+    if args.broadcast_rate is None:
+        args.broadcast_rate = 25 if args.scenario == 'busy' else 1000000
+    if args.flood_rate is None:
+        args.flood_rate = 30 if args.scenario == 'busy' else 0
+    for path in ('save', 'compare'):
+        if getattr(args, path):
+            setattr(args, path, os.path.abspath(getattr(args, path)))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,30 @@
 import asyncio
+import hashlib
+import html
+import io
 import logging
+import tempfile
+from datetime import datetime
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import (Message, CallbackQuery, FSInputFile, InlineQuery, InlineQueryResultCachedVideo,
+                           InlineQueryResultsButton)
 import os
 from dotenv import load_dotenv
 
-from database import Database
+from apisession import TunedAiohttpSession, parse_timeouts
+from broadcast import BroadcastEngine
+from cache import TTLCache
+from catalog import detect_format, parse_movies, write_movies
+from database import Database, STORAGE_PROFILES, looks_like_title
+from fsm_storage import SQLiteStorage
+from metrics import Metrics, setup_metrics, start_metrics_server
+from outbound import OutboundScheduler
+from throttling import ThrottlingMiddleware, parse_limits
+from webhook import run_webhook
 from keyboards import *
 
 # .env faylni yuklash
@@ -19,16 +34,157 @@ load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', '2008')
 
+# Ma'lumotlar bazasi sozlamalari (profil + alohida PRAGMA qiymatlari)
+DB_PROFILE = dict(STORAGE_PROFILES[os.getenv('DB_PROFILE', 'wal')])
+for _pragma in ('synchronous', 'cache_size', 'mmap_size'):
+    if os.getenv(f'DB_{_pragma.upper()}'):
+        DB_PROFILE[_pragma] = os.getenv(f'DB_{_pragma.upper()}')
+DB_BATCH_WINDOW_MS = float(os.getenv('DB_BATCH_WINDOW_MS', '5'))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+
+# Kanal a'zoligi keshi: a'zo bo'lsa uzoqroq, a'zo bo'lmasa qisqa muddat saqlanadi
+SUBSCRIPTION_CACHE_TTL = int(os.getenv('SUBSCRIPTION_CACHE_TTL', '600'))
+SUBSCRIPTION_NEGATIVE_TTL = int(os.getenv('SUBSCRIPTION_NEGATIVE_TTL', '30'))
+# Bir vaqtda tekshiriladigan kanallar soni va bitta tekshiruv uchun vaqt chegarasi (soniya)
+SUBSCRIPTION_CHECK_CONCURRENCY = int(os.getenv('SUBSCRIPTION_CHECK_CONCURRENCY', '5'))
+SUBSCRIPTION_CHECK_TIMEOUT = float(os.getenv('SUBSCRIPTION_CHECK_TIMEOUT', '3'))
+
+# Kinolar indeksini bazadan qayta yuklash oralig'i (soniya, 0 - o'chirilgan).
+# Bazani boshqa jarayon ham o'zgartirsa yoqiladi
+MOVIE_INDEX_RELOAD_SECONDS = int(os.getenv('MOVIE_INDEX_RELOAD_SECONDS', '0'))
+# Kod topilmaganda taklif qilinadigan o'xshash kinolar soni (0 - taklif qilinmaydi)
+MOVIE_SUGGESTIONS_LIMIT = int(os.getenv('MOVIE_SUGGESTIONS_LIMIT', '5'))
+# Taklif topilmagan matn shu muddat (soniya) eslab qolinadi - qayta yuborilsa bazaga so'rov ketmaydi
+MOVIE_MISS_CACHE_TTL = int(os.getenv('MOVIE_MISS_CACHE_TTL', '30'))
+
+# Inline rejim: natijalar soni, bot ichidagi natijalar keshi va Telegram keshi (cache_time), soniya
+INLINE_RESULTS_LIMIT = int(os.getenv('INLINE_RESULTS_LIMIT', '20'))
+INLINE_CACHE_TTL = int(os.getenv('INLINE_CACHE_TTL', '60'))
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '300'))
+
+# Reklama: umumiy limit (xabar/soniya), parallel yuboruvchilar, status yangilanish oralig'i
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv('BROADCAST_PROGRESS_INTERVAL', '5'))
+# 'chat not found' kabi xato ketma-ket necha reklamada takrorlansa foydalanuvchi ro'yxatdan chiqariladi
+BROADCAST_UNREACHABLE_AFTER = int(os.getenv('BROADCAST_UNREACHABLE_AFTER', '3'))
+
+# Ishga tushirish rejimi: polling yoki webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+# FSM holatlari: memory (bitta jarayon) yoki sqlite (umumiy, bir nechta jarayon uchun)
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'sqlite')
+# Tashlab ketilgan holatlar shuncha soniyadan keyin o'chiriladi
+FSM_STATE_TTL = int(os.getenv('FSM_STATE_TTL', '86400'))
+
+# Flood himoyasi: har bir foydalanuvchi uchun handler sinfi bo'yicha limitlar
+# (sinf=soniyasiga so'rov/zaxira; ro'yxatda yo'q sinf cheklanmaydi)
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', '1') == '1'
+THROTTLE_LIMITS = parse_limits(os.getenv('THROTTLE_LIMITS', 'movie=1/5,inline=3/10,start=0.5/3,default=2/10'))
+# reply - ogohlantirish yuboriladi (THROTTLE_REPLY_INTERVAL soniyada bir marta), silent - jim tashlanadi
+THROTTLE_MODE = os.getenv('THROTTLE_MODE', 'reply')
+THROTTLE_REPLY_INTERVAL = int(os.getenv('THROTTLE_REPLY_INTERVAL', '10'))
+
+# Chiquvchi so'rovlar: umumiy limit (so'rov/soniya) ustuvorlik bilan taqsimlanadi
+# (javoblar > a'zolik tekshiruvlari > reklama), har bir chatga limit va RetryAfter'da qayta yuborish
+OUTBOUND_ENABLED = os.getenv('OUTBOUND_ENABLED', '1') == '1'
+OUTBOUND_RATE = float(os.getenv('OUTBOUND_RATE', '30'))
+OUTBOUND_PER_CHAT_RATE = float(os.getenv('OUTBOUND_PER_CHAT_RATE', '1'))
+OUTBOUND_PER_CHAT_BURST = int(os.getenv('OUTBOUND_PER_CHAT_BURST', '3'))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+OUTBOUND_MAX_RETRY_AFTER = int(os.getenv('OUTBOUND_MAX_RETRY_AFTER', '30'))
+# Cluster rejimida umumiy limit router jarayonida turadi (cluster.py o'rnatadi). Router javob
+# bermasa, har bir worker OUTBOUND_RATE ning CLUSTER_WORKERS ga bo'lingan ulushi bilan ishlaydi
+OUTBOUND_GATE_URL = os.getenv('OUTBOUND_GATE_URL', '')
+CLUSTER_WORKERS = int(os.getenv('CLUSTER_WORKERS', '1'))
+
+# Bot API sessiyasi: ulanishlar puli (0 - cheklanmagan), keep-alive va DNS kesh (soniya, 0 - o'chirilgan)
+API_POOL_SIZE = int(os.getenv('API_POOL_SIZE', '100'))
+API_POOL_PER_HOST = int(os.getenv('API_POOL_PER_HOST', '0'))
+API_KEEPALIVE = float(os.getenv('API_KEEPALIVE', '30'))
+API_DNS_CACHE_TTL = int(os.getenv('API_DNS_CACHE_TTL', '3600'))
+# Timeout (soniya): umumiy va metod sinflari bo'yicha (membership, upload, send, default)
+API_TIMEOUT = float(os.getenv('API_TIMEOUT', '60'))
+API_TIMEOUTS = parse_timeouts(os.getenv('API_TIMEOUTS', 'membership=10,upload=300'))
+# JSON kodlash: json yoki orjson (o'rnatilgan bo'lsa tezroq)
+API_JSON = os.getenv('API_JSON', 'json')
+
+# Metrikalar: handler, baza va Telegram API kechikishlari (o'chirilgan bo'lsa hech narsa ulanmaydi)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '0') == '1'
+# Prometheus endpoint: http://METRICS_HOST:METRICS_PORT/metrics (0 - server ishga tushirilmaydi)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
 # Logging sozlash
 logging.basicConfig(level=logging.INFO)
 
+# Database
+db = Database(profile=DB_PROFILE, batch_window=DB_BATCH_WINDOW_MS / 1000, user_cache_ttl=USER_CACHE_TTL)
+
 # Bot va Dispatcher
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+session = TunedAiohttpSession(
+    limit=API_POOL_SIZE,
+    limit_per_host=API_POOL_PER_HOST,
+    keepalive_timeout=API_KEEPALIVE,
+    dns_cache_ttl=API_DNS_CACHE_TTL,
+    timeout=API_TIMEOUT,
+    timeouts=API_TIMEOUTS,
+    json_module=API_JSON
+)
+bot = Bot(token=BOT_TOKEN, session=session)
+storage = SQLiteStorage(db, state_ttl=FSM_STATE_TTL) if FSM_STORAGE == 'sqlite' else MemoryStorage()
 dp = Dispatcher(storage=storage)
 
-# Database
-db = Database()
+# Flood himoyasi (metrikalardan oldin ulanadi - tashlangan updatelar handler vaqtiga qo'shilmaydi)
+throttling = ThrottlingMiddleware(
+    THROTTLE_LIMITS,
+    reply_text="⏳ Juda ko'p so'rov. Iltimos, biroz kuting." if THROTTLE_MODE == 'reply' else None,
+    reply_interval=THROTTLE_REPLY_INTERVAL
+) if THROTTLE_ENABLED else None
+if throttling:
+    throttling.setup(dp)
+
+# Metrikalar (o'chirilgan bo'lsa None)
+metrics = Metrics() if METRICS_ENABLED else None
+
+# Chiquvchi so'rovlar rejalashtiruvchisi (API metrikalaridan oldin ulanadi - ular navbatsiz vaqtni o'lchaydi)
+scheduler = OutboundScheduler(
+    rate=OUTBOUND_RATE / CLUSTER_WORKERS if OUTBOUND_GATE_URL else OUTBOUND_RATE,
+    per_chat_rate=OUTBOUND_PER_CHAT_RATE,
+    per_chat_burst=OUTBOUND_PER_CHAT_BURST,
+    max_retries=OUTBOUND_MAX_RETRIES,
+    max_retry_after=OUTBOUND_MAX_RETRY_AFTER,
+    metrics=metrics,
+    gate_url=OUTBOUND_GATE_URL
+) if OUTBOUND_ENABLED else None
+if scheduler:
+    bot.session.middleware(scheduler)
+
+if metrics:
+    setup_metrics(metrics, dp, bot, db)
+
+# (user_id, channel_id) -> a'zo yoki yo'q
+subscription_cache = TTLCache(maxsize=200000, ttl=SUBSCRIPTION_CACHE_TTL)
+
+# Inline so'rov matni -> kinolar ro'yxati (mashhur so'rovlar bazaga tushmaydi)
+inline_cache = TTLCache(maxsize=10000, ttl=INLINE_CACHE_TTL)
+
+# Kod ham, o'xshash kino ham topilmagan matnlar (kinolar o'zgarganda tozalanadi)
+movie_miss_cache = TTLCache(maxsize=10000, ttl=MOVIE_MISS_CACHE_TTL)
+
+# Reklama dvigateli
+broadcaster = BroadcastEngine(bot, db, rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY,
+                              unreachable_after=BROADCAST_UNREACHABLE_AFTER)
+
+# Fon tasklar (GC o'chirib yubormasligi uchun havola saqlanadi)
+background_tasks = set()
+# Metrikalar HTTP serveri (ishga tushirilgan bo'lsa)
+metrics_runner = None
 
 
 # ============= STATES =============
@@ -75,23 +231,83 @@ class GetUserInfo(StatesGroup):
     waiting_user_id = State()
 
 
+class ImportMovies(StatesGroup):
+    waiting_file = State()
+
+
 # ============= HELPER FUNCTIONS =============
-async def check_subscription(user_id: int) -> bool:
-    """Foydalanuvchi barcha kanallarga a'zo ekanligini tekshirish"""
-    channels = db.get_all_channels()
+def run_in_background(coro):
+    """Korutinani fon task sifatida ishga tushirish"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def is_channel_member(user_id: int, channel_id: str) -> bool:
+    """Bitta kanalga a'zolikni tekshirish (avval keshdan)"""
+    key = (user_id, channel_id)
+    cached = subscription_cache.get(key)
+    if cached is not None:
+        return cached
+
+    member = await bot.get_chat_member(chat_id=channel_id, user_id=user_id)
+    is_member = member.status not in ['left', 'kicked']
+    subscription_cache.set(key, is_member, ttl=SUBSCRIPTION_CACHE_TTL if is_member else SUBSCRIPTION_NEGATIVE_TTL)
+    return is_member
+
+
+async def check_subscription(user_id: int, refresh: bool = False) -> bool:
+    """Foydalanuvchi barcha kanallarga a'zo ekanligini tekshirish
+
+    Keshda bo'lmagan kanallar parallel tekshiriladi; birortasida a'zo emasligi
+    aniqlansa, qolgan so'rovlar bekor qilinadi. refresh=True bo'lsa, keshdagi
+    natijalar tashlab yuborilib, API'dan qayta so'raladi.
+    """
+    channels = await db.get_all_channels()
     if not channels:
         return True
 
+    # Avval keshdan: API'ga faqat noma'lum kanallar uchun murojaat qilamiz
+    unknown = []
     for channel_id, _ in channels:
-        try:
-            member = await bot.get_chat_member(chat_id=channel_id, user_id=user_id)
-            if member.status in ['left', 'kicked']:
-                return False
-        except Exception as e:
-            logging.error(f"Kanal tekshirishda xato: {e}")
-            continue
+        key = (user_id, channel_id)
+        if refresh:
+            subscription_cache.invalidate(key)
+        cached = subscription_cache.get(key)
+        if cached is False:
+            return False
+        if cached is None:
+            unknown.append(channel_id)
+
+    if not unknown:
+        return True
 
-    return True
+    semaphore = asyncio.Semaphore(SUBSCRIPTION_CHECK_CONCURRENCY)
+
+    async def check(channel_id):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(is_channel_member(user_id, channel_id), SUBSCRIPTION_CHECK_TIMEOUT)
+            except asyncio.TimeoutError:
+                logging.warning(f"Kanal tekshirish vaqti tugadi: {channel_id}")
+                return True
+            except Exception as e:
+                logging.error(f"Kanal tekshirishda xato: {e}")
+                return True
+
+    tasks = [asyncio.create_task(check(channel_id)) for channel_id in unknown]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            if not await finished:
+                return False
+        return True
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Bekor qilingan vazifalar tugashini kutamiz: aks holda ular yetim qolib,
+        # "Task was destroyed but it is pending" va kutilmagan xatolar log'ga tushadi
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 def is_admin(user_id: int) -> bool:
@@ -100,25 +316,28 @@ def is_admin(user_id: int) -> bool:
     return True
 
 
-def is_admin_authenticated(user_id: int) -> bool:
+async def is_admin_authenticated(user_id: int) -> bool:
     """Admin autentifikatsiya qilinganligini tekshirish"""
     # Database'dan tekshiramiz
-    return db.is_admin_authenticated(user_id)
+    return await db.is_admin_authenticated(user_id)
 
 
 # ============= START COMMAND =============
-@dp.message(Command('start'))
+@dp.message(Command('start'), flags={'throttle': 'start'})
 async def cmd_start(message: Message):
     user_id = message.from_user.id
 
+    # Foydalanuvchi holati (bitta keshlangan so'rov)
+    gate = await db.get_user_gate(user_id)
+
     # Bloklangan foydalanuvchini tekshirish
-    if db.is_user_blocked(user_id):
+    if gate['blocked']:
         await message.answer("❌ Siz bloklangansiz. Botdan foydalana olmaysiz.")
         return
 
     # Foydalanuvchi bazada bormi tekshirish
-    if not db.user_exists(user_id):
-        db.add_user(
+    if not gate['exists']:
+        await db.add_user(
             user_id=user_id,
             full_name=message.from_user.full_name,
             username=message.from_user.username
@@ -130,9 +349,12 @@ async def cmd_start(message: Message):
         )
         return
 
+    # Reklama yetib bormay qolgan foydalanuvchi botga qaytdi
+    if not gate['reachable']:
+        await db.mark_user_reachable(user_id)
+
     # Telefon raqami bormi tekshirish
-    user_info = db.get_user_info(user_id)
-    if not user_info[1]:  # phone bo'sh bo'lsa
+    if not gate['has_phone']:
         await message.answer(
             "📱 Botdan foydalanish uchun telefon raqamingizni yuboring.",
             reply_markup=phone_button()
@@ -141,7 +363,7 @@ async def cmd_start(message: Message):
 
     # Kanalga a'zolikni tekshirish
     if not await check_subscription(user_id):
-        channels = db.get_all_channels()
+        channels = await db.get_all_channels()
         await message.answer(
             "📢 Botdan foydalanish uchun quyidagi kanallarga a'zo bo'ling:",
             reply_markup=channels_keyboard(channels)
@@ -157,16 +379,16 @@ async def cmd_start(message: Message):
 
 
 # ============= TELEFON RAQAM QABUL QILISH =============
-@dp.message(F.contact)
+@dp.message(F.contact, flags={'throttle': 'start'})
 async def get_phone(message: Message):
     user_id = message.from_user.id
     phone = message.contact.phone_number
 
-    db.update_user_phone(user_id, phone)
+    await db.update_user_phone(user_id, phone)
 
     # Kanalga a'zolikni tekshirish
     if not await check_subscription(user_id):
-        channels = db.get_all_channels()
+        channels = await db.get_all_channels()
         await message.answer(
             "📢 Botdan foydalanish uchun quyidagi kanallarga a'zo bo'ling:",
             reply_markup=channels_keyboard(channels)
@@ -181,11 +403,12 @@ async def get_phone(message: Message):
 
 
 # ============= KANALGA A'ZOLIKNI TEKSHIRISH =============
-@dp.callback_query(F.data == 'check_subscription')
+@dp.callback_query(F.data == 'check_subscription', flags={'throttle': 'start'})
 async def check_sub_callback(callback: CallbackQuery):
     user_id = callback.from_user.id
 
-    if await check_subscription(user_id):
+    # Foydalanuvchi endigina a'zo bo'lgan bo'lishi mumkin - keshni yangilaymiz
+    if await check_subscription(user_id, refresh=True):
         await callback.message.delete()
         await callback.message.answer(
             "✅ Barcha kanallarga a'zo bo'lgansiz!\n\n"
@@ -202,14 +425,15 @@ async def cmd_admin(message: Message, state: FSMContext):
     user_id = message.from_user.id
 
     # Agar allaqachon autentifikatsiya qilingan bo'lsa
-    if is_admin_authenticated(user_id):
+    if await is_admin_authenticated(user_id):
+        counters = await db.get_statistics()
         stats = f"""
 📊 <b>Statistika</b>
 
-👥 Jami foydalanuvchilar: {db.get_total_users()}
-✅ Faol foydalanuvchilar: {db.get_active_users()}
-🎬 Jami kinolar: {db.get_total_movies()}
-📢 Majburiy kanallar: {len(db.get_all_channels())}
+👥 Jami foydalanuvchilar: {counters['total_users']}
+✅ Faol foydalanuvchilar: {counters['active_users']}
+🎬 Jami kinolar: {counters['total_movies']}
+📢 Majburiy kanallar: {counters['total_channels']}
         """
         await message.answer(stats, reply_markup=admin_panel(), parse_mode='HTML')
         return
@@ -225,16 +449,17 @@ async def process_admin_password(message: Message, state: FSMContext):
 
     if message.text == ADMIN_PASSWORD:
         # Sessiyani database'ga yozamiz
-        db.create_admin_session(user_id)
+        await db.create_admin_session(user_id)
         await state.clear()
 
+        counters = await db.get_statistics()
         stats = f"""
 📊 <b>Statistika</b>
 
-👥 Jami foydalanuvchilar: {db.get_total_users()}
-✅ Faol foydalanuvchilar: {db.get_active_users()}
-🎬 Jami kinolar: {db.get_total_movies()}
-📢 Majburiy kanallar: {len(db.get_all_channels())}
+👥 Jami foydalanuvchilar: {counters['total_users']}
+✅ Faol foydalanuvchilar: {counters['active_users']}
+🎬 Jami kinolar: {counters['total_movies']}
+📢 Majburiy kanallar: {counters['total_channels']}
         """
         await message.answer("✅ Xush kelibsiz, Admin!\n\n" + stats, reply_markup=admin_panel(), parse_mode='HTML')
     else:
@@ -246,10 +471,10 @@ async def process_admin_password(message: Message, state: FSMContext):
 async def admin_logout(message: Message):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         return
 
-    db.logout_admin(user_id)
+    await db.logout_admin(user_id)
     await message.answer("👋 Admin paneldan chiqdingiz.", reply_markup=main_menu())
 
 
@@ -258,29 +483,84 @@ async def admin_logout(message: Message):
 async def show_statistics(message: Message):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
+    cache_stats = subscription_cache.stats()
+    throttled = throttling.stats()['dropped'] if throttling else "o'chirilgan"
+    counters = await db.get_statistics()
     stats = f"""
 📊 <b>Batafsil Statistika</b>
 
-👥 Jami foydalanuvchilar: {db.get_total_users()}
-✅ Faol foydalanuvchilar: {db.get_active_users()}
-🚫 Bloklangan: {db.get_blocked_users()}
-🎬 Jami kinolar: {db.get_total_movies()}
-📢 Majburiy kanallar: {len(db.get_all_channels())}
+👥 Jami foydalanuvchilar: {counters['total_users']}
+✅ Faol foydalanuvchilar: {counters['active_users']}
+🚫 Bloklangan: {counters['blocked_users']}
+🎬 Jami kinolar: {counters['total_movies']}
+📢 Majburiy kanallar: {counters['total_channels']}
+
+🗂 A'zolik keshi: {cache_stats['hits']} hit / {cache_stats['misses']} miss ({cache_stats['hit_rate']:.0%})
+🚦 Cheklangan so'rovlar: {throttled}
     """
 
     await message.answer(stats, parse_mode='HTML')
 
 
+@dp.message(Command('recount'))
+async def recount_statistics(message: Message):
+    """Statistika hisoblagichlarini jadvallar bilan solishtirib tuzatish"""
+    user_id = message.from_user.id
+
+    if not await is_admin_authenticated(user_id):
+        await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
+        return
+
+    corrected = await db.reconcile_counters()
+    if not corrected:
+        await message.answer("✅ Statistika hisoblagichlari to'g'ri.")
+        return
+
+    text = "🔄 <b>Hisoblagichlar tuzatildi:</b>\n\n"
+    for name, (old, actual) in corrected.items():
+        text += f"{name}: {old} → {actual}\n"
+    await message.answer(text, parse_mode='HTML')
+
+
+@dp.message(Command('perf'))
+async def show_performance(message: Message, command: CommandObject):
+    """/perf [reset] - handler, baza va Telegram API kechikishlari"""
+    user_id = message.from_user.id
+
+    if not await is_admin_authenticated(user_id):
+        await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
+        return
+
+    if not metrics:
+        await message.answer("📈 Metrikalar o'chirilgan. Yoqish uchun .env faylida METRICS_ENABLED=1 qiling.")
+        return
+
+    if (command.args or '').strip().lower() == 'reset':
+        metrics.reset()
+        await message.answer("✅ Metrikalar nollandi.")
+        return
+
+    minutes = (datetime.now().timestamp() - metrics.started) / 60
+    text = f"📈 <b>Unumdorlik</b> (so'nggi {minutes:.0f} daqiqa)\nsoni · p50 · p99 · xato\n"
+    for family, title in (('handler', 'Handlerlar'), ('db', 'Baza'), ('api', 'Telegram API'),
+                          ('outbound', 'Navbatda kutish')):
+        text += f"\n<b>{title}:</b>\n"
+        for name, histogram, errors in metrics.top(family):
+            text += (f"<code>{name}</code>: {histogram.count} · {histogram.quantile(0.5) * 1000:.1f}ms · "
+                     f"{histogram.quantile(0.99) * 1000:.1f}ms · {errors}\n")
+    await message.answer(text, parse_mode='HTML')
+
+
 # ============= KINO QO'SHISH =============
 @dp.message(F.text == "➕ Kino qo'shish")
 async def add_movie_start(message: Message, state: FSMContext):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
@@ -328,7 +608,9 @@ async def process_movie_file(message: Message, state: FSMContext):
     title = data['title']
     file_id = message.video.file_id
 
-    if db.add_movie(code, title, file_id):
+    if await db.add_movie(code, title, file_id):
+        inline_cache.clear()
+        movie_miss_cache.clear()
         await message.answer(f"✅ Kino muvaffaqiyatli qo'shildi!\n\n📝 Kod: {code}\n🎬 Nom: {title}",
                              reply_markup=admin_panel())
     else:
@@ -342,7 +624,7 @@ async def process_movie_file(message: Message, state: FSMContext):
 async def delete_movie_start(message: Message, state: FSMContext):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
@@ -358,10 +640,12 @@ async def process_delete_movie(message: Message, state: FSMContext):
         return
 
     code = message.text
-    movie = db.get_movie(code)
+    movie = await db.get_movie(code)
 
     if movie:
-        db.delete_movie(code)
+        await db.delete_movie(code)
+        inline_cache.clear()
+        movie_miss_cache.clear()
         await message.answer(f"✅ Kino o'chirildi!\n\n📝 Kod: {code}\n🎬 Nom: {movie[1]}", reply_markup=admin_panel())
     else:
         await message.answer("❌ Bu kod bilan kino topilmadi!", reply_markup=admin_panel())
@@ -369,12 +653,107 @@ async def process_delete_movie(message: Message, state: FSMContext):
     await state.clear()
 
 
+# ============= KINOLARNI IMPORT/EKSPORT =============
+# Telegram botlarga 20 MB dan katta faylni yuklab olishga ruxsat bermaydi
+IMPORT_MAX_FILE_SIZE = 20 * 1024 * 1024
+IMPORT_REPORT_LIMIT = 10
+
+
+@dp.message(Command('import'))
+async def import_movies_start(message: Message, command: CommandObject, state: FSMContext):
+    """/import [replace] - CSV/JSON fayldan kinolarni ommaviy qo'shish"""
+    user_id = message.from_user.id
+
+    if not await is_admin_authenticated(user_id):
+        await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
+        return
+
+    replace = (command.args or '').strip().lower() == 'replace'
+    await state.update_data(replace=replace)
+    await message.answer(
+        "📥 CSV yoki JSON faylni yuboring.\n\n"
+        "Ustunlar: <code>code, title, file_id</code> (ixtiyoriy: <code>added_date</code>)\n"
+        + ("♻️ Bazada bor kodlar yangilanadi." if replace else
+           "Bazada bor kodlar o'tkazib yuboriladi (yangilash uchun: /import replace)."),
+        parse_mode='HTML', reply_markup=cancel_button()
+    )
+    await state.set_state(ImportMovies.waiting_file)
+
+
+@dp.message(ImportMovies.waiting_file)
+async def process_import_file(message: Message, state: FSMContext):
+    if message.text == "❌ Bekor qilish":
+        await state.clear()
+        await message.answer("❌ Bekor qilindi.", reply_markup=admin_panel())
+        return
+
+    document = message.document
+    fmt = detect_format(document.file_name) if document else None
+    if not fmt:
+        await message.answer("❌ Iltimos, .csv yoki .json fayl yuboring!")
+        return
+    if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+        await message.answer("❌ Fayl juda katta (20 MB dan oshmasligi kerak).")
+        return
+
+    buffer = io.BytesIO()
+    await bot.download(document, destination=buffer)
+    try:
+        movies, errors = parse_movies(buffer.getvalue(), fmt)
+    except ValueError as e:
+        await message.answer(f"❌ {e}")
+        return
+
+    data = await state.get_data()
+    result = await db.import_movies(movies, replace=data.get('replace', False))
+    inline_cache.clear()
+    movie_miss_cache.clear()
+    await state.clear()
+
+    text = (f"✅ <b>Import yakunlandi</b>\n\n"
+            f"➕ Qo'shildi: {result['added']}\n"
+            f"♻️ Yangilandi: {result['updated']}\n"
+            f"⏭ Bazada bor (o'tkazildi): {len(result['duplicates']) - result['updated']}\n"
+            f"⚠️ Xatolar: {len(errors)}")
+    if result['duplicates'] and not result['updated']:
+        shown = html.escape(', '.join(result['duplicates'][:IMPORT_REPORT_LIMIT]))
+        text += f"\n\n<b>Bazada bor kodlar:</b> {shown}"
+        if len(result['duplicates']) > IMPORT_REPORT_LIMIT:
+            text += f" va yana {len(result['duplicates']) - IMPORT_REPORT_LIMIT} ta"
+    if errors:
+        text += "\n\n<b>Xatolar (qator: sabab):</b>\n" + html.escape('\n'.join(errors[:IMPORT_REPORT_LIMIT]))
+        if len(errors) > IMPORT_REPORT_LIMIT:
+            text += f"\n... va yana {len(errors) - IMPORT_REPORT_LIMIT} ta"
+    await message.answer(text, parse_mode='HTML', reply_markup=admin_panel())
+
+
+@dp.message(Command('export'))
+async def export_movies(message: Message, command: CommandObject):
+    """/export [json] - barcha kinolarni fayl sifatida olish (standart: CSV)"""
+    user_id = message.from_user.id
+
+    if not await is_admin_authenticated(user_id):
+        await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
+        return
+
+    fmt = 'json' if (command.args or '').strip().lower() == 'json' else 'csv'
+    # Katalog xotirada yig'ilmaydi - sahifalab vaqtinchalik faylga yoziladi
+    fd, path = tempfile.mkstemp(suffix=f'.{fmt}')
+    try:
+        with open(fd, 'w', encoding='utf-8', newline='') as f:
+            count = await write_movies(db.iter_movies(), f, fmt)
+        filename = f"movies_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}"
+        await message.answer_document(FSInputFile(path, filename=filename), caption=f"🎬 {count} ta kino")
+    finally:
+        os.remove(path)
+
+
 # ============= REKLAMA YUBORISH =============
 @dp.message(F.text == "📢 Reklama yuborish")
 async def broadcast_start(message: Message, state: FSMContext):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
@@ -393,34 +772,92 @@ async def process_broadcast(message: Message, state: FSMContext):
         await message.answer("❌ Bekor qilindi.", reply_markup=admin_panel())
         return
 
-    users = db.get_all_users()
-    success = 0
-    failed = 0
+    status_msg = await message.answer("📤 Reklama tayyorlanmoqda...")
+    job = await broadcaster.start(
+        message.chat.id, message.message_id,
+        admin_chat_id=message.chat.id, status_message_id=status_msg.message_id
+    )
+    run_in_background(report_broadcast_progress(job))
 
-    status_msg = await message.answer(f"📤 Yuborilmoqda...\n\n✅ Yuborildi: {success}\n❌ Xato: {failed}")
+    await message.answer("📤 Reklama fon rejimida yuborilmoqda. Asosiy menyu:", reply_markup=admin_panel())
+    await state.clear()
 
-    for user in users:
-        user_id = user[0]
-        try:
-            await message.copy_to(user_id)
-            success += 1
 
-            if success % 10 == 0:
-                await status_msg.edit_text(f"📤 Yuborilmoqda...\n\n✅ Yuborildi: {success}\n❌ Xato: {failed}")
+def broadcast_status_text(progress):
+    """Reklama holati matni"""
+    if progress['status'] == 'failed':
+        return (
+            f"⚠️ Reklama yuborish xato bilan to'xtadi!\n\n"
+            f"📊 Yuborilgan: {progress['processed']}/{progress['total']}\n"
+            f"✅ Yuborildi: {progress['success']}\n"
+            f"❌ Xato: {progress['failed']}"
+        )
+    if progress['done']:
+        return (
+            f"✅ Reklama yuborish yakunlandi!\n\n"
+            f"📊 Jami: {progress['total']}\n"
+            f"✅ Yuborildi: {progress['success']}\n"
+            f"❌ Xato: {progress['failed']}\n"
+            f"📵 Ro'yxatdan chiqarildi: {progress['unreachable']}"
+        )
 
-            await asyncio.sleep(0.05)
-        except Exception as e:
-            failed += 1
-            logging.error(f"Reklama yuborishda xato: {e}")
-
-    await status_msg.edit_text(
-        f"✅ Reklama yuborish yakunlandi!\n\n"
-        f"📊 Jami: {len(users)}\n"
-        f"✅ Yuborildi: {success}\n"
-        f"❌ Xato: {failed}"
+    if progress['eta'] is None:
+        eta = "—"
+    elif progress['eta'] >= 60:
+        eta = f"{progress['eta'] / 60:.0f} daqiqa"
+    else:
+        eta = f"{progress['eta']:.0f} soniya"
+    return (
+        f"📤 Yuborilmoqda... ({progress['processed']}/{progress['total']})\n\n"
+        f"✅ Yuborildi: {progress['success']}\n"
+        f"❌ Xato: {progress['failed']}\n"
+        f"⚡️ Tezlik: {progress['rate']:.1f} xabar/soniya\n"
+        f"⏳ Qoldi: {eta}"
     )
-    await message.answer("Asosiy menyu:", reply_markup=admin_panel())
-    await state.clear()
+
+
+async def report_broadcast_progress(job):
+    """Admin status xabarini vazifa holatidan vaqti-vaqti bilan yangilash"""
+    if not job.admin_chat_id or not job.status_message_id:
+        return
+
+    last_text = None
+    while True:
+        await asyncio.wait({job.task}, timeout=BROADCAST_PROGRESS_INTERVAL)
+        text = broadcast_status_text(job.progress())
+        if text != last_text:
+            try:
+                await bot.edit_message_text(text, chat_id=job.admin_chat_id, message_id=job.status_message_id)
+                last_text = text
+            except Exception as e:
+                logging.error(f"Reklama holatini yangilashda xato: {e}")
+        # Vazifa to'xtatilgan (bot o'chirilmoqda) yoki xato bilan tugagan bo'lsa ham chiqiladi
+        if job.done or job.task.done():
+            return
+
+
+@dp.message(F.text == "📋 Reklamalar")
+async def show_broadcast_jobs(message: Message):
+    user_id = message.from_user.id
+
+    if not await is_admin_authenticated(user_id):
+        await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
+        return
+
+    jobs = await db.get_broadcast_jobs(10)
+
+    if not jobs:
+        await message.answer("📋 Hozircha reklamalar yuborilmagan.")
+        return
+
+    statuses = {'running': "⏳ Yuborilmoqda", 'finished': "✅ Yakunlangan", 'failed': "⚠️ Xato bilan to'xtagan"}
+    text = "📋 <b>So'nggi reklamalar:</b>\n\n"
+    for job_id, status, total, success, failed, created, finished in jobs:
+        text += f"#{job_id} {statuses.get(status, status)}\n"
+        text += f"   📊 {success + failed}/{total} (✅ {success}, ❌ {failed})\n"
+        text += f"   📅 {created}" + (f" → {finished}" if finished else "") + "\n\n"
+
+    await message.answer(text, parse_mode='HTML')
 
 
 # ============= HABAR YUBORISH =============
@@ -428,7 +865,7 @@ async def process_broadcast(message: Message, state: FSMContext):
 async def send_message_start(message: Message, state: FSMContext):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
@@ -445,7 +882,7 @@ async def process_send_message_user(message: Message, state: FSMContext):
 
     try:
         target_user_id = int(message.text)
-        if not db.user_exists(target_user_id):
+        if not await db.user_exists(target_user_id):
             await message.answer("❌ Bu foydalanuvchi topilmadi!")
             return
 
@@ -480,7 +917,7 @@ async def process_send_message_text(message: Message, state: FSMContext):
 async def user_management_menu(message: Message):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
@@ -492,7 +929,7 @@ async def user_management_menu(message: Message):
 async def block_user_start(message: Message, state: FSMContext):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
@@ -509,11 +946,11 @@ async def process_block_user(message: Message, state: FSMContext):
 
     try:
         target_user_id = int(message.text)
-        if not db.user_exists(target_user_id):
+        if not await db.user_exists(target_user_id):
             await message.answer("❌ Bu foydalanuvchi topilmadi!")
             return
 
-        db.block_user(target_user_id)
+        await db.block_user(target_user_id)
         await message.answer(f"✅ Foydalanuvchi bloklandi! (ID: {target_user_id})", reply_markup=user_management())
 
         try:
@@ -531,7 +968,7 @@ async def process_block_user(message: Message, state: FSMContext):
 async def unblock_user_start(message: Message, state: FSMContext):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
@@ -548,11 +985,11 @@ async def process_unblock_user(message: Message, state: FSMContext):
 
     try:
         target_user_id = int(message.text)
-        if not db.user_exists(target_user_id):
+        if not await db.user_exists(target_user_id):
             await message.answer("❌ Bu foydalanuvchi topilmadi!")
             return
 
-        db.unblock_user(target_user_id)
+        await db.unblock_user(target_user_id)
         await message.answer(f"✅ Foydalanuvchi blokdan chiqarildi! (ID: {target_user_id})",
                              reply_markup=user_management())
 
@@ -571,7 +1008,7 @@ async def process_unblock_user(message: Message, state: FSMContext):
 async def get_user_info_start(message: Message, state: FSMContext):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
@@ -588,7 +1025,7 @@ async def process_get_user_info(message: Message, state: FSMContext):
 
     try:
         target_user_id = int(message.text)
-        user_info = db.get_user_info(target_user_id)
+        user_info = await db.get_user_info(target_user_id)
 
         if not user_info:
             await message.answer("❌ Bu foydalanuvchi topilmadi!")
@@ -619,7 +1056,7 @@ async def process_get_user_info(message: Message, state: FSMContext):
 async def channels_menu(message: Message):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
@@ -630,7 +1067,7 @@ async def channels_menu(message: Message):
 async def add_channel_start(message: Message, state: FSMContext):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
@@ -657,7 +1094,7 @@ async def process_add_channel(message: Message, state: FSMContext):
         channel_id = str(chat.id)
         channel_username = chat.username if chat.username else channel_id
 
-        if db.add_channel(channel_id, f"@{channel_username}"):
+        if await db.add_channel(channel_id, f"@{channel_username}"):
             await message.answer(
                 f"✅ Kanal muvaffaqiyatli qo'shildi!\n\n"
                 f"📺 ID: {channel_id}\n"
@@ -677,7 +1114,7 @@ async def process_add_channel(message: Message, state: FSMContext):
 async def delete_channel_start(message: Message, state: FSMContext):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
@@ -696,7 +1133,7 @@ async def process_delete_channel(message: Message, state: FSMContext):
         return
 
     channel_id = message.text.strip()
-    db.delete_channel(channel_id)
+    await db.delete_channel(channel_id)
     await message.answer(f"✅ Kanal o'chirildi! (ID: {channel_id})", reply_markup=channels_management())
     await state.clear()
 
@@ -705,11 +1142,11 @@ async def process_delete_channel(message: Message, state: FSMContext):
 async def list_channels(message: Message):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
-    channels = db.get_all_channels()
+    channels = await db.get_all_channels()
 
     if not channels:
         await message.answer("📋 Hozircha majburiy kanallar yo'q.")
@@ -727,46 +1164,109 @@ async def list_channels(message: Message):
 async def back_to_admin(message: Message):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
+    counters = await db.get_statistics()
     stats = f"""
 📊 <b>Statistika</b>
 
-👥 Jami foydalanuvchilar: {db.get_total_users()}
-✅ Faol foydalanuvchilar: {db.get_active_users()}
-🎬 Jami kinolar: {db.get_total_movies()}
-📢 Majburiy kanallar: {len(db.get_all_channels())}
+👥 Jami foydalanuvchilar: {counters['total_users']}
+✅ Faol foydalanuvchilar: {counters['active_users']}
+🎬 Jami kinolar: {counters['total_movies']}
+📢 Majburiy kanallar: {counters['total_channels']}
     """
     await message.answer(stats, reply_markup=admin_panel(), parse_mode='HTML')
 
 
 # ============= KINOLAR RO'YXATI =============
+MOVIES_PAGE_SIZE = 20
+
+
+STALE_LIST_TEXT = "♻️ Ro'yxat yangilangan. Iltimos, uni qaytadan oching."
+
+
+def parse_page_cursor(page, direction, date, row_id):
+    """Sahifalash tugmasidagi qiymatlarni tekshirish: (sahifa, (sana, id)), noto'g'ri bo'lsa ValueError"""
+    page = int(page)
+    if page < 1 or direction not in ('a', 'b'):
+        raise ValueError(direction)
+    return page, (date, int(row_id))
+
+
+async def movies_page(page=1, after=None, before=None):
+    """Kinolar katalogining bitta sahifasi: (matn, klaviatura)"""
+    rows = await db.get_movies_page(after=after, before=before, limit=MOVIES_PAGE_SIZE)
+    if before is not None and len(rows) < MOVIES_PAGE_SIZE:
+        # Boshiga yetdik (oraliqda yangi kinolar qo'shilgan bo'lishi mumkin)
+        page, rows = 1, await db.get_movies_page(limit=MOVIES_PAGE_SIZE)
+
+    total = await db.get_total_movies()
+    total_pages = max(page, (total + MOVIES_PAGE_SIZE - 1) // MOVIES_PAGE_SIZE)
+    if len(rows) < MOVIES_PAGE_SIZE:
+        total_pages = page
+
+    text = f"🎬 <b>Kinolar ro'yxati</b> (jami {total} ta):\n\n"
+    for i, (movie_id, code, title, added_date) in enumerate(rows, (page - 1) * MOVIES_PAGE_SIZE + 1):
+        text += f"{i}. <b>{title}</b>\n"
+        text += f"   📝 Kod: <code>{code}</code>\n"
+        text += f"   📅 Qo'shilgan: {added_date}\n\n"
+
+    # Kursor: sahifaning birinchi/oxirgi kinosi (added_date, id) - callback_data ichida
+    keyboard = pagination_keyboard(
+        page, total_pages, 'movies',
+        prev_cursor=f"b_{rows[0][3]}_{rows[0][0]}" if rows else None,
+        next_cursor=f"a_{rows[-1][3]}_{rows[-1][0]}" if rows else None
+    )
+    return text, keyboard
+
+
 @dp.message(F.text == "🎬 Kinolar ro'yxati")
 async def show_movies_list(message: Message):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
-    movies = db.get_all_movies()
-
-    if not movies:
+    if not await db.get_total_movies():
         await message.answer("📋 Hozircha kinolar ro'yxati bo'sh.")
         return
 
-    text = "🎬 <b>Kinolar ro'yxati:</b>\n\n"
-    for i, (code, title, added_date) in enumerate(movies[:20], 1):  # Faqat 20 ta ko'rsatish
-        text += f"{i}. <b>{title}</b>\n"
-        text += f"   📝 Kod: <code>{code}</code>\n"
-        text += f"   📅 Qo'shilgan: {added_date}\n\n"
+    text, keyboard = await movies_page()
+    await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
 
-    if len(movies) > 20:
-        text += f"\n... va yana {len(movies) - 20} ta kino"
 
-    await message.answer(text, parse_mode='HTML')
+@dp.callback_query(F.data.startswith('movies_'))
+async def movies_page_callback(callback: CallbackQuery):
+    if not await is_admin_authenticated(callback.from_user.id):
+        await callback.answer("❌ Admin huquqi yo'q.", show_alert=True)
+        return
+
+    # movies_<sahifa>_<a|b>_<added_date>_<id>
+    try:
+        _, page, direction, cursor = callback.data.split('_', 3)
+        added_date, movie_id = cursor.rsplit('_', 1)
+        page, cursor = parse_page_cursor(page, direction, added_date, movie_id)
+    except ValueError:
+        # Eski formatdagi (movies_2) yoki buzilgan tugma
+        await callback.answer(STALE_LIST_TEXT, show_alert=True)
+        return
+
+    if direction == 'a':
+        text, keyboard = await movies_page(page, after=cursor)
+    else:
+        text, keyboard = await movies_page(page, before=cursor)
+
+    await callback.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
+    await callback.answer()
+
+
+@dp.callback_query(F.data == 'current_page')
+async def current_page_callback(callback: CallbackQuery):
+    # Sahifa raqami tugmasi hech narsa qilmaydi
+    await callback.answer()
 
 
 # ============= MA'LUMOT VA ALOQA =============
@@ -807,39 +1307,172 @@ Savollar va takliflar uchun:
 
 
 # ============= BARCHA USERLAR RO'YXATI =============
+USERS_PAGE_SIZE = 15
+
+USER_FILTERS_HELP = """
+🔎 <b>Foydalanuvchilarni filtrlash:</b>
+
+<code>/users blocked</code> - bloklanganlar (<code>active</code> - faollar)
+<code>/users nophone</code> - telefon yubormaganlar (<code>phone</code> - yuborganlar)
+<code>/users from=2024-01-01 to=2024-12-31</code> - qo'shilgan sana oralig'i
+<code>/users @ali</code> - username shu bilan boshlanadiganlar
+
+Filtrlarni birga yozish mumkin: <code>/users active nophone from=2024-06-01</code>
+"""
+
+
+def parse_user_filters(args):
+    """/users argumentlaridan filtrlar lug'ati (tushunarsiz so'z bo'lsa - ValueError)"""
+    filters = {}
+    for token in (args or '').split():
+        word = token.lower()
+        if word in ('blocked', 'active'):
+            filters['blocked'] = word == 'blocked'
+        elif word in ('phone', 'nophone'):
+            filters['has_phone'] = word == 'phone'
+        elif word.startswith('from='):
+            date = datetime.strptime(token[5:], '%Y-%m-%d').strftime('%Y-%m-%d')
+            filters['joined_from'] = f"{date} 00:00:00"
+        elif word.startswith('to='):
+            date = datetime.strptime(token[3:], '%Y-%m-%d').strftime('%Y-%m-%d')
+            filters['joined_to'] = f"{date} 23:59:59"
+        elif token.startswith('@') and len(token) > 1:
+            filters['username_prefix'] = token[1:]
+        else:
+            raise ValueError(token)
+    return filters
+
+
+def describe_user_filters(filters):
+    """Filtrlarni sarlavha uchun qisqa matnga aylantirish"""
+    parts = []
+    if 'blocked' in filters:
+        parts.append("bloklangan" if filters['blocked'] else "faol")
+    if 'has_phone' in filters:
+        parts.append("telefonli" if filters['has_phone'] else "telefonsiz")
+    if 'joined_from' in filters:
+        parts.append(f"{filters['joined_from'][:10]} dan")
+    if 'joined_to' in filters:
+        parts.append(f"{filters['joined_to'][:10]} gacha")
+    if 'username_prefix' in filters:
+        parts.append(f"@{filters['username_prefix']}...")
+    return ", ".join(parts)
+
+
+def user_filters_key(filters):
+    """Filtrlarning qisqa izi (callback_data uchun): filtrsiz - '0'"""
+    if not filters:
+        return '0'
+    return hashlib.sha1(repr(sorted(filters.items())).encode()).hexdigest()[:6]
+
+
+async def users_page(filters, page=1, after=None, before=None):
+    """Foydalanuvchilar ro'yxatining bitta sahifasi: (matn, klaviatura)"""
+    rows = await db.get_users_page(filters, after=after, before=before, limit=USERS_PAGE_SIZE)
+    if before is not None and len(rows) < USERS_PAGE_SIZE:
+        # Boshiga yetdik (oraliqda yangi foydalanuvchilar qo'shilgan bo'lishi mumkin)
+        page, rows = 1, await db.get_users_page(filters, limit=USERS_PAGE_SIZE)
+
+    total = await db.count_users(filters)
+    total_pages = max(page, (total + USERS_PAGE_SIZE - 1) // USERS_PAGE_SIZE)
+    if len(rows) < USERS_PAGE_SIZE:
+        total_pages = page
+
+    text = "📋 <b>Foydalanuvchilar</b>"
+    if filters:
+        text += f" ({describe_user_filters(filters)})"
+    text += ":\n\n"
+    if not rows:
+        text += "Hech kim topilmadi.\n\n"
+    for i, (uid, name, username, phone, joined, blocked) in enumerate(rows, (page - 1) * USERS_PAGE_SIZE + 1):
+        status = "🚫" if blocked else "✅"
+        username_text = f"@{username}" if username else "Username yo'q"
+        text += f"{i}. {status} <b>{name}</b>\n"
+        text += f"   🆔 ID: <code>{uid}</code>\n"
+        text += f"   👤 {username_text}\n"
+        text += f"   📱 {phone or 'Telefon yoq'}\n"
+        text += f"   📅 {joined}\n\n"
+    text += f"📊 Jami: {total} ta foydalanuvchi"
+
+    # Kursor: sahifaning birinchi/oxirgi foydalanuvchisi (joined_date, user_id) va filtr izi -
+    # filtrning o'zi callback_data ga sig'maydi (64 bayt), u FSM da saqlanadi
+    key = user_filters_key(filters)
+    keyboard = pagination_keyboard(
+        page, total_pages, 'users',
+        prev_cursor=f"b_{key}_{rows[0][4]}_{rows[0][0]}" if rows else None,
+        next_cursor=f"a_{key}_{rows[-1][4]}_{rows[-1][0]}" if rows else None
+    )
+    return text, keyboard
+
+
 @dp.message(F.text == "📋 Barcha userlar")
-async def show_all_users(message: Message):
+async def show_all_users(message: Message, state: FSMContext):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
-    all_users = db.cursor.execute('''
-        SELECT user_id, full_name, username, phone, joined_date, is_blocked
-        FROM users
-        ORDER BY joined_date DESC
-        LIMIT 15
-    ''').fetchall()
-
-    if not all_users:
+    if not await db.get_total_users():
         await message.answer("📋 Hozircha foydalanuvchilar yo'q.")
         return
 
-    text = "📋 <b>So'nggi 15 ta foydalanuvchi:</b>\n\n"
-    for i, (uid, name, username, phone, joined, blocked) in enumerate(all_users, 1):
-        status = "🚫" if blocked else "✅"
-        username_text = f"@{username}" if username else "Username yo'q"
-        text += f"{i}. {status} <b>{name}</b>\n"
-        text += f"   🆔 ID: <code>{uid}</code>\n"
-        text += f"   👤 {username_text}\n"
-        text += f"   📱 {phone or 'Telefon yoq'}\n"
-        text += f"   📅 {joined}\n\n"
+    # Filtr FSM ma'lumotlarida saqlanadi - sahifalash tugmalari shu filtr bilan ishlaydi
+    await state.update_data(user_filters={})
+    text, keyboard = await users_page({})
+    await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
+    await message.answer(USER_FILTERS_HELP, parse_mode='HTML')
 
-    total = db.get_total_users()
-    text += f"📊 Jami: {total} ta foydalanuvchi"
 
-    await message.answer(text, parse_mode='HTML')
+@dp.message(Command('users'))
+async def cmd_users(message: Message, command: CommandObject, state: FSMContext):
+    """Filtrlangan foydalanuvchilar ro'yxati"""
+    if not await is_admin_authenticated(message.from_user.id):
+        await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
+        return
+
+    try:
+        filters = parse_user_filters(command.args)
+    except ValueError:
+        await message.answer("❌ Filtr tushunarsiz.\n" + USER_FILTERS_HELP, parse_mode='HTML')
+        return
+
+    await state.update_data(user_filters=filters)
+    text, keyboard = await users_page(filters)
+    await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
+
+
+@dp.callback_query(F.data.startswith('users_'))
+async def users_page_callback(callback: CallbackQuery, state: FSMContext):
+    if not await is_admin_authenticated(callback.from_user.id):
+        await callback.answer("❌ Admin huquqi yo'q.", show_alert=True)
+        return
+
+    # users_<sahifa>_<a|b>_<filtr izi>_<joined_date>_<user_id>
+    try:
+        _, page, direction, key, cursor = callback.data.split('_', 4)
+        joined_date, cursor_user_id = cursor.rsplit('_', 1)
+        page, cursor = parse_page_cursor(page, direction, joined_date, cursor_user_id)
+    except ValueError:
+        # Eski formatdagi yoki buzilgan tugma
+        await callback.answer(STALE_LIST_TEXT, show_alert=True)
+        return
+
+    filters = {}
+    if key != user_filters_key(filters):
+        # Filtr FSM da: state.clear() yoki muddati o'tgan bo'lsa, filtrsiz ro'yxatga o'tib ketmaymiz
+        filters = (await state.get_data()).get('user_filters') or {}
+        if key != user_filters_key(filters):
+            await callback.answer("♻️ Ro'yxat filtri eskirgan. /users bilan qaytadan oching.", show_alert=True)
+            return
+
+    if direction == 'a':
+        text, keyboard = await users_page(filters, page, after=cursor)
+    else:
+        text, keyboard = await users_page(filters, page, before=cursor)
+
+    await callback.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
+    await callback.answer()
 
 
 # ============= KANALLARNI YANGILASH =============
@@ -847,11 +1480,11 @@ async def show_all_users(message: Message):
 async def refresh_channels(message: Message):
     user_id = message.from_user.id
 
-    if not is_admin_authenticated(user_id):
+    if not await is_admin_authenticated(user_id):
         await message.answer("❌ Admin huquqi yo'q. Avval /admin buyrug'i bilan kirishingiz kerak.")
         return
 
-    channels = db.get_all_channels()
+    channels = await db.get_all_channels()
 
     if not channels:
         await message.answer("📋 Hozircha kanallar yo'q.")
@@ -892,12 +1525,15 @@ async def request_movie_code(message: Message):
     await message.answer("🎬 Kino kodini yuboring:")
 
 
-@dp.message(F.text)
+@dp.message(F.text, flags={'throttle': 'movie'})
 async def handle_movie_code(message: Message):
     user_id = message.from_user.id
 
+    # Foydalanuvchi holati (bitta keshlangan so'rov)
+    gate = await db.get_user_gate(user_id)
+
     # Bloklangan foydalanuvchini tekshirish
-    if db.is_user_blocked(user_id):
+    if gate['blocked']:
         await message.answer("❌ Siz bloklangansiz. Botdan foydalana olmaysiz.")
         return
 
@@ -907,7 +1543,7 @@ async def handle_movie_code(message: Message):
                       "🚪 Admin paneldan chiqish", "◀️ Ortga qaytish", "➕ Yangi kanal qo'shish",
                       "🗑 Kanalni o'chirish", "📋 Kanallar ro'yxati", "🔄 Kanallarni yangilash",
                       "🚫 Foydalanuvchini bloklash", "✅ Blokdan chiqarish", "🔍 Foydalanuvchi ma'lumoti",
-                      "📋 Barcha userlar"]
+                      "📋 Barcha userlar", "📋 Reklamalar"]
 
     if message.text in admin_commands:
         return
@@ -917,19 +1553,22 @@ async def handle_movie_code(message: Message):
         return
 
     # Foydalanuvchi mavjudligini tekshirish
-    if not db.user_exists(user_id):
+    if not gate['exists']:
         await message.answer("📱 Iltimos avval /start buyrug'ini yuboring.")
         return
 
+    # Reklama yetib bormay qolgan foydalanuvchi botga qaytdi
+    if not gate['reachable']:
+        await db.mark_user_reachable(user_id)
+
     # Telefon raqami borligini tekshirish
-    user_info = db.get_user_info(user_id)
-    if not user_info[1]:
+    if not gate['has_phone']:
         await message.answer("📱 Botdan foydalanish uchun telefon raqamingizni yuboring.", reply_markup=phone_button())
         return
 
     # Kanalga a'zolikni tekshirish
     if not await check_subscription(user_id):
-        channels = db.get_all_channels()
+        channels = await db.get_all_channels()
         await message.answer(
             "📢 Botdan foydalanish uchun quyidagi kanallarga a'zo bo'ling:",
             reply_markup=channels_keyboard(channels)
@@ -943,14 +1582,33 @@ async def handle_movie_code(message: Message):
     if not code or code.startswith('/'):
         return
 
-    movie = db.get_movie(code)
+    movie = await db.get_movie(code)
 
     if not movie:
-        await message.answer("❌ Bu kod bilan kino topilmadi. Kodni tekshirib qayta urinib ko'ring.")
+        # Kod xato terilgan yoki kino nomi yozilgan bo'lishi mumkin - o'xshashlarini taklif qilamiz.
+        # Nom bo'yicha qidiruv faqat nomga o'xshash matnlar uchun; kodlar xotiradagi indeksdan
+        key = ' '.join(code.casefold().split())
+        suggestions = []
+        if MOVIE_SUGGESTIONS_LIMIT and not movie_miss_cache.get(key):
+            generation = movie_miss_cache.generation
+            suggestions = await db.search_movies(code, limit=MOVIE_SUGGESTIONS_LIMIT,
+                                                 titles=looks_like_title(code))
+            # Qidiruv paytida kinolar o'zgargan bo'lsa, eskirgan natija eslab qolinmaydi
+            if not suggestions and generation == movie_miss_cache.generation:
+                movie_miss_cache.set(key, True)
+        if suggestions:
+            await message.answer("🔎 Bu kod bilan kino topilmadi. Balki shulardan birini qidiryapsiz:",
+                                 reply_markup=movie_suggestions(suggestions))
+        else:
+            await message.answer("❌ Bu kod bilan kino topilmadi. Kodni tekshirib qayta urinib ko'ring.")
         return
 
+    await send_movie(message, movie)
+
+
+async def send_movie(message, movie):
+    """Kinoni (code, title, file_id) foydalanuvchiga yuborish"""
     try:
-        # Kinoni yuborish
         await message.answer_video(
             movie[2],  # file_id
             caption=f"🎬 {movie[1]}\n\n✅ Kino muvaffaqiyatli yuklab olindi!"
@@ -960,10 +1618,149 @@ async def handle_movie_code(message: Message):
         logging.error(f"Kino yuborishda xato: {e}")
 
 
+@dp.callback_query(F.data.startswith('movie_'), flags={'throttle': 'movie'})
+async def movie_suggestion_callback(callback: CallbackQuery):
+    """Qidiruv taklifi tugmasi bosildi - kino kodi yuborilgandagidek tekshirib yuborish"""
+    user_id = callback.from_user.id
+    gate = await db.get_user_gate(user_id)
+
+    if gate['blocked']:
+        await callback.answer("❌ Siz bloklangansiz. Botdan foydalana olmaysiz.", show_alert=True)
+        return
+
+    if not gate['exists'] or not gate['has_phone']:
+        await callback.answer("📱 Iltimos avval /start buyrug'ini yuboring.", show_alert=True)
+        return
+
+    if not await check_subscription(user_id):
+        await callback.answer("📢 Avval barcha kanallarga a'zo bo'ling!", show_alert=True)
+        return
+
+    movie = await db.get_movie(callback.data[len('movie_'):])
+    if not movie:
+        await callback.answer("❌ Kino topilmadi.", show_alert=True)
+        return
+
+    await callback.answer()
+    await send_movie(callback.message, movie)
+
+
+# ============= INLINE REJIM =============
+async def find_inline_movies(query):
+    """Inline so'rov uchun kinolar: har bir so'rov matni (yozilayotgan prefikslar ham) keshlanadi"""
+    key = ' '.join(query.split())
+    movies = inline_cache.get(key)
+    if movies is None:
+        if key:
+            movies = await db.search_movies(key, limit=INLINE_RESULTS_LIMIT)
+        else:
+            # Bo'sh so'rov - eng yangi kinolar
+            rows = await db.get_movies_page(limit=INLINE_RESULTS_LIMIT)
+            movies = [db.movie_index[code] for _, code, _, _ in rows if code in db.movie_index]
+        inline_cache.set(key, movies)
+    return movies
+
+
+@dp.inline_query(flags={'throttle': 'inline'})
+async def inline_movie_search(inline_query: InlineQuery):
+    """@bot <kod yoki nom> - kinoni istalgan chatga yuborish (file_id orqali, qayta yuklamasdan)"""
+    user_id = inline_query.from_user.id
+    gate = await db.get_user_gate(user_id)
+
+    # Natija foydalanuvchining obunasiga bog'liq, shuning uchun Telegram keshi shaxsiy (is_personal)
+    if gate['blocked'] or not gate['exists'] or not gate['has_phone'] or not await check_subscription(user_id):
+        await inline_query.answer(
+            [], cache_time=0, is_personal=True,
+            button=InlineQueryResultsButton(text="🎬 Botdan foydalanish uchun botga o'ting", start_parameter='inline')
+        )
+        return
+
+    movies = await find_inline_movies(inline_query.query)
+    results = [
+        InlineQueryResultCachedVideo(
+            id=str(i),
+            video_file_id=file_id,
+            title=title or code,
+            description=f"📝 Kod: {code}",
+            caption=f"🎬 {title}"
+        )
+        for i, (code, title, file_id) in enumerate(movies)
+    ]
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=True)
+
+
 # ============= BOTNI ISHGA TUSHIRISH =============
+async def reload_movie_index_periodically():
+    """Kinolar indeksini vaqti-vaqti bilan bazadan yangilash"""
+    while True:
+        await asyncio.sleep(MOVIE_INDEX_RELOAD_SECONDS)
+        try:
+            if await db.reload_movie_index():
+                # Inline natijalarda eski nom/file_id qolmasin
+                inline_cache.clear()
+                movie_miss_cache.clear()
+                logging.info(f"Kinolar indeksi yangilandi: {len(db.movie_index)} ta kino")
+        except Exception as e:
+            logging.error(f"Kinolar indeksini yangilashda xato: {e}")
+
+
+async def purge_fsm_states_periodically():
+    """Muddati o'tgan FSM holatlarini soatiga bir marta tozalash"""
+    while True:
+        try:
+            purged = await storage.purge()
+            if purged:
+                logging.info(f"Eskirgan FSM holatlari o'chirildi: {purged} ta")
+        except Exception as e:
+            logging.error(f"FSM holatlarini tozalashda xato: {e}")
+        await asyncio.sleep(3600)
+
+
+async def on_startup(resume_broadcasts=True, metrics_port=METRICS_PORT):
+    """Fon vazifalarini ishga tushirish (polling, webhook va cluster worker uchun umumiy)"""
+    global metrics_runner
+    if metrics and metrics_port:
+        metrics_runner = await start_metrics_server(metrics, METRICS_HOST, metrics_port)
+        logging.info(f"Metrikalar: http://{METRICS_HOST}:{metrics_port}/metrics")
+
+    # Tez-tez bajariladigan so'rovlar indekssiz qolmaganini tekshirish
+    for name, plan in (await db.check_query_plans()).items():
+        logging.warning(f"So'rov indeks ishlatmayapti ({name}): {'; '.join(plan)}")
+
+    if MOVIE_INDEX_RELOAD_SECONDS > 0:
+        run_in_background(reload_movie_index_periodically())
+    if isinstance(storage, SQLiteStorage):
+        run_in_background(purge_fsm_states_periodically())
+
+    # Qayta ishga tushishdan oldin tugamay qolgan reklamalarni davom ettirish
+    if resume_broadcasts:
+        for job in await broadcaster.resume():
+            run_in_background(report_broadcast_progress(job))
+
+
+async def on_shutdown():
+    """Reklamalarni to'xtatish, fon tasklarni bekor qilish va bazani yopish"""
+    await broadcaster.stop()
+    for task in list(background_tasks):
+        task.cancel()
+    if metrics_runner:
+        await metrics_runner.cleanup()
+    if scheduler:
+        await scheduler.close()
+    await db.close()
+
+
 async def main():
     logging.info("Bot ishga tushmoqda...")
-    await dp.start_polling(bot)
+    await on_startup()
+    try:
+        if BOT_MODE == 'webhook':
+            await run_webhook(dp, bot, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                              url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await on_shutdown()
 
 
 if __name__ == "__main__":
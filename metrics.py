@@ -0,0 +1,203 @@
+import bisect
+import functools
+import inspect
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+
+# Gistogramma chegaralari (soniya) - Prometheus standartiga yaqin
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Oila -> (metrika nomi, yorliq nomi, tavsif)
+FAMILIES = {
+    'handler': ('bot_handler_seconds', 'handler', "Handler bajarilish vaqti"),
+    'db': ('bot_db_seconds', 'method', "Database metodlari bajarilish vaqti"),
+    'api': ('bot_telegram_api_seconds', 'method', "Telegram Bot API so'rovlari vaqti"),
+    'outbound': ('bot_outbound_wait_seconds', 'lane', "Chiquvchi so'rovlarning limit navbatida kutish vaqti"),
+}
+
+
+# ============= GISTOGRAMMA =============
+class Histogram:
+    """Belgilangan chegarali kechikish gistogrammasi (xotira - o'zgarmas)"""
+
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """Taxminiy kvantil (chegara ichida chiziqli interpolyatsiya, histogram_quantile kabi)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                if i == len(BUCKETS):
+                    return BUCKETS[-1]
+                lower = BUCKETS[i - 1] if i else 0.0
+                return lower + (BUCKETS[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return BUCKETS[-1]
+
+
+# ============= METRIKALAR REESTRI =============
+class Metrics:
+    """Handler, Database va Telegram API kechikishlari hamda xatolar soni.
+
+    Faqat event loop oqimidan yoziladi, shuning uchun qulf kerak emas.
+    Metrikalar o'chirilgan bo'lsa hech narsa ulanmaydi (setup_metrics ga qarang),
+    ya'ni qo'shimcha xarajat nolga teng.
+    """
+
+    def __init__(self):
+        self.histograms = {family: {} for family in FAMILIES}
+        self.errors = {family: {} for family in FAMILIES}
+        self.started = time.time()
+
+    def observe(self, family, name, seconds, error=None):
+        histogram = self.histograms[family].get(name)
+        if histogram is None:
+            histogram = self.histograms[family][name] = Histogram()
+        histogram.observe(seconds)
+        if error is not None:
+            errors = self.errors[family]
+            errors[(name, error)] = errors.get((name, error), 0) + 1
+
+    def reset(self):
+        """Barcha qiymatlarni nollash"""
+        self.__init__()
+
+    def top(self, family, limit=10):
+        """Umumiy vaqt bo'yicha eng og'ir nomlar: [(name, histogram, xatolar soni)]"""
+        errors = {}
+        for (name, _), count in self.errors[family].items():
+            errors[name] = errors.get(name, 0) + count
+        items = sorted(self.histograms[family].items(), key=lambda item: item[1].sum, reverse=True)
+        return [(name, histogram, errors.get(name, 0)) for name, histogram in items[:limit]]
+
+    def render(self):
+        """Prometheus text formatidagi natija"""
+        lines = [
+            "# HELP bot_uptime_seconds Metrikalar yig'ila boshlangandan beri o'tgan vaqt",
+            '# TYPE bot_uptime_seconds gauge',
+            f'bot_uptime_seconds {time.time() - self.started:.3f}',
+        ]
+        for family, (metric, label, help_text) in FAMILIES.items():
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} histogram')
+            for name, histogram in sorted(self.histograms[family].items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{label}="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{{label}="{name}"}} {histogram.sum:.6f}')
+                lines.append(f'{metric}_count{{{label}="{name}"}} {histogram.count}')
+
+            errors_metric = metric.replace('_seconds', '_errors_total')
+            lines.append(f'# HELP {errors_metric} {help_text}: xatolar soni')
+            lines.append(f'# TYPE {errors_metric} counter')
+            for (name, error), count in sorted(self.errors[family].items()):
+                lines.append(f'{errors_metric}{{{label}="{name}",error="{error}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+# ============= ULANISH NUQTALARI =============
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Har bir handlerning bajarilish vaqti (filtrlardan keyin - inner middleware)"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    async def __call__(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        error = None
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.metrics.observe('handler', name, time.perf_counter() - started, error)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Telegram Bot API so'rovlari vaqti va xatolari (metod nomi bo'yicha)"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    async def __call__(self, make_request, bot, method):
+        error = None
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.metrics.observe('api', type(method).__name__, time.perf_counter() - started, error)
+
+
+def instrument(obj, metrics, family='db'):
+    """Obyektning barcha ochiq async metodlarini vaqt o'lchaydigan o'ramga almashtirish.
+
+    O'ram obyektning o'ziga (klassiga emas) yoziladi; o'lchangan vaqt navbatda
+    kutish (writer oynasi, reader oqimlari) bilan birga - handler ko'radigan vaqt.
+    """
+    def timed(name, method):
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            error = None
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                metrics.observe(family, name, time.perf_counter() - started, error)
+        return wrapper
+
+    for name, method in inspect.getmembers(obj, inspect.iscoroutinefunction):
+        if not name.startswith('_'):
+            setattr(obj, name, timed(name, method))
+
+
+def setup_metrics(metrics, dp, bot, db):
+    """Metrikalarni dispatcher, bot sessiyasi va bazaga ulash"""
+    middleware = HandlerMetricsMiddleware(metrics)
+    for observer in (dp.message, dp.callback_query, dp.inline_query):
+        observer.middleware(middleware)
+    bot.session.middleware(ApiMetricsMiddleware(metrics))
+    instrument(db, metrics)
+
+
+# ============= HTTP ENDPOINT =============
+def build_metrics_app(metrics, path='/metrics'):
+    """Prometheus uchun /metrics endpointli aiohttp ilovasi"""
+    async def handle(request):
+        return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get(path, handle)
+    return app
+
+
+async def start_metrics_server(metrics, host='127.0.0.1', port=9100):
+    """Metrikalar serverini fon rejimida ishga tushirish (runner qaytariladi, cleanup() bilan to'xtatiladi)"""
+    runner = web.AppRunner(build_metrics_app(metrics))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,169 @@
+import asyncio
+import contextvars
+import logging
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+
+from ratelimit import KeyedTokenBuckets, PriorityTokenBucket
+
+# Ustuvorlik tartibida: foydalanuvchiga javoblar > a'zolik tekshiruvlari > reklama
+INTERACTIVE, MEMBERSHIP, BULK = 0, 1, 2
+LANE_NAMES = ('interactive', 'membership', 'bulk')
+
+# Fon vazifalar (reklama) o'z task'ida shu qiymatni BULK ga o'rnatadi; undan
+# yaratilgan task'lar ham uni meros qilib oladi. O'rnatilmagan bo'lsa - INTERACTIVE
+current_lane = contextvars.ContextVar('outbound_lane', default=None)
+
+# Telegram limitlariga tushadigan metodlar. Qolganlari (getUpdates, getMe,
+# getFile, setWebhook, ...) navbatsiz o'tadi - aks holda polling ham kutib qoladi
+LIMITED_PREFIXES = ('Send', 'Copy', 'Forward', 'Edit', 'Answer', 'Delete')
+
+
+# ============= JARAYONLAR ARO UMUMIY LIMIT =============
+class RemoteGate:
+    """Boshqa jarayondagi (cluster router) PriorityTokenBucket'dan HTTP orqali token olish.
+
+    Shunda barcha worker'lar bitta umumiy limit va lane ustuvorligini baham ko'radi:
+    reklama yuborayotgan worker bo'sh tokenlarning hammasini oladi, javoblar esa
+    qaysi worker'da bo'lmasin undan oldin turadi. Router bilan aloqa uzilsa,
+    `fallback` (shu jarayonning ulushiga teng mahalliy bucket) ishlatiladi.
+    """
+
+    def __init__(self, url, fallback):
+        self.url = url.rstrip('/')
+        self.fallback = fallback
+        self.session = None
+        self.pending = [0] * len(fallback.waiters)
+        self.connected = True
+        self._tasks = set()
+
+    async def _post(self, path, **params):
+        if self.session is None or self.session.closed:
+            # Token kutish uzoq bo'lishi mumkin - faqat ulanish vaqti cheklanadi
+            self.session = ClientSession(timeout=ClientTimeout(total=None, sock_connect=1))
+        async with self.session.post(f'{self.url}{path}', params=params) as response:
+            response.raise_for_status()
+
+    async def acquire(self, lane=0):
+        self.pending[lane] += 1
+        try:
+            await self._post('/acquire', lane=lane)
+            self.connected = True
+        except (ClientError, OSError) as e:
+            if self.connected:
+                self.connected = False
+                logging.warning(f"Umumiy limit serveri javob bermadi ({e}) - mahalliy limit ishlatiladi")
+            await self.fallback.acquire(lane)
+        finally:
+            self.pending[lane] -= 1
+
+    def pause(self, seconds):
+        self.fallback.pause(seconds)
+        task = asyncio.get_running_loop().create_task(self._post('/pause', seconds=seconds))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def waiting(self):
+        """Shu jarayondan token kutayotganlar soni (lane bo'yicha)"""
+        return list(self.pending)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+def add_gate_routes(app, gate, prefix='/outbound'):
+    """RemoteGate uchun endpointlar: POST {prefix}/acquire?lane=N va {prefix}/pause?seconds=S"""
+    async def acquire(request):
+        await gate.acquire(int(request.query.get('lane', INTERACTIVE)))
+        return web.Response()
+
+    async def pause(request):
+        gate.pause(float(request.query['seconds']))
+        return web.Response()
+
+    app.router.add_post(f'{prefix}/acquire', acquire)
+    app.router.add_post(f'{prefix}/pause', pause)
+
+
+def make_gate(rate):
+    """Umumiy limit uchun lane'li bucket (zaxira kichik - so'rovlar bir tekis yuboriladi)"""
+    return PriorityTokenBucket(rate, capacity=max(1, rate / 10), lanes=len(LANE_NAMES))
+
+
+# ============= CHIQUVCHI SO'ROVLAR REJALASHTIRUVCHISI =============
+class OutboundScheduler(BaseRequestMiddleware):
+    """Bot sessiyasidagi barcha chiquvchi so'rovlar uchun umumiy limitlar.
+
+    - umumiy limit (soniyasiga `rate` ta so'rov) lane'lar o'rtasida ustuvorlik
+      bilan taqsimlanadi: reklama faqat interaktiv javoblar va a'zolik
+      tekshiruvlaridan ortgan tokenlarni oladi. Zaxira kichik (rate / 10), ya'ni
+      so'rovlar bir tekis yuboriladi - ketma-ket to'planib 429 olmaydi;
+    - har bir chatga xabarlar `per_chat_rate`/soniya (`per_chat_burst` tagacha
+      ketma-ket) - a'zolik tekshiruvlaridan tashqari, ularda chat_id kanalniki;
+    - TelegramRetryAfter kelsa barcha lane'lar shuncha to'xtaydi va so'rov
+      `max_retries` martagacha qayta yuboriladi (retry_after `max_retry_after`
+      dan katta bo'lsa, xato chaqiruvchiga qaytariladi).
+
+    gate_url berilsa (cluster rejimi), umumiy limit router jarayonidagi bucket'dan
+    olinadi - RemoteGate ga qarang; `rate` esa aloqa uzilganda ishlatiladigan
+    shu jarayon ulushi.
+    """
+
+    def __init__(self, rate=30, per_chat_rate=1.0, per_chat_burst=3, max_retries=3, max_retry_after=30,
+                 metrics=None, gate_url=None):
+        self.gate = make_gate(rate)
+        if gate_url:
+            self.gate = RemoteGate(gate_url, fallback=self.gate)
+        self.chats = KeyedTokenBuckets(per_chat_rate, per_chat_burst)
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.metrics = metrics
+        self.retries = 0
+
+    def lane(self, method):
+        """So'rov lane'i (None - limitsiz)"""
+        name = type(method).__name__
+        if name == 'GetChatMember':
+            return MEMBERSHIP
+        if not name.startswith(LIMITED_PREFIXES):
+            return None
+        lane = current_lane.get()
+        return INTERACTIVE if lane is None else lane
+
+    async def __call__(self, make_request, bot, method):
+        lane = self.lane(method)
+        if lane is None:
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, 'chat_id', None) if lane != MEMBERSHIP else None
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            if chat_id is not None:
+                await self.chats.acquire(chat_id)
+            await self.gate.acquire(lane)
+            if self.metrics:
+                self.metrics.observe('outbound', LANE_NAMES[lane], time.perf_counter() - started)
+
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.gate.pause(e.retry_after)
+                if attempt >= self.max_retries or e.retry_after > self.max_retry_after:
+                    raise
+                attempt += 1
+                self.retries += 1
+                logging.warning(f"{type(method).__name__}: {e.retry_after} soniya kutib qayta yuboriladi (RetryAfter)")
+
+    def stats(self):
+        """Lane'lardagi kutayotganlar va qayta yuborilgan so'rovlar soni"""
+        return {'waiting': dict(zip(LANE_NAMES, self.gate.waiting())), 'retries': self.retries}
+
+    async def close(self):
+        """Router bilan ulanishni yopish (mahalliy limitda hech narsa qilmaydi)"""
+        if isinstance(self.gate, RemoteGate):
+            await self.gate.close()
@@ -0,0 +1,184 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+
+# ============= TOKEN BUCKET =============
+class TokenBucket:
+    """Token bucket: soniyasiga `rate` ta token, eng ko'pi bilan `capacity` ta to'planadi"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        # RetryAfter kelganda butun bucket shu vaqtgacha to'xtatiladi
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """Token bo'lsa darhol oladi va True qaytaradi, aks holda kutmasdan False"""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return False
+        self._refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens=1):
+        """Token bo'shaguncha kutish"""
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return
+            await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Bucket'ni berilgan soniyaga to'xtatish (masalan, TelegramRetryAfter)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+# ============= TELEGRAM LIMITLARI =============
+class RateLimiter:
+    """Telegram limitlari: umumiy (soniyasiga `rate` ta xabar) va har bir chat uchun
+    xabarlar orasida kamida `per_chat_interval` soniya"""
+
+    def __init__(self, rate=25, per_chat_interval=1.0):
+        self.bucket = TokenBucket(rate)
+        self.per_chat_interval = per_chat_interval
+        # chat_id -> keyingi xabarni yuborish mumkin bo'lgan vaqt
+        self.chat_next = {}
+
+    async def acquire(self, chat_id):
+        """Chat va umumiy limit ruxsat berguncha kutish"""
+        now = time.monotonic()
+        next_time = self.chat_next.get(chat_id, 0.0)
+        self.chat_next[chat_id] = max(now, next_time) + self.per_chat_interval
+        if len(self.chat_next) > 100000:
+            self._evict(now)
+
+        if next_time > now:
+            await asyncio.sleep(next_time - now)
+        await self.bucket.acquire()
+
+    def pause(self, seconds):
+        """Barcha yuborishlarni to'xtatib turish"""
+        self.bucket.pause(seconds)
+
+    def _evict(self, now):
+        """Muddati o'tgan chat yozuvlarini tozalash"""
+        self.chat_next = {chat_id: t for chat_id, t in self.chat_next.items() if t > now}
+
+
+# ============= FOYDALANUVCHI LIMITLARI =============
+class KeyedTokenBuckets:
+    """Har bir kalit (masalan, foydalanuvchi) uchun alohida token bucket.
+
+    Bucket'lar oxirgi murojaat tartibida saqlanadi. capacity / rate soniya
+    ishlatilmagan bucket to'lib bo'lgan - yangisidan farqi yo'q - shuning uchun
+    u o'chiriladi. Har bir chaqiruv amortizatsiyalangan O(1), xotira esa faqat
+    shu oraliqda faol bo'lgan kalitlar soniga bog'liq.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.idle_ttl = self.capacity / rate
+        self.buckets = OrderedDict()
+
+    def _bucket(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.capacity)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket
+
+    def try_acquire(self, key, tokens=1):
+        """Kalit limiti ruxsat bersa token olib True, aks holda False qaytaradi"""
+        bucket = self._bucket(key)
+        allowed = bucket.try_acquire(tokens)
+        self._evict(bucket.updated)
+        return allowed
+
+    async def acquire(self, key, tokens=1):
+        """Kalit limiti ruxsat berguncha kutish"""
+        bucket = self._bucket(key)
+        await bucket.acquire(tokens)
+        self._evict(bucket.updated)
+
+    def _evict(self, now):
+        """Uzoq ishlatilmagan (to'lgan) bucket'larni eng eskisidan boshlab o'chirish"""
+        buckets = self.buckets
+        while buckets:
+            oldest = next(iter(buckets.values()))
+            if now - oldest.updated < self.idle_ttl:
+                break
+            buckets.popitem(last=False)
+
+    def __len__(self):
+        return len(self.buckets)
+
+
+# ============= USTUVORLIKLI LIMIT =============
+class PriorityTokenBucket:
+    """Navbatli token bucket: token yetmasa so'rovlar lane bo'yicha kutadi va
+    bo'shagan token har doim eng ustuvor (eng kichik raqamli) lane'dagi eng
+    eski so'rovga beriladi. Kutayotganlar bo'lmasa token darhol olinadi.
+    """
+
+    def __init__(self, rate, capacity=None, lanes=3):
+        self.bucket = TokenBucket(rate, capacity)
+        self.waiters = [deque() for _ in range(lanes)]
+        self.pump = None
+
+    async def acquire(self, lane=0):
+        """Token olguncha kutish (lane - ustuvorlik, 0 - eng yuqori)"""
+        if self.pump is None and self.bucket.try_acquire():
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[lane].append(future)
+        if self.pump is None:
+            self.pump = asyncio.create_task(self._pump())
+        await future
+
+    def _next_waiter(self):
+        """Eng ustuvor kutayotgan so'rov (bekor qilinganlar tashlab yuboriladi)"""
+        for waiters in self.waiters:
+            while waiters and waiters[0].done():
+                waiters.popleft()
+            if waiters:
+                return waiters
+        return None
+
+    async def _pump(self):
+        """Tokenlarni kutayotganlarga ustuvorlik tartibida tarqatish"""
+        try:
+            while self._next_waiter() is not None:
+                await self.bucket.acquire()
+                # Kutish davomida ustuvorroq so'rov kelgan bo'lishi mumkin - qayta tanlaymiz
+                waiters = self._next_waiter()
+                if waiters is None:
+                    self.bucket.tokens = min(self.bucket.capacity, self.bucket.tokens + 1)
+                    return
+                waiters.popleft().set_result(None)
+        finally:
+            self.pump = None
+
+    def pause(self, seconds):
+        """Barcha lane'larni berilgan soniyaga to'xtatish"""
+        self.bucket.pause(seconds)
+
+    def waiting(self):
+        """Har bir lane'da kutayotganlar soni"""
+        return [sum(not future.done() for future in waiters) for waiters in self.waiters]
@@ -0,0 +1,62 @@
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message
+
+from cache import TTLCache
+from ratelimit import KeyedTokenBuckets
+
+DEFAULT_CLASS = 'default'
+
+
+def parse_limits(spec):
+    """THROTTLE_LIMITS qiymatini o'qish: movie=1/5,start=0.5/3 -> {'movie': (1.0, 5), 'start': (0.5, 3)}
+
+    Har bir sinf uchun: soniyasiga ruxsat etilgan so'rovlar / ketma-ket zaxira (burst).
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = item.partition('=')
+        rate, _, burst = value.partition('/')
+        rate = float(rate)
+        limits[name.strip()] = (rate, int(burst or max(1, rate)))
+    return limits
+
+
+# ============= FLOOD HIMOYASI =============
+class ThrottlingMiddleware(BaseMiddleware):
+    """Har bir foydalanuvchi uchun token bucket bilan so'rovlarni cheklash.
+
+    Handler sinfi `flags={'throttle': 'movie'}` bilan belgilanadi (belgisizlar -
+    'default'). limits da yo'q sinf cheklanmaydi. Limitdan oshgan update handlerga
+    yetib bormaydi: na bazaga, na Telegram API'ga so'rov ketadi. reply_text
+    berilsa, foydalanuvchiga reply_interval soniyada ko'pi bilan bir marta
+    ogohlantirish yuboriladi, aks holda update jimgina tashlab yuboriladi.
+    """
+
+    def __init__(self, limits, reply_text=None, reply_interval=10):
+        self.limits = {name: KeyedTokenBuckets(rate, burst) for name, (rate, burst) in limits.items()}
+        self.reply_text = reply_text
+        self.warned = TTLCache(maxsize=100000, ttl=reply_interval)
+        self.dropped = 0
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        buckets = self.limits.get(get_flag(data, 'throttle', default=DEFAULT_CLASS))
+        if user is None or buckets is None or buckets.try_acquire(user.id):
+            return await handler(event, data)
+
+        self.dropped += 1
+        if self.reply_text and self.warned.get(user.id) is None:
+            self.warned.set(user.id, True)
+            if isinstance(event, (Message, CallbackQuery)):
+                await event.answer(self.reply_text)
+        return None
+
+    def stats(self):
+        """Tashlab yuborilgan updatelar va xotiradagi bucket'lar soni"""
+        return {'dropped': self.dropped, 'buckets': sum(len(buckets) for buckets in self.limits.values())}
+
+    def setup(self, dp):
+        """Xabar, callback va inline so'rovlarga ulash (filtrlardan keyin - handler sinfi ma'lum)"""
+        for observer in (dp.message, dp.callback_query, dp.inline_query):
+            observer.middleware(self)
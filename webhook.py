@@ -0,0 +1,43 @@
+import asyncio
+import logging
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+
+# ============= WEBHOOK SERVER =============
+def build_webhook_app(dp, bot, path='/webhook', secret_token=None):
+    """Webhook uchun aiohttp ilovasini yaratish.
+
+    Telegram'ga darhol 200 javob qaytariladi, update esa fon task'da qayta
+    ishlanadi (handle_in_background). Secret token mos kelmasa - 401.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token or None,
+        handle_in_background=True
+    ).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp, bot, host='0.0.0.0', port=8080, path='/webhook', url=None, secret_token=None):
+    """Webhook serverini ishga tushirish va (url berilsa) Telegram'da ro'yxatdan o'tkazish"""
+    app = build_webhook_app(dp, bot, path, secret_token)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logging.info(f"Webhook server ishga tushdi: http://{host}:{port}{path}")
+
+    if url:
+        await bot.set_webhook(f"{url.rstrip('/')}{path}", secret_token=secret_token or None)
+        logging.info(f"Webhook o'rnatildi: {url.rstrip('/')}{path}")
+
+    try:
+        # To'xtatilguncha kutamiz
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()